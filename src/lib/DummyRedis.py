@@ -29,16 +29,37 @@ class client():
     def get(self, key):
         return None
 
+    def mget(self, keys):
+        return [None] * len(keys)
+
     def publish(self, key, val):
         return 'OK'
 
     def pubsub(self):
         return pubsub()
 
+    def pipeline(self, transaction=False):
+        return pipeline()
+
     def exists(self, key):
         return False
 
 
+###################################################################################################
+class pipeline():
+    def __init__(self):
+        pass
+
+    def set(self, key, val):
+        pass
+
+    def publish(self, key, val):
+        pass
+
+    def execute(self):
+        return []
+
+
 ###################################################################################################
 class pubsub():
     def __init__(self):
@@ -50,3 +71,9 @@ class pubsub():
     def listen(self):
         time.sleep(1)
         return []
+
+    def get_message(self, timeout=0.0):
+        if timeout is None:
+            timeout = 1
+        time.sleep(timeout)
+        return None
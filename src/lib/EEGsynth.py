@@ -37,6 +37,8 @@ import argparse
 import time
 import threading
 import math
+import fnmatch
+import re
 import numpy as np
 from scipy.signal import firwin, butter, bessel, lfilter, lfiltic, iirnotch
 import logging
@@ -70,6 +72,8 @@ class patch():
 
     The following method sets and publishes the value to Redis
       patch.setvalue(key, value)
+    and this one sets and publishes multiple values all at once
+      patch.setvalues({key1: value1, key2: value2})
 
     The following method gets the value (as a string) from the command-line
     arguments or from the ini file
@@ -81,6 +85,11 @@ class patch():
       patch.getint(section, item, multiple=False, default=None)
       patch.getstring(section, item, multiple=False, default=None)
 
+    The following methods get the values of a list of items, the values from
+    Redis are retrieved all at once
+      patch.getfloat_many(section, items, default=None)
+      patch.getint_many(section, items, default=None)
+
     The formatting of options on the command-line should be like this
       --section-item value
 
@@ -96,6 +105,19 @@ class patch():
       item=key1,key2    get the value of key1 and key2 from Redis
       item=key1,5       get the value of key1 from Redis
       item=0,key2       get the value of key2 from Redis
+
+    The values from Redis can be cached locally by specifying the staleness bound
+    in seconds, e.g. in the ini file
+      [general]
+      cache=1
+    Each value is then read from Redis once and served from the local copy until it
+    is published again (which setvalue does) or until it is older than the bound.
+
+    Functions can be called for the messages that are published on a channel with
+    patch.subscribe(channel, callback), or on the channels that match a pattern with
+    patch.psubscribe(pattern, callback). All subscriptions share a single connection
+    and thread, which are closed with patch.stop(). This also closes the connection
+    and thread of the local cache.
     """
 
     def __init__(self, name=None, path=None, preservecase=False):
@@ -113,6 +135,7 @@ class patch():
         parser.add_argument("--general-debug", default=None, help="general debug")
         parser.add_argument("--general-delay", default=None, help="general delay")
         parser.add_argument("--general-logging", default=None, help="general logging")
+        parser.add_argument("--general-cache", default=None, help="general cache")
         args = parser.parse_args()
 
         config = configparser.ConfigParser(inline_comment_prefixes=('#', ';'))
@@ -175,8 +198,8 @@ class patch():
                 raise RuntimeError("cannot connect to ZeroMQ server")
 
         elif broker=='fake':
-            # the fake client stores all values in a dictionary
-            r = DummyRedis.client()
+            # the fake client stores all values in memory and shares them with other modules in the same process
+            r = FakeRedis.client()
 
         elif broker=='dummy':
             # the dummy client has all functions but does not do anything
@@ -189,15 +212,89 @@ class patch():
         self.args = args
         self.config = config
         self.redis = r              # this can be redis, zeromq, fake or dummy
+        self.resolvers = {}         # this contains the parsed items from the ini file
+
+        # the control values can optionally be cached, this specifies how long they remain valid
+        staleness = self.getfloat('general', 'cache', default=0)
+        if staleness > 0:
+            self.cache = cache(r, staleness)
+        else:
+            self.cache = None
+
+        # the dispatcher for the subscriptions is only started when needed
+        self.dispatcher = None
 
     ####################################################################
     def pubsub(self):
         return self.redis.pubsub()
 
+    ####################################################################
+    def subscribe(self, channel, callback):
+        # call the function with each message that is published on the channel
+        if self.dispatcher is None:
+            self.dispatcher = dispatcher(self.redis)
+        self.dispatcher.subscribe(channel, callback)
+
+    ####################################################################
+    def psubscribe(self, pattern, callback):
+        # call the function with each message that is published on a channel that matches the pattern
+        if self.dispatcher is None:
+            self.dispatcher = dispatcher(self.redis)
+        self.dispatcher.psubscribe(pattern, callback)
+
+    ####################################################################
+    def unsubscribe(self, channel, callback=None):
+        if self.dispatcher is not None:
+            self.dispatcher.unsubscribe(channel, callback)
+
+    ####################################################################
+    def punsubscribe(self, pattern, callback=None):
+        if self.dispatcher is not None:
+            self.dispatcher.punsubscribe(pattern, callback)
+
+    ####################################################################
+    def stop(self):
+        # stop receiving the messages for the subscriptions and for the local cache
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+            self.dispatcher = None
+        if self.cache is not None:
+            self.cache.stop()
+            self.cache = None
+
     ####################################################################
     def publish(self, channel, value):
         return self.redis.publish(channel, value)
 
+    ####################################################################
+    def getvalue(self, key):
+        # get the value of a control channel, either from Redis or from the local cache
+        if self.cache is None:
+            return self.redis.get(key)
+        else:
+            return self.cache.get(key)
+
+    ####################################################################
+    def getvalues(self, keys):
+        # get the values of multiple control channels with a single request
+        if len(keys)==0:
+            return []
+        elif len(keys)==1:
+            return [self.getvalue(keys[0])]
+        elif self.cache is None:
+            return self.redis.mget(keys)
+        else:
+            return self.cache.mget(keys)
+
+    ####################################################################
+    def resolver(self, section, item, multiple, convert):
+        # return the parsed items from the ini file, these are only parsed again when the ini file changes
+        string = self.config.get(section, item)
+        key = (section, item, multiple, convert)
+        if key not in self.resolvers or self.resolvers[key].string != string:
+            self.resolvers[key] = resolver(string, multiple, convert)
+        return self.resolvers[key]
+
     ####################################################################
     def get(self, section, item, default=None):
         if section + "_" + item in self.args:
@@ -213,45 +310,26 @@ class patch():
             # get it from the command-line arguments
             return float(self.args[section + "_" + item])
         elif self.config.has_option(section, item) and len(self.config.get(section, item))>0:
-            # get all items from the ini file, there might be one or multiple
-            items = self.config.get(section, item)
-
-            if multiple:
-                # convert the items to a list
-                if items.find(",") > -1:
-                    separator = ","
-                elif items.find("-") > -1:
-                    separator = "-"
-                elif items.find("\t") > -1:
-                    separator = "\t"
-                else:
-                    separator = " "
-                items = squeeze(' ', items)        # remove excess whitespace
-                items = squeeze(separator, items)  # remove double separators
-                items = items.split(separator)     # split on the separator
-            else:
-                # make a list with a single item
-                items = [items]
+            # the items are parsed only once into constant values and keys
+            items = self.resolver(section, item, multiple, float)
 
             # set the default
             if multiple and isinstance(default, list):
                 val = [float(x) for x in default]
             elif default != None:
-                val = [float(default)] * len(items)
+                val = [float(default)] * items.length
             else:
-                val = [default] * len(items)
+                val = [default] * items.length
 
-            # convert the strings into floating point values
-            for i,item in enumerate(items):
+            # use the values that were specified as such
+            for i,value in items.constants:
+                val[i] = value
+            # get the remaining values from Redis, all at once
+            for i,value in zip(items.index, self.getvalues(items.keys)):
                 try:
-                    # if it resembles a value, use that
-                    val[i] = float(item)
-                except ValueError:
-                    # if it is a string, get the value from Redis
-                    try:
-                        val[i] = float(self.redis.get(item))
-                    except TypeError:
-                        pass
+                    val[i] = float(value)
+                except TypeError:
+                    pass
         else:
             # the configuration file does not contain the item
             if multiple and isinstance(default, list):
@@ -279,45 +357,26 @@ class patch():
         if section + "_" + item in self.args:
             return int(self.args[section + "_" + item])
         elif self.config.has_option(section, item) and len(self.config.get(section, item))>0:
-            # get all items from the ini file, there might be one or multiple
-            items = self.config.get(section, item)
-
-            if multiple:
-                # convert the items to a list
-                if items.find(",") > -1:
-                    separator = ","
-                elif items.find("-") > -1:
-                    separator = "-"
-                elif items.find("\t") > -1:
-                    separator = "\t"
-                else:
-                    separator = " "
-                items = squeeze(' ', items)        # remove excess whitespace
-                items = squeeze(separator, items)  # remove double separators
-                items = items.split(separator)     # split on the separator
-            else:
-                # make a list with a single item
-                items = [items]
+            # the items are parsed only once into constant values and keys
+            items = self.resolver(section, item, multiple, int)
 
             # set the default
             if multiple and isinstance(default, list):
                 val = [int(x) for x in default]
             elif default != None:
-                val = [int(default)] * len(items)
+                val = [int(default)] * items.length
             else:
-                val = [default] * len(items)
+                val = [default] * items.length
 
-            # convert the strings into integer values
-            for i,item in enumerate(items):
+            # use the values that were specified as such
+            for i,value in items.constants:
+                val[i] = value
+            # get the remaining values from Redis, all at once
+            for i,value in zip(items.index, self.getvalues(items.keys)):
                 try:
-                    # if it resembles a value, use that
-                    val[i] = int(item)
-                except ValueError:
-                    # if it is a string, get the value from Redis
-                    try:
-                        val[i] = int(round(float(self.redis.get(item))))
-                    except TypeError:
-                        pass
+                    val[i] = int(round(float(value)))
+                except TypeError:
+                    pass
         else:
             # the configuration file does not contain the item
             if multiple and isinstance(default, list):
@@ -340,6 +399,60 @@ class patch():
         else:
             return val
 
+    ####################################################################
+    def getfloat_many(self, section, items, default=None):
+        # this returns a list with the same value as getfloat for each item
+        if default != None:
+            default = float(default)
+        val = [default] * len(items)
+        keys = []
+        index = []
+        for i,item in enumerate(items):
+            if section + "_" + item in self.args:
+                val[i] = float(self.args[section + "_" + item])
+            elif self.config.has_option(section, item) and len(self.config.get(section, item))>0:
+                resolver = self.resolver(section, item, False, float)
+                if len(resolver.constants):
+                    # it resembles a value, use that
+                    val[i] = resolver.constants[0][1]
+                else:
+                    # it is a string, get the value from Redis
+                    keys.append(resolver.keys[0])
+                    index.append(i)
+        for i,value in zip(index, self.getvalues(keys)):
+            try:
+                val[i] = float(value)
+            except TypeError:
+                pass
+        return val
+
+    ####################################################################
+    def getint_many(self, section, items, default=None):
+        # this returns a list with the same value as getint for each item
+        if default != None:
+            default = int(default)
+        val = [default] * len(items)
+        keys = []
+        index = []
+        for i,item in enumerate(items):
+            if section + "_" + item in self.args:
+                val[i] = int(self.args[section + "_" + item])
+            elif self.config.has_option(section, item) and len(self.config.get(section, item))>0:
+                resolver = self.resolver(section, item, False, int)
+                if len(resolver.constants):
+                    # it resembles a value, use that
+                    val[i] = resolver.constants[0][1]
+                else:
+                    # it is a string, get the value from Redis
+                    keys.append(resolver.keys[0])
+                    index.append(i)
+        for i,value in zip(index, self.getvalues(keys)):
+            try:
+                val[i] = int(round(float(value)))
+            except TypeError:
+                pass
+        return val
+
     ####################################################################
     def getstring(self, section, item, multiple=False, default=None):
         if section + "_" + item in self.args:
@@ -348,7 +461,12 @@ class patch():
             # get all items from the ini file, there might be one or multiple
             try:
                 val = self.config.get(section, item)
-                if self.redis.exists(val):
+                if self.cache is not None:
+                    # the local cache returns None for keys that do not exist
+                    cached = self.cache.get(val)
+                    if cached is not None:
+                        val = cached
+                elif self.redis.exists(val):
                     # the ini file points to a Redis key, which contains the actual value
                     val = self.redis.get(val)
             except:
@@ -391,19 +509,345 @@ class patch():
 
     ####################################################################
     def setvalue(self, item, val, duration=0):
-        # map numpy types onto plain Python types, see https://github.com/eegsynth/eegsynth/issues/429
-        if isinstance(val, (np.float32, np.float64)):
-            val = float(val)
-        elif isinstance(val, (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64)):
-            val = int(val)
-        elif isinstance(val, np.bool):
-            val = bool(val)
+        val = plainvalue(val)
         self.redis.set(item, val)      # set it as control channel
+        if self.cache is not None:
+            self.cache.invalidate(item)
         self.redis.publish(item, val)  # send it as trigger
         if duration > 0:
             # switch off after a certain amount of time
             threading.Timer(duration, self.setvalue, args=[item, 0.]).start()
 
+    ####################################################################
+    def setvalues(self, mapping, publish=True):
+        # set and optionally publish multiple values, these are sent to Redis all at once
+        pipe = self.redis.pipeline(transaction=False)
+        for item, val in mapping.items():
+            val = plainvalue(val)
+            pipe.set(item, val)        # set it as control channel
+            if publish:
+                pipe.publish(item, val)  # send it as trigger
+        pipe.execute()
+        if self.cache is not None:
+            for item in mapping.keys():
+                self.cache.invalidate(item)
+
+###################################################################################################
+class resolver():
+    """Class that holds the items of an option in the ini file after parsing them. Each item
+    is either a constant value, or the name of a key whose value is to be retrieved from Redis.
+    The convert function, e.g. float or int, determines what resembles a constant value.
+    """
+
+    def __init__(self, string, multiple, convert):
+        self.string = string
+        items = string
+
+        if multiple:
+            # convert the items to a list
+            if items.find(",") > -1:
+                separator = ","
+            elif items.find("-") > -1:
+                separator = "-"
+            elif items.find("\t") > -1:
+                separator = "\t"
+            else:
+                separator = " "
+            items = squeeze(' ', items)        # remove excess whitespace
+            items = squeeze(separator, items)  # remove double separators
+            items = items.split(separator)     # split on the separator
+        else:
+            # make a list with a single item
+            items = [items]
+
+        self.length = len(items)
+        self.constants = []         # this contains the index and the value of the constant items
+        self.keys = []              # this contains the keys of the other items
+        self.index = []             # this contains the index of the other items
+        for i,item in enumerate(items):
+            try:
+                # if it resembles a value, use that
+                self.constants.append((i, convert(item)))
+            except ValueError:
+                # if it is a string, the value is to be retrieved from Redis
+                self.keys.append(item)
+                self.index.append(i)
+
+###################################################################################################
+class cache():
+    """Class to keep a local copy of the control values that are read from Redis.
+
+    A value is read from Redis the first time it is needed and subsequently served from
+    the local copy. The cache only subscribes to the keys that it has been asked for, and
+    the copy is invalidated when a message is published with the key as channel, which
+    is what patch.setvalue does. With a real Redis server, keyspace notifications are
+    enabled to also catch changes that are not published. Values that are older than the
+    staleness bound (in seconds) are read again.
+    """
+
+    def __init__(self, redis, staleness=1.0):
+        self.redis = redis
+        self.staleness = staleness
+        self.store = {}             # this contains the value and the time at which it was read
+        self.invalidated = 0        # this is incremented whenever a value is invalidated
+        self.subscribed = set()     # these keys are subscribed and can be kept
+        self.requested = set()      # these keys are subscribed or about to be subscribed
+        self.pending = []           # these keys are to be subscribed by the thread
+        self.lock = threading.Lock()
+        self.running = True
+        self.timeout = 0.1          # this determines how fast the thread responds to stop
+        self.keyspace = None
+        if hasattr(redis, 'config_set'):
+            # a real Redis server can notify about all changes to a key, also when it is not published
+            try:
+                events = redis.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+                if not 'K' in events or not ('$' in events or 'A' in events):
+                    redis.config_set('notify-keyspace-events', events + 'K$')
+                db = redis.connection_pool.connection_kwargs.get('db', 0)
+                self.keyspace = '__keyspace@%d__:' % db
+            except Exception as e:
+                print('Cannot enable keyspace notifications: %s' % e)
+        # the subscriptions are only changed by the thread, which owns the connection
+        self.pubsub = redis.pubsub()
+        self.thread = threading.Thread(target=self.listen, daemon=True)
+        self.thread.start()
+
+    def request(self, key):
+        # this should be called with the lock held, it returns whether the value can be kept
+        if key in self.subscribed:
+            return True
+        if not key in self.requested:
+            self.requested.add(key)
+            self.pending.append(key)
+        return False
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            if key in self.store and now - self.store[key][1] < self.staleness:
+                return self.store[key][0]
+            keep = self.request(key)
+            invalidated = self.invalidated
+        val = self.redis.get(key)
+        with self.lock:
+            # do not keep the value if changes are not notified yet, or if it might have changed while reading it
+            if keep and invalidated == self.invalidated:
+                self.store[key] = (val, now)
+        return val
+
+    def mget(self, keys):
+        now = time.time()
+        val = [None] * len(keys)
+        missing = []
+        keep = []
+        with self.lock:
+            for i,key in enumerate(keys):
+                if key in self.store and now - self.store[key][1] < self.staleness:
+                    val[i] = self.store[key][0]
+                else:
+                    missing.append(i)
+                    keep.append(self.request(key))
+            invalidated = self.invalidated
+        if len(missing)==0:
+            return val
+        values = self.redis.mget([keys[i] for i in missing])
+        with self.lock:
+            for i,value,k in zip(missing, values, keep):
+                val[i] = value
+                # do not keep the values if changes are not notified yet, or if they might have changed while reading them
+                if k and invalidated == self.invalidated:
+                    self.store[keys[i]] = (value, now)
+        return val
+
+    def invalidate(self, key):
+        with self.lock:
+            self.store.pop(key, None)
+            self.invalidated += 1
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        with self.lock:
+            self.store = {}
+            self.subscribed = set()
+            self.requested = set()
+            self.pending = []
+
+    def update(self):
+        # subscribe to the keys that have been requested since the previous call
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+        for key in pending:
+            self.pubsub.subscribe(key)
+            if self.keyspace is not None:
+                self.pubsub.subscribe(self.keyspace + key)
+        with self.lock:
+            self.subscribed.update(pending)
+
+    def listen(self):
+        # this runs in a separate thread and invalidates the values that are published
+        while self.running:
+            self.update()
+            if len(self.subscribed)==0:
+                # some clients cannot receive messages before the first subscription
+                time.sleep(self.timeout)
+                continue
+            item = self.pubsub.get_message(timeout=self.timeout)
+            if item is not None and item['type'] == 'message':
+                key = item['channel']
+                if self.keyspace is not None and key.startswith(self.keyspace):
+                    # this is a keyspace notification, the channel contains the key
+                    key = key[len(self.keyspace):]
+                self.invalidate(key)
+        closepubsub(self.pubsub)
+
+###################################################################################################
+class dispatcher():
+    """Class that receives the published messages for all subscriptions of a module over a
+    single connection and in a single thread. Each message is passed to the functions that
+    are registered for its channel, or for a pattern that matches the channel, like this
+      def callback(item):
+          print(item['channel'], item['data'])
+      patch.subscribe('button.1', callback)
+      patch.psubscribe('button.*', callback)
+      ...
+      patch.stop()
+    The functions are called one after the other in the thread of the dispatcher, they
+    should therefore return quickly.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.channels = {}          # this maps each channel to a list of functions
+        self.patterns = {}          # this maps each pattern to a list of functions
+        self.pending = []           # these are the changes that still need to be passed to the broker
+        self.requested = 0          # this is incremented for each change
+        self.applied = 0            # this is the number of changes that has been passed to the broker
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.running = True
+        self.timeout = 0.1          # this determines how fast the thread responds to stop
+        self.pubsub = redis.pubsub()
+        # without pattern support in the broker, the messages are matched locally
+        self.native = hasattr(self.pubsub, 'psubscribe')
+        # a message on this channel wakes up the thread to pass the changes on to the broker
+        self.wakeup = 'EEGSYNTH_DISPATCHER_%d_%d' % (os.getpid(), id(self))
+        self.pubsub.subscribe(self.wakeup)
+        self.thread = threading.Thread(target=self.listen, daemon=True)
+        self.thread.start()
+
+    def subscribe(self, channel, callback):
+        with self.lock:
+            if not channel in self.channels:
+                self.channels[channel] = []
+                self.pending.append(('subscribe', channel))
+                self.requested += 1
+            self.channels[channel].append(callback)
+        self.wait()
+
+    def psubscribe(self, pattern, callback):
+        with self.lock:
+            if not pattern in self.patterns:
+                self.patterns[pattern] = []
+                self.pending.append(('psubscribe', pattern))
+                self.requested += 1
+            self.patterns[pattern].append(callback)
+        self.wait()
+
+    def unsubscribe(self, channel, callback=None):
+        with self.lock:
+            if channel in self.channels:
+                if callback in self.channels[channel]:
+                    self.channels[channel].remove(callback)
+                if callback is None or len(self.channels[channel])==0:
+                    del self.channels[channel]
+                    self.pending.append(('unsubscribe', channel))
+                    self.requested += 1
+        self.wait()
+
+    def punsubscribe(self, pattern, callback=None):
+        with self.lock:
+            if pattern in self.patterns:
+                if callback in self.patterns[pattern]:
+                    self.patterns[pattern].remove(callback)
+                if callback is None or len(self.patterns[pattern])==0:
+                    del self.patterns[pattern]
+                    self.pending.append(('punsubscribe', pattern))
+                    self.requested += 1
+        self.wait()
+
+    def wait(self):
+        # wake up the thread and wait until it has passed the changes on to the broker, so that
+        # no messages are missed after subscribing
+        if threading.current_thread() is self.thread:
+            # the changes are made after the callback returns
+            return
+        with self.lock:
+            requested = self.requested
+            if self.applied >= requested:
+                return
+        self.redis.publish(self.wakeup, 1)
+        with self.changed:
+            self.changed.wait_for(lambda: self.applied >= requested or not self.running, 1.0)
+
+    def stop(self):
+        self.running = False
+        if not threading.current_thread() is self.thread:
+            self.thread.join()
+
+    def update(self):
+        # this runs in the thread, since the connection to the broker should not be shared
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+            requested = self.requested
+        for (command, key) in pending:
+            if not self.native and command in ['psubscribe', 'punsubscribe']:
+                # subscribe to the part of the pattern up to the first wildcard
+                command = command[1:]
+                key = re.split('[*?[]', key)[0]
+            if hasattr(self.pubsub, command):
+                getattr(self.pubsub, command)(key)
+        with self.lock:
+            self.applied = requested
+            self.changed.notify_all()
+
+    def dispatch(self, item):
+        with self.lock:
+            if item['type'] == 'message':
+                callbacks = list(self.channels.get(item['channel'], []))
+                if not self.native:
+                    for pattern in self.patterns:
+                        if fnmatch.fnmatchcase(item['channel'], pattern):
+                            callbacks += self.patterns[pattern]
+            elif item['type'] == 'pmessage':
+                callbacks = list(self.patterns.get(item['pattern'], []))
+            else:
+                callbacks = []
+        for callback in callbacks:
+            try:
+                callback(item)
+            except Exception as e:
+                print('Error in callback for %s: %s' % (item['channel'], e))
+
+    def listen(self):
+        # this runs in a separate thread and passes the messages on to the functions
+        while self.running:
+            self.update()
+            item = self.pubsub.get_message(timeout=self.timeout)
+            if item is not None and item['channel'] != self.wakeup:
+                self.dispatch(item)
+        # the connection is closed in the thread, since it should not be shared
+        closepubsub(self.pubsub)
+
+###################################################################################################
+def closepubsub(pubsub):
+    # stop receiving messages, otherwise the broker keeps queueing them for this subscriber
+    for command in ['unsubscribe', 'punsubscribe', 'close']:
+        if hasattr(pubsub, command):
+            getattr(pubsub, command)()
+
 ###################################################################################################
 class monitor():
     """Class to monitor control values and print them to screen when they have changed. It also
@@ -951,6 +1395,17 @@ def notch_filter(dat, f0, fs, Q=30, dir='onepass'):
         y = (y1 + y2)/2
     return y
 
+###################################################################################################
+def plainvalue(val):
+    # map numpy types onto plain Python types, see https://github.com/eegsynth/eegsynth/issues/429
+    if isinstance(val, (np.float32, np.float64)):
+        val = float(val)
+    elif isinstance(val, (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64)):
+        val = int(val)
+    elif isinstance(val, np.bool):
+        val = bool(val)
+    return val
+
 ###################################################################################################
 def formatkeyval(key, val):
     if sys.version_info < (3,0):
@@ -0,0 +1,169 @@
+import sys
+import itertools
+
+# This compares patch.getfloat and patch.getint, which parse each item from the ini file
+# only once into a resolver, with the original implementation that parsed the item on
+# every call and that retrieved each key from Redis separately.
+
+# the fake broker keeps the values in memory, no server is needed
+sys.argv = [sys.argv[0], '--general-broker', 'fake']
+
+import EEGsynth
+
+patch = EEGsynth.patch()
+r = patch.redis
+r.flushall()
+r.set('key1', 3.7)
+r.set('key2', 12)
+r.set('key3', -0.5)
+r.set('text', 'abc')
+# the key 'missing' is deliberately not set
+
+patch.config.read_string('''
+[single]
+float=2.5
+int=7
+negative=-3
+key=key1
+missing=missing
+text=text
+empty=
+
+[multiple]
+range=1-20
+list=1,2,3
+mixed=1,2,3,5-9
+keys=key1,key2
+keyconst=key1,5
+constkey=0,key2
+spaces=1 2 3
+tabs=1\t2\t3
+doubled=1,,2
+keymissing=key1,missing
+rangekey=key3-key2
+
+[scale]
+a=2
+b=key1
+c=key3,0.5
+
+[offset]
+a=-1
+b=key2
+c=missing,key3
+''')
+
+
+def reference(section, item, multiple, default, convert, fromredis):
+    # this is the original implementation, which parses the item on each call
+    if patch.config.has_option(section, item) and len(patch.config.get(section, item))>0:
+        items = patch.config.get(section, item)
+
+        if multiple:
+            if items.find(",") > -1:
+                separator = ","
+            elif items.find("-") > -1:
+                separator = "-"
+            elif items.find("\t") > -1:
+                separator = "\t"
+            else:
+                separator = " "
+            items = EEGsynth.squeeze(' ', items)
+            items = EEGsynth.squeeze(separator, items)
+            items = items.split(separator)
+        else:
+            items = [items]
+
+        if multiple and isinstance(default, list):
+            val = [convert(x) for x in default]
+        elif default != None:
+            val = [convert(default)] * len(items)
+        else:
+            val = [default] * len(items)
+
+        for i,item in enumerate(items):
+            try:
+                val[i] = convert(item)
+            except ValueError:
+                try:
+                    val[i] = fromredis(r.get(item))
+                except TypeError:
+                    pass
+    else:
+        if multiple and isinstance(default, list):
+            val = [convert(x) for x in default]
+        elif multiple and default == None:
+            val = []
+        elif multiple and default != None:
+            val = [convert(default)]
+        elif not multiple and default == None:
+            val = default
+        elif not multiple and default != None:
+            val = convert(default)
+
+    if multiple and not isinstance(val, list):
+        return [val]
+    elif not multiple and isinstance(val, list):
+        return val[0]
+    else:
+        return val
+
+
+def outcome(function, *args, **kwargs):
+    # return the value, or the type of the exception
+    try:
+        return ('value', function(*args, **kwargs))
+    except Exception as e:
+        return ('error', type(e).__name__)
+
+
+getters = [
+    ('getfloat', patch.getfloat, float, lambda x: float(x)),
+    ('getint', patch.getint, int, lambda x: int(round(float(x)))),
+]
+defaults = [None, 0, 1.5, [4, 5, 6]]
+
+ncompared = 0
+nfailed = 0
+for (name, getter, convert, fromredis) in getters:
+    for section in patch.config.sections() + ['nosection']:
+        items = patch.config.options(section) if patch.config.has_section(section) else []
+        for (item, multiple, default) in itertools.product(items + ['noitem'], [False, True], defaults):
+            # call it twice, the second call uses the resolver that was parsed in the first call
+            for repetition in range(2):
+                expected = outcome(reference, section, item, multiple, default, convert, fromredis)
+                actual = outcome(getter, section, item, multiple=multiple, default=default)
+                ncompared += 1
+                if actual != expected:
+                    nfailed += 1
+                    print('%s(%s, %s, multiple=%s, default=%s) returned %s, expected %s' % (name, section, item, multiple, default, actual, expected))
+
+# the resolver is parsed again when the ini file changes
+patch.config.set('multiple', 'list', '4,key1')
+r.set('key1', 9)
+for (name, getter, convert, fromredis) in getters:
+    expected = outcome(reference, 'multiple', 'list', True, None, convert, fromredis)
+    actual = outcome(getter, 'multiple', 'list', multiple=True)
+    ncompared += 1
+    if actual != expected:
+        nfailed += 1
+        print('%s(multiple, list) after changing the ini file returned %s, expected %s' % (name, actual, expected))
+
+# the values of multiple items are also retrieved at once
+for (name, many, convert, fromredis) in [('getfloat_many', patch.getfloat_many, float, lambda x: float(x)), ('getint_many', patch.getint_many, int, lambda x: int(round(float(x))))]:
+    for section in ['single', 'scale', 'offset']:
+        items = patch.config.options(section) + ['noitem']
+        for default in [None, 1]:
+            expected = [outcome(reference, section, item, False, default, convert, fromredis) for item in items]
+            actual = outcome(many, section, items, default=default)
+            ncompared += 1
+            if actual[0] == 'error':
+                # a single failing item fails the whole call
+                ok = ('error', actual[1]) in expected
+            else:
+                ok = [('value', val) for val in actual[1]] == expected
+            if not ok:
+                nfailed += 1
+                print('%s(%s, %s, default=%s) returned %s, expected %s' % (name, section, items, default, actual, expected))
+
+print('compared %d results, %d differ' % (ncompared, nfailed))
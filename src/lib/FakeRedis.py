@@ -16,55 +16,194 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import threading
-import time
+import collections
+import fnmatch
+
+# All clients in the same process share the values and the subscriptions, so that modules
+# that run as threads in one process can communicate with each other without a server. The
+# published messages are placed in a queue for each subscriber, which wakes up immediately.
 
 store = {}
-latest = None
+subscribers = set()
+lock = threading.Lock()
+
+
+def encode(val):
+    # the values are stored as strings, like a redis client that decodes the responses
+    if isinstance(val, bool):
+        val = int(val)
+    if isinstance(val, float):
+        return repr(float(val))
+    elif isinstance(val, bytes):
+        return val.decode('utf-8')
+    else:
+        return str(val)
+
+def match(pattern, channel):
+    # redis patterns use [^a] where fnmatch uses [!a]
+    return fnmatch.fnmatchcase(channel, pattern.replace('[^', '[!'))
 
 
 ###################################################################################################
 class client():
     def __init__(self):
-        store = {}
+        pass
 
     def set(self, key, val):
-        global store, latest
-        store[key] = val
-        return
+        with lock:
+            store[key] = encode(val)
+        return True
+
+    def mset(self, mapping):
+        with lock:
+            for key, val in mapping.items():
+                store[key] = encode(val)
+        return True
 
     def get(self, key):
-        global store, latest
-        if key in store:
-            return store[key]
-        else:
-            return None
+        with lock:
+            return store.get(key)
+
+    def mget(self, keys):
+        with lock:
+            return [store.get(key) for key in keys]
 
     def publish(self, key, val):
-        global store, latest
-        store[key] = val
-        latest = key
+        # return the number of subscribers that received the message, like redis
+        val = encode(val)
+        with lock:
+            receivers = list(subscribers)
+        return sum([receiver.deliver(key, val) for receiver in receivers])
+
+    def exists(self, key):
+        with lock:
+            return key in store
+
+    def keys(self, pattern='*'):
+        with lock:
+            return [key for key in store.keys() if match(pattern, key)]
+
+    def flushall(self):
+        # remove all values, this is useful to start each test with an empty broker
+        with lock:
+            store.clear()
+        return True
 
     def pubsub(self):
         return pubsub()
 
-    def exists(self, key):
-        return key in store
+    def pipeline(self, transaction=False):
+        return pipeline(self)
+
+
+###################################################################################################
+class pipeline():
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, val):
+        self.commands.append((self.client.set, (key, val)))
+        return self
+
+    def mset(self, mapping):
+        self.commands.append((self.client.mset, (mapping,)))
+        return self
+
+    def get(self, key):
+        self.commands.append((self.client.get, (key,)))
+        return self
+
+    def mget(self, keys):
+        self.commands.append((self.client.mget, (keys,)))
+        return self
+
+    def publish(self, key, val):
+        self.commands.append((self.client.publish, (key, val)))
+        return self
+
+    def execute(self):
+        val = [command(*args) for command, args in self.commands]
+        self.commands = []
+        return val
+
 
 ###################################################################################################
 class pubsub():
+    """Class that receives the published messages, like the pubsub object of a redis client.
+    The messages are queued when they are published and are returned in the same order."""
+
     def __init__(self):
-        self.subscribed = []
+        self.channels = set()
+        self.patterns = set()
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+
+    def subscribe(self, *channels):
+        with self.condition:
+            self.channels.update(channels)
+        self.update()
+
+    def unsubscribe(self, *channels):
+        with self.condition:
+            if len(channels)==0:
+                self.channels.clear()
+            else:
+                self.channels.difference_update(channels)
+        self.update()
+
+    def psubscribe(self, *patterns):
+        with self.condition:
+            self.patterns.update(patterns)
+        self.update()
 
-    def subscribe(self, key):
-        self.subscribed.append(key)
+    def punsubscribe(self, *patterns):
+        with self.condition:
+            if len(patterns)==0:
+                self.patterns.clear()
+            else:
+                self.patterns.difference_update(patterns)
+        self.update()
+
+    def update(self):
+        # only the pubsub objects with subscriptions receive messages
+        with lock:
+            if len(self.channels) or len(self.patterns):
+                subscribers.add(self)
+            else:
+                subscribers.discard(self)
+
+    def close(self):
+        self.unsubscribe()
+        self.punsubscribe()
+
+    def deliver(self, channel, data):
+        # this is called by the publisher, it queues the message once for the channel and once for each matching pattern
+        count = 0
+        with self.condition:
+            if channel in self.channels:
+                self.pending.append({'type': 'message', 'pattern': None, 'channel': channel, 'data': data})
+                count += 1
+            for pattern in self.patterns:
+                if match(pattern, channel):
+                    self.pending.append({'type': 'pmessage', 'pattern': pattern, 'channel': channel, 'data': data})
+                    count += 1
+            if count:
+                self.condition.notify_all()
+        return count
 
     def listen(self):
-        global store, latest
-        while not latest in self.subscribed:
-            time.sleep(0.1)
-        item = dict()
-        item['type'] = 'message'
-        item['channel'] = latest
-        item['data'] = store[latest]
-        latest = None
-        return [item]
+        # wait for the first message and return it together with all messages that arrived in the meantime
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.pending))
+            items = list(self.pending)
+            self.pending.clear()
+        return items
+
+    def get_message(self, timeout=0.0):
+        # return the next message, or None if there is none within the timeout (in seconds)
+        with self.condition:
+            if self.condition.wait_for(lambda: len(self.pending), timeout):
+                return self.pending.popleft()
+            else:
+                return None
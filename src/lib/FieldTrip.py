@@ -14,6 +14,14 @@ import socket
 import struct
 import numpy
 import unicodedata
+import collections
+import itertools
+import copy
+import asyncio
+import zlib
+import json
+import bisect
+import re
 
 # We need these for the server
 import time
@@ -21,6 +29,14 @@ import selectors
 import types
 import struct
 
+# We need these for reading blocks of data in the background
+import threading
+import queue
+
+# We need these for the shared memory transport
+from multiprocessing import shared_memory
+import mmap
+
 # the lib directory contains shared code
 path = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(path, ".."))
@@ -43,6 +59,7 @@ GET_DAT            = 0x0202
 GET_EVT            = 0x0203
 GET_OK             = 0x0204
 GET_ERR            = 0x0205
+GET_STATS          = 0x0206 # this is an extension, the statistics of the server are returned as JSON
 FLUSH_HDR          = 0x0301
 FLUSH_DAT          = 0x0302
 FLUSH_EVT          = 0x0303
@@ -55,6 +72,32 @@ PUT_HDR_NORESPONSE = 0x0501
 PUT_DAT_NORESPONSE = 0x0502
 PUT_EVT_NORESPONSE = 0x0503
 
+# these are an extension to the FieldTrip buffer protocol, a client that subscribes with
+# STREAM_DAT receives the new samples as STREAM_DAT messages without having to poll
+STREAM_DAT         = 0x0602
+STREAM_OK          = 0x0604
+STREAM_ERR         = 0x0605
+# with COMPRESS_DAT a client requests the samples on its connection to be compressed
+COMPRESS_DAT       = 0x0702
+COMPRESS_OK        = 0x0704
+COMPRESS_ERR       = 0x0705
+# with SELECT_STREAM a client selects the named stream that its subsequent requests apply to
+SELECT_STREAM      = 0x0802
+SELECT_OK          = 0x0804
+SELECT_ERR         = 0x0805
+# the names of the streams are also used in the names of the memory-mapped files
+STREAM_NAME        = re.compile('^[A-Za-z0-9_-]{1,64}$')
+
+# names of the commands, e.g. for the statistics of the server
+commandName = {
+    PUT_HDR: 'PUT_HDR', PUT_DAT: 'PUT_DAT', PUT_EVT: 'PUT_EVT',
+    GET_HDR: 'GET_HDR', GET_DAT: 'GET_DAT', GET_EVT: 'GET_EVT', GET_STATS: 'GET_STATS',
+    FLUSH_HDR: 'FLUSH_HDR', FLUSH_DAT: 'FLUSH_DAT', FLUSH_EVT: 'FLUSH_EVT',
+    WAIT_DAT: 'WAIT_DAT',
+    PUT_HDR_NORESPONSE: 'PUT_HDR_NORESPONSE', PUT_DAT_NORESPONSE: 'PUT_DAT_NORESPONSE', PUT_EVT_NORESPONSE: 'PUT_EVT_NORESPONSE',
+    STREAM_DAT: 'STREAM_DAT', COMPRESS_DAT: 'COMPRESS_DAT', SELECT_STREAM: 'SELECT_STREAM',
+}
+
 DATATYPE_CHAR    = 0
 DATATYPE_UINT8   = 1
 DATATYPE_UINT16  = 2
@@ -80,15 +123,27 @@ CHUNK_NEUROMAG_FIF       = 8
 CHUNK_NEUROMAG_ISOTRAK   = 9
 CHUNK_NEUROMAG_HPIRESULT = 10
 
+# compression methods for COMPRESS_DAT, the bytes of the samples are shuffled and compressed with zlib
+COMPRESSION_NONE    = 0
+COMPRESSION_SHUFFLE = 1  # this works well for floating point data
+COMPRESSION_DELTA   = 2  # the difference between subsequent samples is taken first, this works well for integer data
+
+# decimation methods for the extended GET_DAT request
+DECIMATE_STRIDE = 0  # take every n-th sample
+DECIMATE_MINMAX = 1  # take the minimum and maximum of every n samples, e.g. for plotting
+
+# selection of the events for the extended GET_EVT request
+EVENTS_BY_NUMBER = 0  # the inclusive, zero-based range of event numbers
+EVENTS_BY_SAMPLE = 1  # the events that fall within the inclusive, zero-based range of samples
+
 # List for converting FieldTrip datatypes to Numpy datatypes
 numpyType = ['int8', 'uint8', 'uint16', 'uint32', 'uint64',
              'int8', 'int16', 'int32', 'int64', 'float32', 'float64']
 # Corresponding word sizes
 wordSize = [1, 1, 2, 4, 8, 1, 2, 4, 8, 4, 8]
-# FieldTrip data type as indexed by numpy dtype.num
-# this goes  0 => nothing, 1..4 => int8, uint8, int16, uint16, 7..10 =>
-# int32, uint32, int64, uint64  11..12 => float32, float64
-dataType = [-1, 5, 1, 6, 2, -1, -1, 7, 3, 8, 4, 9, 10]
+# FieldTrip data type as indexed by numpy dtype, the numbering of dtype.num
+# differs between platforms
+dataType = dict([(numpy.dtype(t), i) for i, t in enumerate(numpyType) if i != DATATYPE_CHAR])
 
 
 def serialize(A):
@@ -97,24 +152,20 @@ def serialize(A):
     object, if possible.
     """
     if isinstance(A, str):
-        return (0, A)
+        return (DATATYPE_CHAR, A.encode('utf-8'))
 
     if isinstance(A, numpy.ndarray):
-        dt = A.dtype
-        if not(dt.isnative) or dt.num < 1 or dt.num >= len(dataType):
-            return (DATATYPE_UNKNOWN, None)
-
-        ft = dataType[dt.num]
-        if ft == -1:
+        ft = dataType.get(A.dtype, DATATYPE_UNKNOWN)
+        if ft == DATATYPE_UNKNOWN:
             return (DATATYPE_UNKNOWN, None)
 
         if A.flags['C_CONTIGUOUS']:
             # great, just use the array's buffer interface
-            return (ft, A.tostring())
+            return (ft, A.tobytes())
 
         # otherwise, we need a copy to C order
         AC = A.copy('C')
-        return (ft, AC.tostring())
+        return (ft, AC.tobytes())
 
     if isinstance(A, int):
         return (DATATYPE_INT32, struct.pack('i', A))
@@ -125,6 +176,226 @@ def serialize(A):
     return (DATATYPE_UNKNOWN, None)
 
 
+def serializeChunks(nChannels, labels=None, chunks=None):
+    """
+    Returns the channel names and the additional chunks with header information
+    as a string, ready to send over the network.
+    """
+    haveLabels = False
+    extras = b''
+
+    if (type(labels)==list) and (len(labels)==0):
+        labels=None
+
+    if not(labels is None):
+        serLabels = b''
+        try:
+            for n in range(0, nChannels):
+                # ensure that labels are ascii strings, not unicode
+                serLabels += labels[n].encode('ascii', 'ignore') + b'\0'
+        except:
+            raise ValueError('Channels names (labels), if given, must be a list of N=numChannels strings')
+
+        extras = struct.pack('II', CHUNK_CHANNEL_NAMES, len(serLabels)) + serLabels
+        haveLabels = True
+
+    if not(chunks is None):
+        for chunk_type, chunk_data in chunks:
+            if haveLabels and chunk_type == CHUNK_CHANNEL_NAMES:
+                # ignore channel names chunk in case we got labels
+                continue
+            extras += struct.pack('II', chunk_type,
+                                  len(chunk_data)) + chunk_data
+
+    return extras
+
+
+def deserializeChunks(H, buf):
+    """
+    Parses the additional chunks with header information from the string and
+    stores them, including the channel names, in the given Header object.
+    """
+    offset = 0
+    bufsize = len(buf)
+    while offset + 8 < bufsize:
+        (chunk_type, chunk_len) = struct.unpack('II', buf[offset:offset + 8])
+        offset += 8
+        if offset + chunk_len > bufsize:
+            break
+        H.chunks[chunk_type] = bytes(buf[offset:offset + chunk_len])
+        offset += chunk_len
+
+    if CHUNK_CHANNEL_NAMES in H.chunks:
+        L = H.chunks[CHUNK_CHANNEL_NAMES].split(b'\0')
+        numLab = len(L)
+        if numLab >= H.nChannels:
+            H.labels = [x.decode('utf-8') for x in L[0:H.nChannels]]
+
+
+def serializeHeader(nChannels, fSample, dataType, labels=None, chunks=None):
+    """
+    Returns the string representation of the fixed part of the header followed
+    by the chunks, this is the payload of a PUT_HDR request.
+    """
+    extras = serializeChunks(nChannels, labels, chunks)
+    hdef = struct.pack('IIIfII', nChannels, 0, 0, fSample, dataType, len(extras))
+    return hdef + extras
+
+
+def deserializeHeader(buf):
+    """
+    Parses the fixed part of the header and the chunks from the string, this is
+    the payload of the response to GET_HDR, and returns them as a Header object.
+    """
+    (nchans, nsamp, nevt, fsamp, dtype, bfsiz) = struct.unpack('IIIfII', buf[0:24])
+
+    H = Header()
+    H.nChannels = nchans
+    H.nSamples = nsamp
+    H.nEvents = nevt
+    H.fSample = fsamp
+    H.dataType = dtype
+
+    if bfsiz > 0:
+        deserializeChunks(H, buf[24:])
+
+    return H
+
+
+def serializeEvents(E):
+    """
+    Returns the string representation of a single Event object, or of a list
+    of Event objects.
+    """
+    if isinstance(E, Event):
+        buf = E.serialize()
+        if buf is None:
+            raise ValueError('Event could not be serialized')
+        return buf
+
+    buf = []
+    num = 0
+    for e in E:
+        if not(isinstance(e, Event)):
+            raise ValueError('Element %i in given list is not an Event' % num)
+        S = e.serialize()
+        if S is None:
+            raise ValueError('Element %i in given list could not be serialized' % num)
+        buf.append(S)
+        num = num + 1
+    return b''.join(buf)
+
+
+def deserializeEvents(buf):
+    """Parses the events from the string and returns them as a list of Event objects."""
+    offset = 0
+    E = []
+    while 1:
+        e = Event()
+        nextOffset = e.deserialize(buf[offset:])
+        if nextOffset == 0:
+            break
+        E.append(e)
+        offset = offset + nextOffset
+    return E
+
+
+def dataRequest(index=None, channels=None, step=1, decimation=DECIMATE_STRIDE):
+    """
+    Returns the GET_DAT request for the inclusive, zero-based start/end indices.
+    The extended request is used if channels are selected or if the data is decimated.
+    """
+    if index is None:
+        return struct.pack('HHI', VERSION, GET_DAT, 0)
+    indS = int(index[0])
+    indE = int(index[1])
+    if channels is not None or step > 1:
+        if channels is None:
+            channels = []
+        request = struct.pack('HHIIIIII', VERSION, GET_DAT, 20 + 4 * len(channels), indS, indE, int(step), int(decimation), len(channels))
+        request += struct.pack('%dI' % len(channels), *channels)
+        return request
+    return struct.pack('HHIII', VERSION, GET_DAT, 8, indS, indE)
+
+
+def dataShape(index, channels=None, step=1, decimation=DECIMATE_STRIDE):
+    """
+    Returns the number of samples and channels that the server should return for the
+    extended GET_DAT request. The number of channels is None if all are selected.
+    """
+    nsamples = int(index[1]) - int(index[0]) + 1
+    if step > 1:
+        nsamples = (nsamples + step - 1) // step
+        if decimation == DECIMATE_MINMAX:
+            nsamples = 2 * nsamples
+    if channels:
+        return (nsamples, len(channels))
+    return (nsamples, None)
+
+
+def compress(D, method, level=1):
+    """
+    Returns the compressed representation of the samples x channels array. With
+    delta compression the difference between subsequent samples is computed on
+    the bits of each value, which is lossless also for floating point data.
+    """
+    if method == COMPRESSION_NONE:
+        return D
+    D = numpy.ascontiguousarray(D)
+    wordsize = D.dtype.itemsize
+    if method == COMPRESSION_DELTA:
+        U = D.view('u%d' % wordsize)
+        D = U.copy()
+        D[1:] -= U[:-1]  # this wraps around
+    # the bytes are grouped by their significance
+    B = numpy.ascontiguousarray(D.view(numpy.uint8).reshape(-1, wordsize).T)
+    return zlib.compress(B, level)
+
+
+def decompress(buf, nsamples, nchans, dtype, method):
+    """
+    Returns the samples x channels array from its compressed representation.
+    """
+    dtype = numpy.dtype(dtype)
+    wordsize = dtype.itemsize
+    if method == COMPRESSION_NONE:
+        return numpy.frombuffer(buf, dtype=dtype).reshape(nsamples, nchans)
+    B = numpy.frombuffer(zlib.decompress(buf), dtype=numpy.uint8)
+    if B.size != nsamples * nchans * wordsize:
+        raise IOError('Invalid compressed data')
+    U = numpy.ascontiguousarray(B.reshape(wordsize, -1).T).view('u%d' % wordsize).reshape(nsamples, nchans)
+    if method == COMPRESSION_DELTA:
+        U = numpy.cumsum(U, axis=0, dtype=U.dtype)  # this also wraps around
+    return U.view(dtype)
+
+
+def decimate(D, step, method=DECIMATE_STRIDE):
+    """
+    Decimates the samples x channels array by taking every step-th sample, or
+    by taking the minimum and maximum over every step samples. In the latter
+    case the minimum and maximum alternate in the rows of the output.
+    """
+    if step <= 1:
+        return D
+    if method == DECIMATE_STRIDE:
+        return numpy.ascontiguousarray(D[::step])
+    elif method == DECIMATE_MINMAX:
+        nsamples, nchans = D.shape
+        nblocks = (nsamples + step - 1) // step
+        ncomplete = nsamples // step
+        E = numpy.empty((2 * nblocks, nchans), dtype=D.dtype)
+        blocks = D[0:ncomplete * step].reshape(ncomplete, step, nchans)
+        E[0:2 * ncomplete:2] = blocks.min(axis=1)
+        E[1:2 * ncomplete:2] = blocks.max(axis=1)
+        if nblocks > ncomplete:
+            # the last block is incomplete
+            E[-2] = D[ncomplete * step:].min(axis=0)
+            E[-1] = D[ncomplete * step:].max(axis=0)
+        return E
+    else:
+        raise ValueError('Unknown decimation method')
+
+
 class Header:
     """Class for storing header information."""
 
@@ -184,24 +455,27 @@ class Event:
         self.offset = offset
         self.duration = duration
 
+        if type_type >= len(wordSize) or value_type >= len(wordSize):
+            raise IOError('Invalid event definition -- unknown data type')
+
         st = type_numel * wordSize[type_type]
         sv = value_numel * wordSize[value_type]
 
         if bsiz + 32 > bufsize or st + sv > bsiz:
-             IOError(
+            raise IOError(
                 'Invalid event definition -- does not fit in given buffer')
 
         raw_type = buf[32:32 + st]
         raw_value = buf[32 + st:32 + st + sv]
 
-        if type_type == 0:
-            self.type = raw_type
+        if type_type == DATATYPE_CHAR:
+            self.type = bytes(raw_type)
         else:
             self.type = numpy.ndarray(
                 (type_numel), dtype=numpyType[type_type], buffer=raw_type)
 
-        if value_type == 0:
-            self.value = raw_value
+        if value_type == DATATYPE_CHAR:
+            self.value = bytes(raw_value)
         else:
             self.value = numpy.ndarray(
                 (value_numel), dtype=numpyType[value_type], buffer=raw_value)
@@ -217,13 +491,13 @@ class Event:
         if type_type == DATATYPE_UNKNOWN:
             return None
         type_size = len(type_buf)
-        type_numel = type_size / wordSize[type_type]
+        type_numel = type_size // wordSize[type_type]
 
         value_type, value_buf = serialize(self.value)
         if value_type == DATATYPE_UNKNOWN:
             return None
         value_size = len(value_buf)
-        value_numel = value_size / wordSize[value_type]
+        value_numel = value_size // wordSize[value_type]
 
         bufsize = type_size + value_size
 
@@ -244,24 +518,104 @@ class Client:
     def __init__(self):
         self.isConnected = False
         self.sock = []
-
-    def connect(self, hostname, port=1972):
+        self.scratch = bytearray()
+        self.shm = None
+        self.extended = True    # whether the server supports the extended GET_DAT request
+        self.versioned = True   # whether the server reports the version of the header
+        self.headers = {}       # the most recent header and its version for each stream
+        self.streamName = 'default' # the name of the selected stream
+        self.selecting = None   # the request to select a stream, this is sent along with the next request
+        self.selected = 0       # the number of responses to selecting a stream that are still to be received
+        self.compression = COMPRESSION_NONE
+        self.level = 1
+
+    def connect(self, hostname, port=1972, compression=COMPRESSION_NONE):
         """
         connect(hostname [, port]) -- make a connection, default port is 1972.
+
+        Using the hostname 'shm' exchanges the data through shared memory with
+        the other clients on the same computer, rather than through a buffer server.
+        The port number is used to distinguish multiple buffers.
+
+        The optional compression is one of the COMPRESSION_xxx methods, see
+        setCompression().
         """
 
+        if hostname == 'shm':
+            self.shm = SharedMemory(port)
+            self.isConnected = True
+            return
+
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((hostname, port))
         self.sock.setblocking(True)
+        # small requests should not be delayed, e.g. when writing without waiting for the response
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.isConnected = True
 
+        if compression != COMPRESSION_NONE:
+            self.setCompression(compression)
+
+    def setCompression(self, method, level=1):
+        """
+        setCompression(method [, level]) -- request the samples that are exchanged
+        over this connection to be compressed, which helps on slow network links.
+        The method is COMPRESSION_SHUFFLE, COMPRESSION_DELTA or COMPRESSION_NONE,
+        the zlib level ranges from 1 (fast) to 9 (small), or is -1 for the default.
+        This returns whether the server agreed, otherwise the samples remain
+        uncompressed.
+        """
+
+        if self.shm:
+            return False
+
+        self.sendRequest(COMPRESS_DAT, struct.pack('Ii', method, level))
+        (status, bufsize, resp_buf) = self.receiveResponse()
+        if status == COMPRESS_OK:
+            self.compression = method
+            self.level = level
+            return True
+        return False
+
     def disconnect(self):
         """disconnect() -- close a connection."""
 
         if self.isConnected:
-            self.sock.close()
+            if self.shm:
+                self.shm.disconnect()
+                self.shm = None
+            else:
+                self.sock.close()
             self.sock = []
             self.isConnected = False
+            self.headers = {}
+            self.streamName = 'default'
+            self.selecting = None
+            self.selected = 0
+
+    def select(self, name):
+        """
+        select(name) -- select the named stream that the subsequent requests apply
+        to, a single server can hold multiple streams, each with its own header,
+        samples and events. Initially the stream 'default' is selected. The name
+        consists of at most 64 letters, digits, underscores and dashes.
+
+        The request is not sent immediately but along with the next request, so
+        that switching between streams does not cost an additional round trip.
+        """
+
+        if self.shm:
+            if name != 'default':
+                raise IOError('Named streams are not supported with shared memory')
+            return
+
+        if not STREAM_NAME.match(name):
+            raise ValueError('Invalid stream name')
+        if name == self.streamName and self.selecting is None:
+            return
+        payload = name.encode('utf-8')
+        self.selecting = struct.pack('HHI', VERSION, SELECT_STREAM, len(payload)) + payload
+        self.streamName = name
 
     def sendRaw(self, request):
         """Send all bytes of the string 'request' out to socket."""
@@ -269,11 +623,44 @@ class Client:
         if not(self.isConnected):
             raise IOError('Not connected to FieldTrip buffer')
 
+        if self.selecting is not None:
+            request = self.selecting + request
+            self.selecting = None
+            self.selected += 1
+
         N = len(request)
         nw = self.sock.send(request)
         while nw < N:
             nw += self.sock.send(request[nw:])
 
+    def sendParts(self, *parts):
+        """
+        Send multiple parts, such as the request header and the buffer of a Numpy
+        array, with a single system call and without concatenating them.
+        """
+
+        if not(self.isConnected):
+            raise IOError('Not connected to FieldTrip buffer')
+
+        if self.selecting is not None:
+            parts = (self.selecting,) + parts
+            self.selecting = None
+            self.selected += 1
+
+        if not hasattr(self.sock, 'sendmsg'):
+            # scatter-gather is not available on all platforms
+            return self.sendRaw(b''.join(parts))
+
+        parts = [memoryview(part).cast('B') for part in parts]
+        while parts:
+            nw = self.sock.sendmsg(parts)
+            # remove what has been sent
+            while parts and nw >= len(parts[0]):
+                nw -= len(parts[0])
+                parts.pop(0)
+            if nw:
+                parts[0] = parts[0][nw:]
+
     def sendRequest(self, command, payload=None):
         if payload is None:
             request = struct.pack('HHI', VERSION, command, 0)
@@ -282,34 +669,125 @@ class Client:
                 'HHI', VERSION, command, len(payload)) + payload
         self.sendRaw(request)
 
+    def receiveInto(self, buf):
+        """
+        Receive exactly len(buf) bytes from the socket into the writable buffer 'buf'.
+        """
+
+        view = memoryview(buf).cast('B')
+        nbytes = len(view)
+        nr = 0
+        while nr < nbytes:
+            n = self.sock.recv_into(view[nr:], nbytes - nr)
+            if n == 0:
+                self.disconnect()
+                raise IOError('Connection closed by buffer server')
+            nr += n
+        return buf
+
     def receiveResponse(self, minBytes=0):
         """
         Receive response from server on socket 's' and return it as
         (status,bufsize,payload).
         """
 
-        resp_hdr = self.sock.recv(8)
-        while len(resp_hdr) < 8:
-            resp_hdr += self.sock.recv(8 - len(resp_hdr))
+        (command, bufsize) = self.receiveResponseHeader()
+
+        if bufsize > 0:
+            payload = self.receiveInto(bytearray(bufsize))
+        else:
+            payload = None
+        return (command, bufsize, payload)
+
+    def receiveResponseHeader(self):
+        """
+        Receive only the fixed-size part of the response and return it as
+        (status,bufsize). The caller is responsible for reading the payload.
+        """
 
+        self.receiveSelected()
+        resp_hdr = self.receiveInto(bytearray(8))
         (version, command, bufsize) = struct.unpack('HHI', resp_hdr)
 
         if version != VERSION:
             self.disconnect()
             raise IOError('Bad response from buffer server - disconnecting')
 
-        if bufsize > 0:
-            payload = self.sock.recv(bufsize)
-            while len(payload) < bufsize:
-                payload += self.sock.recv(bufsize - len(payload))
-        else:
-            payload = None
-        return (command, bufsize, payload)
+        return (command, bufsize)
+
+    def receiveSelected(self):
+        """Receive the responses to selecting a stream, which precede the response to the request."""
+
+        while self.selected:
+            (version, command, bufsize) = struct.unpack('HHI', self.receiveInto(bytearray(8)))
+            self.selected -= 1
+            if version != VERSION:
+                self.disconnect()
+                raise IOError('Bad response from buffer server - disconnecting')
+            self.discard(bufsize)
+            if command != SELECT_OK:
+                # the request that followed has been applied to the wrong stream
+                self.disconnect()
+                raise IOError('Stream could not be selected - disconnecting')
+
+    def discard(self, nbytes):
+        """Receive and discard the specified number of bytes."""
+
+        while nbytes > 0:
+            n = min(nbytes, 65536)
+            self.receiveInto(self.scratchBuffer(n)[0:n])
+            nbytes -= n
+
+    def scratchBuffer(self, nbytes):
+        """
+        Return a reusable bytearray of at least 'nbytes', this is only grown
+        and never shrunk.
+        """
+
+        if len(self.scratch) < nbytes:
+            self.scratch = bytearray(nbytes)
+        return memoryview(self.scratch)
 
     def getHeader(self):
         """
         getHeader() -- grabs header information from the buffer an returns
         it as a Header object.
+
+        The header is cached. If the server reports the version of the header,
+        only the number of samples and events are retrieved as long as the
+        header did not change, the chunks are not transferred and parsed again.
+        """
+
+        if self.shm:
+            return self.shm.getHeader()
+
+        version = None
+        if self.versioned:
+            request = struct.pack('HHIIIII', VERSION, WAIT_DAT, 16, 0, 0, 0, 0)
+            self.sendRaw(request)
+            (status, bufsize, resp_buf) = self.receiveResponse()
+            if status == WAIT_OK and bufsize >= 12:
+                (nsamples, nevents, version) = struct.unpack('III', resp_buf[0:12])
+                (header, headerVersion) = self.headers.get(self.streamName, (None, None))
+                if header is not None and version == headerVersion:
+                    # the header did not change, only update the number of samples and events
+                    H = copy.copy(header)
+                    H.nSamples = nsamples
+                    H.nEvents = nevents
+                    return H
+
+        H = self.getFullHeader()
+
+        if H is not None and version is None:
+            # the server has a header, but does not report its version
+            self.versioned = False
+        self.headers[self.streamName] = (H, version)
+        return H
+
+    def getFullHeader(self):
+        """
+        getFullHeader() -- grabs header information from the buffer, including
+        all chunks, and returns it as a Header object.
         """
 
         self.sendRequest(GET_HDR)
@@ -327,97 +805,82 @@ class Client:
             raise IOError('Invalid HEADER packet received (too few bytes) - '
                           'disconnecting')
 
-        (nchans, nsamp, nevt, fsamp, dtype, bfsiz) = struct.unpack('IIIfII', payload[0:24])
-
-        H = Header()
-        H.nChannels = nchans
-        H.nSamples = nsamp
-        H.nEvents = nevt
-        H.fSample = fsamp
-        H.dataType = dtype
-
-        if bfsiz > 0:
-            offset = 24
-            while offset + 8 < bufsize:
-                (chunk_type, chunk_len) = struct.unpack('II', payload[offset:offset + 8])
-                offset += 8
-                if offset + chunk_len > bufsize:
-                    break
-                H.chunks[chunk_type] = payload[offset:offset + chunk_len]
-                offset += chunk_len
-
-            if CHUNK_CHANNEL_NAMES in H.chunks:
-                L = H.chunks[CHUNK_CHANNEL_NAMES].split(b'\0')
-                numLab = len(L)
-                if numLab >= H.nChannels:
-                    H.labels = [x.decode('utf-8') for x in L[0:H.nChannels]]
-
-        return H
+        return deserializeHeader(payload)
 
     def putHeader(self, nChannels, fSample, dataType, labels=None, chunks=None, reponse=True):
-        haveLabels = False
-        extras = b''
-
-        if (type(labels)==list) and (len(labels)==0):
-            labels=None
-
-        if not(labels is None):
-            serLabels = b''
-            for n in range(0, nChannels):
-                # ensure that labels are ascii strings, not unicode
-                serLabels += labels[n].encode('ascii', 'ignore') + b'\0'
-            try:
-                pass
-            except:
-                raise ValueError('Channels names (labels), if given, must be a list of N=numChannels strings')
-
-            extras = struct.pack('II', CHUNK_CHANNEL_NAMES, len(serLabels)) + serLabels
-            haveLabels = True
-
-        if not(chunks is None):
-            for chunk_type, chunk_data in chunks:
-                if haveLabels and chunk_type == CHUNK_CHANNEL_NAMES:
-                    # ignore channel names chunk in case we got labels
-                    continue
-                extras += struct.pack('II', chunk_type,
-                                      len(chunk_data)) + chunk_data
-
-        sizeChunks = len(extras)
+        if self.shm:
+            return self.shm.putHeader(nChannels, fSample, dataType, labels, chunks)
 
         if reponse:
             command = PUT_HDR
         else:
             command = PUT_HDR_NORESPONSE
 
-        hdef = struct.pack('IIIfII', nChannels, 0, 0,
-                           fSample, dataType, sizeChunks)
-        request = struct.pack('HHI', VERSION, command,
-                              sizeChunks + len(hdef)) + hdef + extras
-        self.sendRaw(request)
+        self.sendRequest(command, serializeHeader(nChannels, fSample, dataType, labels, chunks))
 
         if reponse:
             (status, bufsize, resp_buf) = self.receiveResponse()
             if status != PUT_OK:
                 raise IOError('Header could not be written')
 
-    def getData(self, index=None):
+    def getData(self, index=None, out=None, dtype=None, channels=None, step=1, decimation=DECIMATE_STRIDE):
         """
         getData([indices]) -- retrieve data samples and return them as a
         Numpy array, samples in rows(!). The 'indices' argument is optional,
         and if given, must be a tuple or list with inclusive, zero-based
         start/end indices.
+
+        getData(indices, out=buf) -- receive the samples directly into the
+        preallocated, C-contiguous Numpy array 'buf', which must have the
+        shape (samples x channels). The array is returned.
+
+        getData(indices, dtype=numpy.double) -- return the samples converted
+        to the specified Numpy data type.
+
+        getData(indices, channels=[0, 3], step=10) -- return only the specified
+        zero-based channels and every 10th sample. With decimation=DECIMATE_MINMAX
+        the minimum and maximum over every 10 samples are returned in alternating
+        rows instead. The selection is done by the server, so that only the
+        samples that are needed are transferred.
+
+        When the data type of the output differs from the one in the buffer,
+        the samples are received in a reusable scratch buffer and converted
+        in a single step.
         """
 
-        if index is None:
-            request = struct.pack('HHI', VERSION, GET_DAT, 0)
-        else:
-            indS = int(index[0])
-            indE = int(index[1])
-            request = struct.pack('HHIII', VERSION, GET_DAT, 8, indS, indE)
-        self.sendRaw(request)
+        selection = channels is not None or step > 1
+
+        if self.shm or (selection and (index is None or not self.extended)):
+            return self.getDataLocally(index, out, dtype, channels, step, decimation)
+
+        self.sendRaw(dataRequest(index, channels, step, decimation))
+        self.receiveSelected()
+
+        # the response header and data definition are received together where possible
+        resp_hdr = bytearray(24)
+        view = memoryview(resp_hdr)
+        nr = 0
+        while nr < 8:
+            n = self.sock.recv_into(view[nr:], 24 - nr)
+            if n == 0:
+                self.disconnect()
+                raise IOError('Connection closed by buffer server')
+            nr += n
+
+        (version, status, bufsize) = struct.unpack('HHI', resp_hdr[0:8])
+
+        if version != VERSION:
+            self.disconnect()
+            raise IOError('Bad response from buffer server - disconnecting')
 
-        (status, bufsize, payload) = self.receiveResponse()
         if status == GET_ERR:
+            self.discard(bufsize - (nr - 8))
+            if selection:
+                # the server may not support the extended request, try the standard one
+                D = self.getDataLocally(index, out, dtype, channels, step, decimation)
+                if D is not None:
+                    self.extended = False
+                return D
             return None
 
         if status != GET_OK:
@@ -428,26 +891,114 @@ class Client:
             self.disconnect()
             raise IOError('Invalid DATA packet received (too few bytes)')
 
-        (nchans, nsamp, datype, bfsiz) = struct.unpack('IIII', payload[0:16])
+        if nr < 24:
+            self.receiveInto(view[nr:])
+
+        (nchans, nsamp, datype, bfsiz) = struct.unpack('IIII', resp_hdr[8:24])
+
+        if selection:
+            (expectedsamp, expectedchans) = dataShape(index, channels, step, decimation)
+            if nsamp != expectedsamp or (expectedchans is not None and nchans != expectedchans):
+                # the server ignored the extended request and returned all channels and samples
+                self.extended = False
+                D = self.receiveSamples(nchans, nsamp, datype, bfsiz, bufsize - 16)
+                return self.selectLocally(D, out, dtype, channels, step, decimation)
+
+        return self.receiveSamples(nchans, nsamp, datype, bfsiz, bufsize - 16, out, dtype)
+
+    def getDataLocally(self, index, out, dtype, channels, step, decimation):
+        """
+        Retrieve all channels and samples and do the selection and decimation here,
+        this is used when the server cannot do it.
+        """
+
+        if self.shm:
+            D = self.shm.getData(index)
+        else:
+            D = self.getData(index)
+        if D is None:
+            return None
+        return self.selectLocally(D, out, dtype, channels, step, decimation)
+
+    def selectLocally(self, D, out, dtype, channels, step, decimation):
+        """
+        Select the channels and decimate the samples x channels array that contains
+        all channels and samples.
+        """
+
+        if channels:
+            D = D[:, channels]
+        D = decimate(D, step, decimation)
+        if out is not None:
+            if out.shape != D.shape:
+                raise ValueError('Output array has shape %s, expected %s' % (out.shape, D.shape))
+            numpy.copyto(out, D, casting='unsafe')
+            return out
+        elif dtype is not None:
+            return D.astype(dtype)
+        else:
+            return D
+
+    def receiveSamples(self, nchans, nsamp, datype, bfsiz, nbytes, out=None, dtype=None):
+        """
+        Receive the samples that follow the data definition in a response with 'nbytes'
+        remaining, and return them as a Numpy array (samples x channels).
+        """
 
-        if bfsiz < bufsize - 16 or datype >= len(numpyType):
+        if bfsiz > nbytes or datype >= len(numpyType) or (bfsiz != nchans * nsamp * wordSize[datype] and not self.compression):
+            self.disconnect()
             raise IOError('Invalid DATA packet received')
 
-        raw = payload[16:bfsiz + 16]
-        D = numpy.ndarray((nsamp, nchans), dtype=numpyType[datype], buffer=raw)
+        if out is not None:
+            if out.shape != (nsamp, nchans):
+                self.discard(nbytes)
+                raise ValueError('Output array has shape %s, expected %s' % (out.shape, (nsamp, nchans)))
+            if not out.flags['C_CONTIGUOUS'] or not out.flags['WRITEABLE']:
+                self.discard(nbytes)
+                raise ValueError('Output array must be writeable and C-contiguous')
+            D = out
+        elif dtype is None:
+            D = numpy.empty((nsamp, nchans), dtype=numpyType[datype])
+        else:
+            D = numpy.empty((nsamp, nchans), dtype=dtype)
+
+        if self.compression:
+            # receive the compressed samples in the scratch buffer and decompress them
+            raw = self.receiveInto(self.scratchBuffer(bfsiz)[0:bfsiz])
+            numpy.copyto(D, decompress(raw, nsamp, nchans, numpyType[datype], self.compression), casting='unsafe')
+        elif D.dtype == numpy.dtype(numpyType[datype]):
+            # receive the samples straight into the output array
+            self.receiveInto(D)
+        else:
+            # receive the samples in the scratch buffer and convert them in one step
+            raw = self.receiveInto(self.scratchBuffer(bfsiz)[0:bfsiz])
+            numpy.copyto(D, numpy.frombuffer(raw, dtype=numpyType[datype]).reshape(nsamp, nchans), casting='unsafe')
+
+        # skip any trailing bytes that do not belong to the samples
+        self.discard(nbytes - bfsiz)
 
         return D
 
-    def getEvents(self, index=None):
+    def getEvents(self, index=None, samples=None):
         """
         getEvents([indices]) -- retrieve events and return them as a list
         of Event objects. The 'indices' argument is optional, and if given,
         must be a tuple or list with inclusive, zero-based start/end indices.
         The 'type' and 'value' fields of the event will be converted to strings
         or Numpy arrays.
+
+        getEvents(samples=[begsample, endsample]) -- retrieve the events that
+        fall within the inclusive, zero-based range of samples. The selection is
+        done by the server, or here if the server does not support it.
         """
 
-        if index is None:
+        if self.shm:
+            # events are not supported through shared memory
+            return []
+
+        if samples is not None:
+            request = struct.pack('HHIIII', VERSION, GET_EVT, 12, int(samples[0]), int(samples[1]), EVENTS_BY_SAMPLE)
+        elif index is None:
             request = struct.pack('HHI', VERSION, GET_EVT, 0)
         else:
             indS = int(index[0])
@@ -456,24 +1007,17 @@ class Client:
         self.sendRaw(request)
 
         (status, bufsize, resp_buf) = self.receiveResponse()
-        if status == GET_ERR:
+        if status == GET_ERR and samples is not None:
+            # the server may not support the extended request, select the events here
+            return [e for e in self.getEvents() if e.sample >= samples[0] and e.sample <= samples[1]]
+        if status == GET_ERR or bufsize == 0:
             return []
 
         if status != GET_OK:
             self.disconnect()
             raise IOError('Bad response from buffer server - disconnecting')
 
-        offset = 0
-        E = []
-        while 1:
-            e = Event()
-            nextOffset = e.deserialize(resp_buf[offset:])
-            if nextOffset == 0:
-                break
-            E.append(e)
-            offset = offset + nextOffset
-
-        return E
+        return deserializeEvents(resp_buf)
 
     def putEvents(self, E, reponse=True):
         """
@@ -482,16 +1026,10 @@ class Client:
         given as an argument.
         """
 
-        if isinstance(E, Event):
-            buf = E.serialize()
-        else:
-            buf = ''
-            num = 0
-            for e in E:
-                if not(isinstance(e, Event)):
-                    raise 'Element %i in given list is not an Event' % num
-                buf = buf + e.serialize()
-                num = num + 1
+        if self.shm:
+            raise IOError('Events are not supported through shared memory.')
+
+        buf = serializeEvents(E)
 
         if reponse:
             command = PUT_EVT
@@ -511,27 +1049,43 @@ class Client:
         samples x channels. The type of the samples (D) and the number of
         channels must match the corresponding quantities in the FieldTrip
         buffer.
+
+        putData(D, response=False) -- does not wait for the response of the
+        server, so that multiple blocks can be written in quick succession.
+        Errors are not reported in that case.
+
+        The samples of a C-contiguous array are sent straight from its buffer
+        without copying them.
         """
 
         if not(isinstance(D, numpy.ndarray)) or len(D.shape) != 2:
             raise ValueError(
                 'Data must be given as a NUMPY array (samples x channels)')
 
+        if self.shm:
+            return self.shm.putData(D)
+
         nSamp = D.shape[0]
         nChan = D.shape[1]
 
-        (dataType, dataBuf) = serialize(D)
+        datatype = dataType.get(D.dtype, DATATYPE_UNKNOWN)
+        if datatype == DATATYPE_UNKNOWN:
+            raise ValueError('Data type %s is not supported' % D.dtype)
 
-        dataBufSize = len(dataBuf)
+        if not D.flags['C_CONTIGUOUS']:
+            D = numpy.ascontiguousarray(D)
 
         if response:
             command = PUT_DAT
         else:
             command = PUT_DAT_NORESPONSE
 
-        request = struct.pack('HHI', VERSION, command, 16 + dataBufSize)
-        dataDef = struct.pack('IIII', nChan, nSamp, dataType, dataBufSize)
-        self.sendRaw(request + dataDef + dataBuf)
+        if self.compression:
+            D = compress(D, self.compression, self.level)
+        nbytes = len(memoryview(D).cast('B'))
+
+        request = struct.pack('HHIIIII', VERSION, command, 16 + nbytes, nChan, nSamp, datatype, nbytes)
+        self.sendParts(request, D)
 
         if response:
             (status, bufsize, resp_buf) = self.receiveResponse()
@@ -539,6 +1093,9 @@ class Client:
                 raise IOError('Samples could not be written.')
 
     def poll(self):
+        if self.shm:
+            return self.shm.poll()
+
         request = struct.pack('HHIIII', VERSION, WAIT_DAT, 12, 0, 0, 0)
         self.sendRaw(request)
 
@@ -550,6 +1107,9 @@ class Client:
         return struct.unpack('II', resp_buf[0:8])
 
     def wait(self, nsamples, nevents, timeout):
+        if self.shm:
+            return self.shm.wait(nsamples, nevents, timeout)
+
         request = struct.pack('HHIIII', VERSION, WAIT_DAT, 12, int(nsamples), int(nevents), int(timeout))
         self.sendRaw(request)
 
@@ -560,79 +1120,803 @@ class Client:
 
         return struct.unpack('II', resp_buf[0:8])
 
+    def getStats(self):
+        """
+        getStats() -- retrieve the statistics of the buffer server and return them as
+        a dictionary, or None if the server does not support this.
+        """
 
-##########################################################################################
-# Class for a FieldTrip buffer server
-##########################################################################################
+        if self.shm:
+            return None
 
-class Server():
-    """Class for a FieldTrip buffer server."""
+        self.sendRequest(GET_STATS)
+        (status, bufsize, resp_buf) = self.receiveResponse()
+        if status != GET_OK or bufsize == 0:
+            return None
+        return json.loads(resp_buf.decode('utf-8'))
 
-    def __init__(self):
-        self.isConnected = False
-        self.sel = None
-        self.H = None
-        self.D = None
-        self.E = None
-        self.length = 600       # in seconds, ring buffer length
-        self.timeout = 1        # in seconds, this should be 0 if you want to loop over multiple servers
-        self.keepalive = True   # whether to raise errors or keep running
+    def stream(self, blocksize=0, stepsize=None, begsample=None, dtype=None):
+        """
+        stream([blocksize, stepsize]) -- subscribe to the data and return a generator
+        that yields (begsample, D) as soon as new samples are written to the buffer.
+        With a blocksize of 0 all new samples are returned as they arrive, otherwise
+        blocks with a fixed number of samples are returned that start 'stepsize'
+        samples apart, by default they do not overlap. The optional 'begsample' is
+        zero-based, by default the stream starts at the current end of the data.
+
+        When the client falls behind so far that samples are overwritten in the ring
+        buffer, the stream skips ahead; this can be detected from begsample. The
+        connection should not be used for other requests while streaming.
+        """
 
+        if stepsize is None or stepsize == 0:
+            stepsize = blocksize
+        if begsample is None:
+            begsample = -1
 
-    def connect(self, hostname='localhost', port=1972):
-        if self.isConnected:
-            if self.keepalive:
-                print('Already connected.')
-                return
-            else:
-                raise RuntimeError('Already connected.')
+        if self.shm:
+            yield from self.streamPolling(blocksize, stepsize, begsample, dtype)
+            return
 
-        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        lsock.bind((hostname, port))
-        lsock.listen()
-        print(f'Listening on {(hostname, port)}')
-        lsock.setblocking(False)
-        self.sel = selectors.DefaultSelector()
-        self.sel.register(lsock, selectors.EVENT_READ, data = None)
-        self.isConnected = True
+        request = struct.pack('HHIiII', VERSION, STREAM_DAT, 12, int(begsample), int(blocksize), int(stepsize))
+        self.sendRaw(request)
+
+        (status, bufsize, resp_buf) = self.receiveResponse()
+        if status == STREAM_ERR:
+            raise IOError('Streaming failed.')
+        elif status != STREAM_OK:
+            # the buffer server does not support streaming
+            yield from self.streamPolling(blocksize, stepsize, begsample, dtype)
+            return
+
+        try:
+            while True:
+                (status, bufsize) = self.receiveResponseHeader()
+                if status == STREAM_DAT and bufsize >= 20:
+                    (begsample, nchans, nsamp, datype, bfsiz) = struct.unpack('IIIII', self.receiveInto(bytearray(20)))
+                    yield (begsample, self.receiveSamples(nchans, nsamp, datype, bfsiz, bufsize - 20, None, dtype))
+                elif status == STREAM_ERR:
+                    self.discard(bufsize)
+                    raise IOError('The header or data was flushed while streaming.')
+                else:
+                    self.disconnect()
+                    raise IOError('Bad response from buffer server - disconnecting')
+        finally:
+            if self.isConnected:
+                # unsubscribe and skip the samples that were already sent
+                self.sendRequest(STREAM_DAT)
+                status = None
+                while status != STREAM_OK:
+                    (status, bufsize) = self.receiveResponseHeader()
+                    self.discard(bufsize)
+
+    def streamPolling(self, blocksize, stepsize, begsample, dtype=None):
+        """
+        Generator that behaves like stream(), but uses wait() and getData(). This
+        is used for shared memory and for buffer servers that do not support streaming.
+        """
 
+        (nsamples, nevents) = self.poll()
+        if begsample < 0:
+            begsample = nsamples
 
-    def disconnect(self):
-        if not self.isConnected:
-            if self.keepalive:
-                print('Not connected.')
-                return
+        while True:
+            if blocksize == 0:
+                endsample = max(nsamples, begsample + 1)
             else:
-                raise RuntimeError('Not connected.')
+                endsample = begsample + blocksize
+            while nsamples < endsample:
+                previous = nsamples
+                (nsamples, nevents) = self.wait(endsample - 1, nevents, 1000)
+                if nsamples < previous:
+                    raise IOError('The header or data was flushed while streaming.')
+            if blocksize == 0:
+                endsample = nsamples
+            D = self.getData([begsample, endsample - 1], dtype=dtype)
+            if D is None:
+                # the samples have been overwritten, skip ahead to the most recent block
+                begsample = max(begsample, nsamples - max(blocksize, 1))
+                continue
+            yield (begsample, D)
+            if blocksize == 0:
+                begsample = endsample
+            else:
+                begsample += stepsize
 
-        self.sel.close()
-        self.sel = None
-        self.isConnected = False
 
+##########################################################################################
+# Class for reading consecutive blocks of data in the background
+##########################################################################################
 
-    def accept_wrapper(self, sock):
-        if not self.isConnected:
-            if self.keepalive:
-                print('Already connected.')
-                return
-            else:
-                raise RuntimeError('Not connected.')
+class BufferReset(RuntimeError):
+    """Exception that is raised when the header or data in the buffer was flushed while reading."""
+    pass
 
-        conn, addr = sock.accept()  # Should be ready to read
-        print(f'Accepted connection from {addr}')
-        conn.setblocking(False)
-        data = types.SimpleNamespace(addr=addr, inb=b'', outb=b'')
-        events = selectors.EVENT_READ
-        self.sel.register(conn, events, data=data)
 
+class BlockReader:
+    """
+    Class that reads consecutive blocks of data from a FieldTrip buffer. It waits
+    for the data to arrive, rather than polling, and reads the next block on a
+    background thread while the current one is being processed.
+
+    BlockReader(client, blocksize [, step, channels]) -- read blocks of 'blocksize'
+    samples that start 'step' samples apart, by default they do not overlap. The
+    optional 'channels' is a list with zero-based channel indices. By default the
+    first block is the most recent one; use 'begsample' to start elsewhere.
+
+    The reader is iterated over, or next(reader) is called, to get (begsample, D)
+    with zero-based begsample and the samples in rows. It raises BufferReset when
+    the buffer is flushed and RuntimeError when no data arrives within 'timeout'
+    seconds. When the reader falls so far behind that samples are overwritten in
+    the ring buffer, it skips ahead; this can be detected from begsample. The client
+    should not be used for other requests until close().
+    """
 
-    def service_request(self, key, mask):
-        if not self.isConnected:
-            if self.keepalive:
-                print('Not connected.')
-                return
-            else:
+    def __init__(self, client, blocksize, step=None, channels=None, begsample=None, timeout=30, dtype=None, prefetch=1):
+        if blocksize < 1:
+            raise ValueError('The blocksize should be at least one sample.')
+        if step is None or step == 0:
+            step = blocksize
+        self.client = client
+        self.blocksize = int(blocksize)
+        self.step = int(step)
+        self.channels = channels
+        self.timeout = timeout
+        self.dtype = dtype
+        self.running = True
+        self.failed = None
+        self.blocks = queue.Queue(maxsize=prefetch)
+
+        (nsamples, nevents) = self.client.poll()
+        if begsample is None:
+            # start with the most recent block
+            begsample = max(0, nsamples - self.blocksize)
+        self.begsample = begsample
+
+        self.thread = threading.Thread(target=self.prefetch, daemon=True)
+        self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.failed is not None:
+            raise self.failed
+        while True:
+            try:
+                block = self.blocks.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    raise StopIteration
+        if isinstance(block, Exception):
+            self.failed = block
+            raise block
+        return block
+
+    def read(self):
+        """read() -- return the next block as (begsample, D)."""
+        return next(self)
+
+    def close(self):
+        """close() -- stop reading in the background, after which the client can be used again."""
+        self.running = False
+        # make room for the block that the background thread may be trying to add
+        while self.thread.is_alive():
+            try:
+                self.blocks.get_nowait()
+            except queue.Empty:
+                pass
+            self.thread.join(0.01)
+
+    def prefetch(self):
+        """This runs on the background thread, it reads the blocks and adds them to the queue."""
+        begsample = self.begsample
+        try:
+            (nsamples, nevents) = self.client.poll()
+            while self.running:
+                endsample = begsample + self.blocksize
+                start = time.time()
+                while nsamples < endsample:
+                    if not self.running:
+                        return
+                    if time.time() - start > self.timeout:
+                        raise RuntimeError('timeout while waiting for data')
+                    previous = nsamples
+                    try:
+                        # wait in short steps, so that the reader can be closed
+                        (nsamples, nevents) = self.client.wait(endsample - 1, nevents, 100)
+                    except IOError:
+                        if self.client.isConnected:
+                            # the header was flushed
+                            raise BufferReset('buffer reset detected')
+                        raise
+                    if nsamples < previous:
+                        raise BufferReset('buffer reset detected')
+                D = self.client.getData([begsample, endsample - 1], dtype=self.dtype, channels=self.channels)
+                if D is None:
+                    (nsamples, nevents) = self.client.poll()
+                    if nsamples < endsample:
+                        raise BufferReset('buffer reset detected')
+                    # the samples have been overwritten, skip ahead to the most recent block
+                    begsample = max(begsample, nsamples - self.blocksize)
+                    continue
+                self.put((begsample, D))
+                begsample += self.step
+        except Exception as e:
+            self.put(e)
+
+    def put(self, block):
+        """Add a block to the queue, this blocks while the queue is full."""
+        while self.running:
+            try:
+                self.blocks.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+##########################################################################################
+# Class for exchanging data through shared memory
+##########################################################################################
+
+# The shared memory segment starts with a control block, followed by the chunks with
+# additional header information and by the ring buffer with the samples. The sequence
+# number is odd while the writer updates the control block, readers retry until they
+# have read it with an even sequence number that did not change in the mean time.
+SHM_MAGIC   = b'FTSM'
+SHM_CONTROL = struct.Struct('=4sIQIIIdQQQIQ')   # magic, stale, sequence, version, nChannels, dataType, fSample, capacity, nSamples, nEvents, sizeChunks, dataOffset
+SHM_SEQ     = struct.calcsize('=4sI')           # offset of the sequence number
+SHM_COUNT   = struct.Struct('=QQ')              # nSamples, nEvents
+SHM_NSAMP   = struct.calcsize('=4sIQIIIdQ')     # offset of the number of samples
+
+
+class ReadOnlySegment:
+    """
+    Class for mapping an existing shared memory segment read-only, so that a reader
+    cannot corrupt the samples or the control block of the writer. It offers the same
+    buf and close() as multiprocessing.shared_memory.SharedMemory. This requires POSIX
+    shared memory, the named file mappings on Windows cannot be opened read-only with
+    the standard library without knowing their size in advance.
+    """
+
+    def __init__(self, name):
+        fd = shared_memory._posixshmem.shm_open('/' + name, os.O_RDONLY, mode=0o600)
+        try:
+            self.mmap = mmap.mmap(fd, os.fstat(fd).st_size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self.mmap)
+
+    def close(self):
+        self.buf.release()
+        self.mmap.close()
+
+
+class SharedMemory:
+    """
+    Class for exchanging data through a shared memory segment between a single writer
+    and multiple readers on the same computer. This is used by the Client class when
+    connecting to the hostname 'shm', the port number identifies the segment.
+    """
+
+    def __init__(self, port=1972, length=600):
+        self.name = 'eegsynth_fieldtrip_%d' % port
+        self.length = length    # in seconds, ring buffer length
+        self.shm = None
+        self.data = None
+        self.isWriter = False
+        self.version = None
+        self.timeout = 1.0      # in seconds, how long a reader waits for the writer to complete an update
+
+    def close(self, unlink=False):
+        if self.shm is None:
+            return
+        if unlink:
+            # notify the readers that this segment is not used any more
+            struct.pack_into('=I', self.shm.buf, 4, 1)
+        self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
+        self.version = None
+
+    def disconnect(self):
+        self.close(unlink=self.isWriter)
+        self.isWriter = False
+
+    def attach(self):
+        """
+        Attach to the segment of the writer, or re-attach when the writer has replaced
+        it. This returns False if there is no segment.
+        """
+        if self.shm is not None and not self.isWriter:
+            (magic, stale) = struct.unpack_from('=4sI', self.shm.buf, 0)
+            if stale:
+                self.close()
+        if self.shm is None:
+            try:
+                if shared_memory._USE_POSIX:
+                    self.shm = ReadOnlySegment(self.name)
+                else:
+                    # on Windows the segment is mapped read-write, see ReadOnlySegment
+                    self.shm = shared_memory.SharedMemory(name=self.name)
+            except FileNotFoundError:
+                return False
+            if bytes(self.shm.buf[0:4]) != SHM_MAGIC:
+                self.close()
+                return False
+        return True
+
+    def takeover(self):
+        """
+        Open the segment of a writer that stopped, so that it can be removed. This returns
+        the version of its header, or None if there is no segment.
+        """
+        self.close()
+        try:
+            # this is tracked like any other segment, and is untracked again when it is unlinked
+            self.shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return None
+        if bytes(self.shm.buf[0:4]) != SHM_MAGIC:
+            version = None
+        else:
+            version = SHM_CONTROL.unpack_from(self.shm.buf, 0)[3]
+        self.close(unlink=True)
+        return version
+
+    def readControl(self):
+        """Read a consistent copy of the control block, this returns a tuple."""
+        deadline = None
+        while True:
+            seq = struct.unpack_from('=Q', self.shm.buf, SHM_SEQ)[0]
+            if seq % 2:
+                # the writer is updating the control block, it may have stopped while doing so
+                if deadline is None:
+                    deadline = time.time() + self.timeout
+                elif time.time() > deadline:
+                    raise IOError('The writer did not complete its update')
+                time.sleep(0)
+                continue
+            control = SHM_CONTROL.unpack_from(self.shm.buf, 0)
+            if struct.unpack_from('=Q', self.shm.buf, SHM_SEQ)[0] == seq:
+                return control
+
+    def beginWrite(self):
+        """Make the sequence number odd, the readers wait for endWrite() to read the control block."""
+        seq = struct.unpack_from('=Q', self.shm.buf, SHM_SEQ)[0]
+        struct.pack_into('=Q', self.shm.buf, SHM_SEQ, seq + 1)
+        return seq
+
+    def endWrite(self, seq):
+        """Make the sequence number even again."""
+        struct.pack_into('=Q', self.shm.buf, SHM_SEQ, seq + 2)
+
+    def writeControl(self, offset, fmt, *values):
+        """Update one or multiple fields in the control block."""
+        seq = self.beginWrite()
+        fmt.pack_into(self.shm.buf, offset, *values)
+        self.endWrite(seq)
+
+    def mapData(self, control):
+        """Map the ring buffer with the samples as a numpy array."""
+        (magic, stale, seq, version, nChannels, dataType, fSample, capacity, nSamples, nEvents, sizeChunks, dataOffset) = control
+        if self.version != version:
+            self.data = numpy.ndarray((capacity, nChannels), dtype=numpyType[dataType], buffer=self.shm.buf, offset=dataOffset)
+            self.version = version
+        return self.data
+
+    def getHeader(self):
+        if not self.attach():
+            return None
+        control = self.readControl()
+        (magic, stale, seq, version, nChannels, dataType, fSample, capacity, nSamples, nEvents, sizeChunks, dataOffset) = control
+
+        H = Header()
+        H.nChannels = nChannels
+        H.nSamples = nSamples
+        H.nEvents = nEvents
+        H.fSample = fSample
+        H.dataType = dataType
+        if sizeChunks > 0:
+            deserializeChunks(H, bytes(self.shm.buf[SHM_CONTROL.size:SHM_CONTROL.size + sizeChunks]))
+        return H
+
+    def putHeader(self, nChannels, fSample, dataType, labels=None, chunks=None):
+        extras = serializeChunks(nChannels, labels, chunks)
+        capacity = int(fSample * self.length)
+        dataOffset = (SHM_CONTROL.size + len(extras) + 63) // 64 * 64
+        size = dataOffset + capacity * nChannels * wordSize[dataType]
+
+        if self.isWriter:
+            (magic, stale, seq, version, _nChannels, _dataType, _fSample, _capacity, nSamples, nEvents, sizeChunks, _dataOffset) = self.readControl()
+            if (nChannels, dataType, capacity) == (_nChannels, _dataType, _capacity) and dataOffset <= _dataOffset:
+                # the existing segment can be reused
+                self.shm.buf[SHM_CONTROL.size:SHM_CONTROL.size + len(extras)] = extras
+                self.writeControl(0, SHM_CONTROL, SHM_MAGIC, 0, seq + 1, version + 1, nChannels, dataType, fSample, capacity, 0, 0, len(extras), _dataOffset)
+                return
+            self.close(unlink=True)
+            version += 1
+        else:
+            # a stale segment can remain after the writer stopped
+            version = self.takeover()
+            if version is None:
+                version = 0
+            else:
+                version += 1
+
+        self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self.isWriter = True
+        self.shm.buf[SHM_CONTROL.size:SHM_CONTROL.size + len(extras)] = extras
+        SHM_CONTROL.pack_into(self.shm.buf, 0, SHM_MAGIC, 0, 0, version, nChannels, dataType, fSample, capacity, 0, 0, len(extras), dataOffset)
+
+    def putData(self, D):
+        if not self.isWriter:
+            raise IOError('The header should be written first')
+        control = self.readControl()
+        (magic, stale, seq, version, nChannels, dataType, fSample, capacity, nSamples, nEvents, sizeChunks, dataOffset) = control
+        if D.shape[1] != nChannels or dataType >= len(numpyType) or D.dtype != numpy.dtype(numpyType[dataType]):
+            raise IOError('Samples could not be written.')
+        data = self.mapData(control)
+
+        if D.shape[0] > capacity:
+            # remove the part of the data that does not fit anyway
+            nSamples += D.shape[0] - capacity
+            D = D[-capacity:]
+        # the sequence number remains odd while the samples are written, readers that copied
+        # samples in the mean time therefore only check them against the new number of samples
+        seq = self.beginWrite()
+        begsample = nSamples % capacity
+        endsample = begsample + D.shape[0]
+        if endsample > capacity:
+            numsamples = capacity - begsample
+            data[begsample:] = D[0:numsamples]
+            data[0:endsample-capacity] = D[numsamples:]
+        else:
+            data[begsample:endsample] = D
+        # the samples are only made available after they have been written
+        SHM_COUNT.pack_into(self.shm.buf, SHM_NSAMP, nSamples + D.shape[0], nEvents)
+        self.endWrite(seq)
+
+    def getData(self, index=None, out=None, dtype=None):
+        if not self.attach():
+            return None
+        control = self.readControl()
+        (magic, stale, seq, version, nChannels, dataType, fSample, capacity, nSamples, nEvents, sizeChunks, dataOffset) = control
+        data = self.mapData(control)
+
+        if index is None:
+            begsample, endsample = max(0, nSamples - capacity), nSamples - 1
+        else:
+            begsample, endsample = int(index[0]), int(index[1])
+        if begsample < max(0, nSamples - capacity) or endsample >= nSamples or endsample < begsample:
+            return None
+        nsamp = endsample - begsample + 1
+        first = begsample
+
+        if out is None:
+            if dtype is None:
+                dtype = data.dtype
+            out = numpy.empty((nsamp, nChannels), dtype=dtype)
+        elif out.shape != (nsamp, nChannels):
+            raise ValueError('Output array has shape %s, expected %s' % (out.shape, (nsamp, nChannels)))
+
+        begsample = begsample % capacity
+        endsample = begsample + nsamp
+        if endsample > capacity:
+            numsamples = capacity - begsample
+            out[0:numsamples] = data[begsample:]
+            out[numsamples:] = data[0:endsample-capacity]
+        else:
+            out[:] = data[begsample:endsample]
+
+        # check that the writer did not overwrite the samples while they were copied, this
+        # waits for a write that is in progress and includes the samples that it writes
+        control = self.readControl()
+        if control[3] != version or first < control[8] - capacity:
+            return None
+        return out
+
+    def poll(self):
+        if not self.attach():
+            raise IOError('Polling failed.')
+        return self.readControl()[8:10]
+
+    def wait(self, nsamples, nevents, timeout):
+        start = time.time()
+        delay = 0.0002
+        while True:
+            (nSamples, nEvents) = self.poll()
+            if nSamples > nsamples or nEvents > nevents or time.time() - start >= timeout / 1000.0:
+                return (nSamples, nEvents)
+            time.sleep(delay)
+            delay = min(2 * delay, 0.002)
+
+
+##########################################################################################
+# Class for storing events in the server
+##########################################################################################
+
+class EventBuffer:
+    """
+    Class that implements a bounded ring of serialized events. The oldest events
+    are discarded once the buffer is full. Events are numbered from the start,
+    i.e. the number of an event does not change when older events are discarded.
+    The events are also indexed by their sample, which is searched with bisection
+    as long as the events are written in the order of their samples.
+    """
+
+    def __init__(self, length):
+        self.events = collections.deque(maxlen=length)
+        self.samples = collections.deque(maxlen=length)
+        self.length = length
+        self.count = 0
+        self.ordered = True     # whether the samples of the events never decrease
+
+    def append(self, buf):
+        """
+        append(bytes) - split one or multiple serialized events and add them to the
+        end of the buffer. This returns the number of events that were added.
+        """
+        events = []
+        samples = []
+        offset = 0
+        while offset < len(buf):
+            if offset + 32 > len(buf):
+                raise IOError('Invalid event definition -- does not fit in given buffer')
+            (type_type, type_numel, value_type, value_numel, sample, offset_, duration, bsiz) = struct.unpack('IIIIIiiI', buf[offset:offset+32])
+            if type_type >= len(wordSize) or value_type >= len(wordSize):
+                raise IOError('Invalid event definition -- unknown data type')
+            if offset + 32 + bsiz > len(buf) or type_numel*wordSize[type_type] + value_numel*wordSize[value_type] > bsiz:
+                raise IOError('Invalid event definition -- does not fit in given buffer')
+            events.append(bytes(buf[offset:offset+32+bsiz]))
+            samples.append(sample)
+            offset += 32 + bsiz
+        # only add the events once all of them have been checked
+        previous = self.samples[-1] if self.samples else 0
+        for sample in samples:
+            if sample < previous:
+                # the index can no longer be searched with bisection
+                self.ordered = False
+            previous = sample
+        self.events.extend(events)
+        self.samples.extend(samples)
+        self.count += len(events)
+        return len(events)
+
+    def read(self, begevent, endevent):
+        """
+        read(begevent, endevent) - return the serialized events with inclusive, zero-based
+        start/end indices as bytes.
+        """
+        begavailable = self.count - len(self.events)
+        endavailable = self.count - 1
+        if begevent<begavailable:
+            raise RuntimeError('Cannot read before the start of the available events.')
+        elif endevent>endavailable:
+            raise RuntimeError('Cannot read past the end of the available events.')
+        elif endevent<begevent:
+            raise RuntimeError('Invalid selection.')
+        begevent -= begavailable
+        endevent -= begavailable
+        return b''.join(itertools.islice(self.events, begevent, endevent+1))
+
+    def find(self, begsample, endsample):
+        """
+        find(begsample, endsample) - return the numbers of the available events that
+        fall within the inclusive, zero-based range of samples.
+        """
+        begavailable = self.count - len(self.events)
+        if self.ordered:
+            first = bisect.bisect_left(self.samples, begsample)
+            last = bisect.bisect_right(self.samples, endsample)
+            return list(range(begavailable + first, begavailable + last))
+        return [begavailable + i for i, sample in enumerate(self.samples) if sample >= begsample and sample <= endsample]
+
+    def select(self, begsample, endsample):
+        """
+        select(begsample, endsample) - return the serialized events that fall within
+        the inclusive, zero-based range of samples as bytes.
+        """
+        numbers = self.find(begsample, endsample)
+        if not numbers:
+            return b''
+        elif self.ordered:
+            return self.read(numbers[0], numbers[-1])
+        begavailable = self.count - len(self.events)
+        return b''.join([self.events[number - begavailable] for number in numbers])
+
+
+##########################################################################################
+# Class for a FieldTrip buffer server
+##########################################################################################
+
+class Buffer:
+    """Class that holds the header, samples and events of a single stream in the server."""
+
+    def __init__(self, name):
+        self.name = name
+        self.H = None
+        self.D = None
+        self.E = None
+        self.chunks = b''       # the chunks with additional header information
+        self.version = 0        # this is incremented whenever the header changes
+
+
+class Server():
+    """
+    Class for a FieldTrip buffer server.
+
+    Multiple servers, each on its own port, can share a single selector. In that
+    case they should be served together with FieldTrip.loop(servers), which waits
+    until any of their sockets is ready.
+    """
+
+    def __init__(self, selector=None):
+        self.isConnected = False
+        self.sel = selector     # this can be shared with other servers
+        self.ownselector = selector is None
+        self.lsock = None
+        self.buffers = {'default': Buffer('default')}  # the named streams, legacy clients use the default one
+        self.maxstreams = 16    # the number of named streams that clients can create
+        self.length = 600       # in seconds, ring buffer length
+        self.filename = None    # if specified, the ring buffer is stored in this memory-mapped file rather than in memory
+        self.eventlength = 10000  # in events, event ring buffer length
+        self.timeout = 1        # in seconds, this should be 0 if you want to loop over multiple servers
+        self.keepalive = True   # whether to raise errors or keep running
+        self.waiting = {}       # connections with a pending WAIT_DAT request
+        self.resumed = {}       # connections with requests that arrived during a WAIT_DAT request
+        self.recvsize = 65536   # in bytes, larger payloads are received directly into their final buffer
+        self.maxrequest = 16777216  # in bytes, the largest payload of a request other than PUT_DAT
+        self.streaming = {}     # connections that subscribed to the data with STREAM_DAT
+        self.maxqueue = 16777216  # in bytes, samples are not pushed to a subscriber while more than this is queued
+        self.compression = True # whether clients can request the samples to be compressed
+        self.open = {}          # all connections
+        self.accepted = 0       # the number of connections that have been accepted
+        self.started = time.time()
+        self.commands = {}      # statistics for each command
+        self.histogram = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1]  # in seconds, bin edges for the service time
+
+
+    @property
+    def H(self):
+        return self.buffers['default'].H
+
+    @property
+    def D(self):
+        return self.buffers['default'].D
+
+    @property
+    def E(self):
+        return self.buffers['default'].E
+
+
+    def buffer_filename(self, name):
+        """
+        Return the name of a new memory-mapped file for a stream, or None. Each header
+        gets its own file, so that the samples that were written before are kept.
+        """
+        if self.filename is None:
+            return None
+        (root, ext) = os.path.splitext(self.filename)
+        if name != 'default':
+            if not STREAM_NAME.match(name):
+                raise ValueError('Invalid stream name')
+            root = '%s_%s' % (root, name)
+        number = 1
+        while os.path.exists('%s_%04d%s' % (root, number, ext)):
+            number += 1
+        return '%s_%04d%s' % (root, number, ext)
+
+
+    def flush_files(self):
+        """Write the samples of all streams that are kept in memory-mapped files to disk."""
+        for buf in self.buffers.values():
+            if buf.D != None:
+                buf.D.flush()
+
+
+    def flush_data(self, buf):
+        """Discard the samples of a stream, a memory-mapped file is written to disk first."""
+        if buf.D != None:
+            buf.D.flush()
+            buf.D = None
+
+
+    def connect(self, hostname='localhost', port=1972):
+        if self.isConnected:
+            if self.keepalive:
+                print('Already connected.')
+                return
+            else:
+                raise RuntimeError('Already connected.')
+
+        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        lsock.bind((hostname, port))
+        lsock.listen()
+        print(f'Listening on {(hostname, port)}')
+        lsock.setblocking(False)
+        if self.sel is None:
+            self.sel = selectors.DefaultSelector()
+        # the listening socket is registered with the server itself, the connections with their state
+        self.sel.register(lsock, selectors.EVENT_READ, data = self)
+        self.lsock = lsock
+        self.isConnected = True
+
+
+    def disconnect(self):
+        if not self.isConnected:
+            if self.keepalive:
+                print('Not connected.')
+                return
+            else:
+                raise RuntimeError('Not connected.')
+
+        # close the listening socket and the connections of this server
+        for key in list(self.sel.get_map().values()):
+            if key.data is self or getattr(key.data, 'server', None) is self:
+                self.sel.unregister(key.fileobj)
+                key.fileobj.close()
+        if self.ownselector:
+            self.sel.close()
+            self.sel = None
+        self.lsock = None
+        self.waiting = {}
+        self.resumed = {}
+        self.streaming = {}
+        # make sure that the memory-mapped files are complete
+        self.flush_files()
+        self.isConnected = False
+
+
+    def accept_wrapper(self, sock):
+        if not self.isConnected:
+            if self.keepalive:
+                print('Already connected.')
+                return
+            else:
+                raise RuntimeError('Not connected.')
+
+        conn, addr = sock.accept()  # Should be ready to read
+        print(f'Accepted connection from {addr}')
+        conn.setblocking(False)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        data = self.new_connection(conn, addr)
+        events = selectors.EVENT_READ
+        self.sel.register(conn, events, data=data)
+
+
+    def new_connection(self, sock, addr, **kwargs):
+        """Return the state of a new connection, this also keeps its statistics."""
+        # inb contains the bytes of incomplete requests, large payloads are received directly in body
+        # outb contains the bytes of responses that could not be sent yet
+        data = types.SimpleNamespace(server=self, addr=addr, inb=bytearray(), outb=bytearray(), command=None, body=None, nread=0, wait=None, stream=None, buffer=self.buffers['default'], compression=COMPRESSION_NONE, level=0, closed=False,
+                                     requests=0, bytesin=0, bytesout=0, maxqueued=0, **kwargs)
+        self.open[sock] = data
+        self.accepted += 1
+        return data
+
+
+    def close_connection(self, sock, data):
+        print(f'Closing connection to {data.addr}')
+        data.closed = True
+        self.open.pop(sock, None)
+        self.waiting.pop(sock, None)
+        self.resumed.pop(sock, None)
+        self.streaming.pop(sock, None)
+        self.sel.unregister(sock)
+        sock.close()
+
+
+    def service_request(self, key, mask):
+        if not self.isConnected:
+            if self.keepalive:
+                print('Not connected.')
+                return
+            else:
                 raise RuntimeError('Not connected.')
 
         sock = key.fileobj
@@ -640,152 +1924,599 @@ class Server():
 
         if mask & selectors.EVENT_READ:
             try:
-                message = sock.recv(8)
-            except:
+                if data.body is not None:
+                    # receive the remainder of a large payload directly into its final buffer
+                    nbytes = sock.recv_into(memoryview(data.body)[data.nread:])
+                    data.nread += nbytes
+                else:
+                    message = sock.recv(self.recvsize)
+                    nbytes = len(message)
+                    data.inb += message
+                data.bytesin += nbytes
+            except BlockingIOError:
+                nbytes = None
+            except OSError:
                 if self.keepalive:
                     print('Cannot read message.')
-                    message = [] # this will be handled further down
+                    nbytes = 0 # this will close the connection
                 else:
                     raise IOError('Cannot read message.')
 
-            if message and len(message)==8:
-                (version, command, bufsize) = struct.unpack('HHI', message[0:8])
-                if version != VERSION:
-                    if self.keepalive:
-                        print('Incompatible version.')
-                        return
-                    else:
-                        raise RuntimeError('Incompatible version.')
+            if nbytes == 0:
+                self.close_connection(sock, data)
+                return
+            elif nbytes:
+                self.process_requests(sock, data)
+
+        if mask & selectors.EVENT_WRITE and not data.closed:
+            self.send_queued(sock, data)
+
+
+    def process_requests(self, sock, data):
+        """
+        Handle all complete requests that have been received on a connection. A request
+        is only handled once its payload has been received completely, this may take
+        multiple calls to service_request.
+        """
+        while data.wait is None and not data.closed:
+            if data.body is not None:
+                if data.nread < len(data.body):
+                    # the large payload is not complete yet
+                    break
+                command, payload = data.command, data.body
+                data.command, data.body, data.nread = None, None, 0
+                self.handle(sock, data, command, payload)
+                continue
+
+            if len(data.inb) < 8:
+                break
 
+            (version, command, bufsize) = struct.unpack('HHI', data.inb[0:8])
+            if version != VERSION:
+                # the stream of requests cannot be parsed any further
+                if self.keepalive:
+                    print('Incompatible version.')
+                    self.close_connection(sock, data)
+                    break
+                else:
+                    raise RuntimeError('Incompatible version.')
+
+            if bufsize > self.payloadlimit(data, command):
+                # the payload cannot be valid, it is not received and the connection is closed
+                print('Request too large')
+                self.reject(sock, data, command)
+                break
+
+            if len(data.inb) >= 8 + bufsize:
+                payload = bytes(data.inb[8:8+bufsize])
+                del data.inb[0:8+bufsize]
+                self.handle(sock, data, command, payload)
+            elif bufsize > self.recvsize:
+                # the remainder of a large payload is received directly into its final buffer
                 try:
-                    payload = sock.recv(bufsize)
-                except:
-                    if self.keepalive:
-                        print('Cannot read payload.')
-                        return
-                    else:
-                        raise IOError('Cannot read payload.')
+                    body = bytearray(bufsize)
+                except MemoryError:
+                    print('Cannot allocate memory for request')
+                    self.reject(sock, data, command)
+                    break
+                data.command = command
+                data.body = body
+                data.nread = len(data.inb) - 8
+                data.body[0:data.nread] = data.inb[8:]
+                del data.inb[:]
+            else:
+                break
 
-                if command == PUT_HDR:
-                    self.H = Header()
-                    self.D = None  # this flushes the data
-                    self.E = None  # this flushes the events
-                    (self.H.nChannels, self.H.nSamples, self.H.nEvents, self.H.fSample, self.H.dataType, bufsize) = struct.unpack('IIIfII', payload[0:24])
-                    response = struct.pack('HHI', VERSION, PUT_OK, 0)
-                    sock.send(response)
-
-                elif command == PUT_DAT:
-                    if self.H != None:
-                        (nchans, nsamples, data_type, bufsize) = struct.unpack('IIII', payload[0:16])
-                        if nchans != self.H.nChannels:
-                            raise RuntimeError('Incorrect number of channels')
-                        if data_type != self.H.dataType:
-                            raise RuntimeError('Incorrect data type')
-                        if self.D == None:
-                            nbytes = int(self.H.nChannels * self.H.fSample * self.length * wordSize[self.H.dataType])
-                            self.D = RingBuffer.RingBuffer(nbytes)
-                            print('Initialized ring buffer with %d bytes' % nbytes)
-                        self.D.append(payload[16:])
-                        self.H.nSamples += nsamples
-                        response = struct.pack('HHI', VERSION, PUT_OK, 0)
-                    else:
-                        response = struct.pack('HHI', VERSION, PUT_ERR, 0)
-                    # send the response to PUT_DAT
-                    sock.send(response)
 
-                elif command == PUT_EVT:
-                    print('PUT_EVT not implemented')
+    def payloadlimit(self, data, command):
+        """
+        Return the largest payload that is accepted for a request. The samples of PUT_DAT
+        can fill the ring buffer of the selected stream, compressed samples can be slightly
+        larger than uncompressed ones.
+        """
+        buf = data.buffer
+        if (command == PUT_DAT or command == PUT_DAT_NORESPONSE) and buf.H != None and buf.H.dataType < len(wordSize):
+            nbytes = max(1, int(buf.H.fSample * self.length)) * buf.H.nChannels * wordSize[buf.H.dataType]
+            return max(self.maxrequest, 16 + nbytes + nbytes // 100 + 1024)
+        return self.maxrequest
+
+
+    def reject(self, sock, data, command):
+        """Answer a request that cannot be handled with an error and close the connection."""
+        if command in commandName:
+            # the error code of each group of commands ends in 05, e.g. PUT_ERR and GET_ERR
+            response = struct.pack('HHI', VERSION, (command & 0xFF00) | 0x05, 0)
+        else:
+            response = struct.pack('HHI', VERSION, 0, 0)
+        if command not in (PUT_HDR_NORESPONSE, PUT_DAT_NORESPONSE, PUT_EVT_NORESPONSE):
+            self.respond(sock, data, response)
+        self.close_connection(sock, data)
+
+
+    def handle(self, sock, data, command, payload):
+        """Handle a request and keep track of the statistics."""
+        bytesout = data.bytesout
+        start = time.perf_counter()
+        self.handle_request(sock, data, command, payload)
+        elapsed = time.perf_counter() - start
+
+        if command not in self.commands:
+            self.commands[command] = types.SimpleNamespace(requests=0, bytesin=0, bytesout=0, time=0., histogram=[0] * (len(self.histogram) + 1))
+        stats = self.commands[command]
+        stats.requests += 1
+        stats.bytesin += 8 + len(payload)
+        stats.bytesout += data.bytesout - bytesout
+        stats.time += elapsed
+        stats.histogram[bisect.bisect(self.histogram, elapsed)] += 1
+        data.requests += 1
+
+
+    def statistics(self):
+        """Return the statistics of the server as a dictionary."""
+        stats = {}
+        stats['uptime'] = time.time() - self.started
+        stats['accepted'] = self.accepted
+        stats['connections'] = len(self.open)
+        stats['waiting'] = len(self.waiting)
+        stats['streaming'] = len(self.streaming)
+        stats['streams'] = {}
+        for name, buf in self.buffers.items():
+            stats['streams'][name] = bufstats = {}
+            if buf.H != None:
+                bufstats['samples'] = buf.H.nSamples
+                bufstats['events'] = buf.H.nEvents
+            if buf.D != None:
+                # the number of samples that have been overwritten tells how much a slow client may have missed
+                (begsample, endsample) = buf.D.available()
+                bufstats['ring'] = {'length': buf.D.length, 'fill': (endsample - begsample) / buf.D.length, 'overwritten': begsample}
+            if buf.E != None:
+                bufstats['eventring'] = {'length': buf.E.length, 'fill': len(buf.E.events) / buf.E.length, 'overwritten': buf.E.count - len(buf.E.events)}
+        stats['histogram'] = self.histogram
+        stats['commands'] = {}
+        for command, cmdstats in self.commands.items():
+            stats['commands'][commandName.get(command, str(command))] = vars(cmdstats)
+        stats['connection'] = []
+        for sock, data in self.open.items():
+            stats['connection'].append({'address': str(data.addr), 'requests': data.requests, 'bytesin': data.bytesin, 'bytesout': data.bytesout, 'queued': self.queued(data), 'maxqueued': data.maxqueued})
+        return stats
+
+
+    def handle_request(self, sock, data, command, payload):
+        bufsize = len(payload)
+        buf = data.buffer   # the stream that the connection has selected
+
+        if command == PUT_HDR or command == PUT_HDR_NORESPONSE:
+            buf.H = Header()
+            self.flush_data(buf)
+            buf.E = None  # this flushes the events
+            (buf.H.nChannels, buf.H.nSamples, buf.H.nEvents, buf.H.fSample, buf.H.dataType, bufsize) = struct.unpack('IIIfII', payload[0:24])
+            buf.chunks = bytes(payload[24:24+bufsize])
+            buf.version += 1
+            response = struct.pack('HHI', VERSION, PUT_OK, 0)
+            # send the response to PUT_HDR
+            if command == PUT_HDR:
+                self.respond(sock, data, response)
+            # the subscribers cannot continue with the new header
+            self.stop_streaming(buf)
+
+        elif command == PUT_DAT or command == PUT_DAT_NORESPONSE:
+            samples = None
+            if buf.H != None and bufsize >= 16:
+                (nchans, nsamples, data_type, nbytes) = struct.unpack('IIII', payload[0:16])
+                if nchans != buf.H.nChannels or data_type != buf.H.dataType or data_type >= len(numpyType) or nbytes != bufsize - 16:
+                    # this is answered with an error, it should not stop the server
+                    print('Incorrect number of channels, data type or number of bytes')
+                elif data.compression:
+                    try:
+                        samples = decompress(memoryview(payload)[16:], nsamples, nchans, numpyType[data_type], data.compression)
+                    except Exception:
+                        samples = None
+                elif nbytes == nchans * nsamples * wordSize[data_type]:
+                    samples = memoryview(payload)[16:]
+            if samples is None:
+                # the header is missing or the data does not match its description
+                response = struct.pack('HHI', VERSION, PUT_ERR, 0)
+            else:
+                if buf.D == None:
+                    length = int(buf.H.fSample * self.length)
+                    filename = self.buffer_filename(buf.name)
+                    buf.D = RingBuffer.RingBuffer(length, buf.H.nChannels, numpyType[buf.H.dataType], filename=filename)
+                    if filename is None:
+                        print('Initialized ring buffer with %d samples and %d bytes' % (length, buf.D.buffer.nbytes))
+                    else:
+                        print('Initialized ring buffer with %d samples and %d bytes in %s' % (length, buf.D.buffer.nbytes, filename))
+                buf.D.append(samples)
+                buf.H.nSamples += nsamples
+                response = struct.pack('HHI', VERSION, PUT_OK, 0)
+            # send the response to PUT_DAT
+            if command == PUT_DAT:
+                self.respond(sock, data, response)
+            # this may satisfy clients that are waiting for data
+            self.release_waiting()
+            # push the new samples to the subscribers
+            for conn, conndata in list(self.streaming.items()):
+                if conndata.stream.buffer is buf:
+                    self.push_samples(conn, conndata)
+
+        elif command == PUT_EVT or command == PUT_EVT_NORESPONSE:
+            if buf.H != None:
+                if buf.E == None:
+                    buf.E = EventBuffer(self.eventlength)
+                try:
+                    buf.H.nEvents += buf.E.append(payload)
+                    response = struct.pack('HHI', VERSION, PUT_OK, 0)
+                except Exception:
                     response = struct.pack('HHI', VERSION, PUT_ERR, 0)
-                    sock.send(response)
+            else:
+                response = struct.pack('HHI', VERSION, PUT_ERR, 0)
+            # send the response to PUT_EVT
+            if command == PUT_EVT:
+                self.respond(sock, data, response)
+            # this may satisfy clients that are waiting for events
+            self.release_waiting()
+
+        elif command == GET_HDR:
+            if buf.H != None:
+                response = struct.pack('HHI', VERSION, GET_OK, 24 + len(buf.chunks))
+                response += struct.pack('IIIfII', buf.H.nChannels, buf.H.nSamples, buf.H.nEvents, buf.H.fSample, buf.H.dataType, len(buf.chunks))
+                response += buf.chunks
+            else:
+                response = struct.pack('HHI', VERSION, GET_ERR, 0)
+            # send the response to GET_HDR
+            self.respond(sock, data, response)
 
-                elif command == GET_HDR:
-                    if self.H != None:
-                        response = struct.pack('HHI', VERSION, GET_OK, 24)
-                        response += struct.pack('IIIfII', self.H.nChannels, self.H.nSamples, self.H.nEvents, self.H.fSample, self.H.dataType, 0)
-                    else:
-                        response = struct.pack('HHI', VERSION, GET_ERR, 0)
-                    # send the response to GET_HDR
-                    sock.send(response)
-
-                elif command == GET_DAT:
-                    if self.H != None and self.D != None and bufsize == 8:
-                        (begsample, endsample) = struct.unpack('II', payload[0:8]) # this uses inclusive, zero-based start/end indices
-                        begbyte = int(begsample * self.H.nChannels * wordSize[self.H.dataType])
-                        endbyte = int((endsample+1) * self.H.nChannels * wordSize[self.H.dataType])
-                        nbytes = endbyte - begbyte
-                        try:
-                            response = struct.pack('HHI', VERSION, GET_OK, nbytes+16)
-                            response += struct.pack('IIII', self.H.nChannels, endsample-begsample+1, self.H.dataType, nbytes)
-                            response += self.D.read(begbyte, endbyte) # this uses exclusive, zer0-based start/end indices
-                        except Exception as e:
-                            response = struct.pack('HHI', VERSION, GET_ERR, 0)
+        elif command == GET_DAT:
+            if buf.H != None and buf.D != None and (bufsize == 8 or bufsize >= 20):
+                (begsample, endsample) = struct.unpack('II', payload[0:8]) # this uses inclusive, zero-based start/end indices
+                try:
+                    if bufsize == 8:
+                        dat = buf.D.read(begsample, endsample+1) # this uses exclusive, zero-based start/end indices
                     else:
-                        response = struct.pack('HHI', VERSION, GET_ERR, 0)
-                    # send the response to GET_DAT
-                    sock.send(response)
-
-                elif command == GET_EVT:
-                    print('GET_EVT not implemented')
+                        # the extended request also specifies the decimation and the channel selection
+                        (step, method, nchans) = struct.unpack('III', payload[8:20])
+                        if bufsize != 20 + 4 * nchans:
+                            raise RuntimeError('Invalid request')
+                        channels = list(struct.unpack('%dI' % nchans, payload[20:]))
+                        if any([chan >= buf.H.nChannels for chan in channels]):
+                            raise RuntimeError('Invalid channel selection')
+                        dat = buf.D.read(begsample, endsample+1, channels=channels or None)
+                        dat = decimate(dat, step, method)
+                    (nsamples, nchans) = dat.shape
+                    if data.compression:
+                        dat = compress(dat, data.compression, data.level)
+                    response = struct.pack('HHI', VERSION, GET_OK, len(memoryview(dat).cast('B'))+16)
+                    response += struct.pack('IIII', nchans, nsamples, buf.H.dataType, len(memoryview(dat).cast('B')))
+                except Exception:
+                    dat = b''
                     response = struct.pack('HHI', VERSION, GET_ERR, 0)
-                    sock.send(response)
-
-                elif command == FLUSH_HDR:
-                    if self.H != None:
-                        self.H = None
-                        self.D = None  # this also flushes the data
-                        self.E = None  # this also flushes the events
-                        response = struct.pack('HHI', VERSION, FLUSH_OK, 0)
-                    else:
-                        response = struct.pack('HHI', VERSION, FLUSH_ERR, 0)
-                    # send the response to FLUSH_HDR
-                    sock.send(response)
-
-                elif command == FLUSH_DAT:
-                    if self.D != None:
-                        self.D = None
-                        response = struct.pack('HHI', VERSION, FLUSH_OK, 0)
-                    else:
-                        response = struct.pack('HHI', VERSION, FLUSH_ERR, 0)
-                    # send the response to FLUSH_DAT
-                    sock.send(response)
-
-                elif command == FLUSH_EVT:
-                    if E != None:
-                        E = None
-                        response = struct.pack('HHI', VERSION, FLUSH_OK, 0)
-                    else:
-                        response = struct.pack('HHI', VERSION, FLUSH_ERR, 0)
-                    # send the response to FLUSH_EVT
-                    sock.send(response)
-
-                elif command == WAIT_DAT:
-                    if self.H != None and bufsize == 12:
-                        (nsamples, nevents, timeout) = struct.unpack('III', payload[0:12])
-                        timeout /= 1000.0  # in seconds
-                        start = time.time()
-                        response = struct.pack('HHI', VERSION, WAIT_ERR, 0)
-                        while time.time() < (start + timeout):
-                            if self.H.nSamples >= nsamples or self.H.nEvents >= nevents:
-                                response = struct.pack('HHI', VERSION, WAIT_OK, 8)
-                                response += struct.pack('II', self.H.nSamples, self.H.nEvents)
-                                break
-                            else:
-                                time.sleep(0.010)
+            else:
+                dat = b''
+                response = struct.pack('HHI', VERSION, GET_ERR, 0)
+            # send the response to GET_DAT, the samples are sent without copying them
+            self.respond(sock, data, response, dat)
+
+        elif command == GET_EVT:
+            if buf.H != None and buf.E != None and buf.E.count > 0 and (bufsize == 0 or bufsize == 8 or bufsize == 12):
+                if bufsize == 0:
+                    (begevent, endevent, selection) = (buf.E.count - len(buf.E.events), buf.E.count - 1, EVENTS_BY_NUMBER)
+                elif bufsize == 8:
+                    (begevent, endevent, selection) = struct.unpack('II', payload[0:8]) + (EVENTS_BY_NUMBER,) # this uses inclusive, zero-based start/end indices
+                else:
+                    # the extended request also specifies whether the range is in events or in samples
+                    (begevent, endevent, selection) = struct.unpack('III', payload[0:12])
+                try:
+                    if selection == EVENTS_BY_SAMPLE:
+                        events = buf.E.select(begevent, endevent)
                     else:
-                        response = struct.pack('HHI', VERSION, WAIT_ERR, 0)
-                    # send the response to WAIT_DAT
-                    sock.send(response)
-
+                        events = buf.E.read(begevent, endevent)
+                    response = struct.pack('HHI', VERSION, GET_OK, len(events))
+                    response += events
+                except Exception:
+                    response = struct.pack('HHI', VERSION, GET_ERR, 0)
+            else:
+                response = struct.pack('HHI', VERSION, GET_ERR, 0)
+            # send the response to GET_EVT
+            self.respond(sock, data, response)
+
+        elif command == FLUSH_HDR:
+            if buf.H != None:
+                buf.H = None
+                self.flush_data(buf)
+                buf.E = None  # this also flushes the events
+                buf.chunks = b''
+                buf.version += 1
+                response = struct.pack('HHI', VERSION, FLUSH_OK, 0)
+            else:
+                response = struct.pack('HHI', VERSION, FLUSH_ERR, 0)
+            # send the response to FLUSH_HDR
+            self.respond(sock, data, response)
+            # clients that are waiting for data can stop waiting
+            self.release_waiting()
+            self.stop_streaming(buf)
+
+        elif command == FLUSH_DAT:
+            if buf.D != None:
+                self.flush_data(buf)
+                response = struct.pack('HHI', VERSION, FLUSH_OK, 0)
+            else:
+                response = struct.pack('HHI', VERSION, FLUSH_ERR, 0)
+            # send the response to FLUSH_DAT
+            self.respond(sock, data, response)
+            self.stop_streaming(buf)
+
+        elif command == FLUSH_EVT:
+            if buf.E != None:
+                buf.E = None
+                buf.H.nEvents = 0
+                response = struct.pack('HHI', VERSION, FLUSH_OK, 0)
+            else:
+                response = struct.pack('HHI', VERSION, FLUSH_ERR, 0)
+            # send the response to FLUSH_EVT
+            self.respond(sock, data, response)
+
+        elif command == WAIT_DAT:
+            if buf.H != None and (bufsize == 12 or bufsize == 16):
+                # this is answered as soon as the number of samples or events exceeds the threshold
+                # after the timeout it is answered with the current number of samples and events
+                # the extended request with 16 bytes is also answered with the version of the header
+                (nsamples, nevents, timeout) = struct.unpack('III', payload[0:12])
+                if buf.H.nSamples > nsamples or buf.H.nEvents > nevents or timeout == 0:
+                    self.respond(sock, data, self.wait_response(buf, bufsize == 16))
                 else:
-                    # unrecognized command
-                    print('Command not implemented')
-                    response = struct.pack('HHI', VERSION, 0, 0)
-                    sock.send(response)
+                    # further requests on this connection are not processed until the wait is over
+                    data.wait = (nsamples, nevents, time.time() + timeout / 1000.0, bufsize == 16)
+                    self.waiting[sock] = data
+            else:
+                response = struct.pack('HHI', VERSION, WAIT_ERR, 0)
+                # send the response to WAIT_DAT
+                self.respond(sock, data, response)
+
+        elif command == GET_STATS:
+            stats = json.dumps(self.statistics()).encode('utf-8')
+            response = struct.pack('HHI', VERSION, GET_OK, len(stats))
+            response += stats
+            # send the response to GET_STATS
+            self.respond(sock, data, response)
+
+        elif command == COMPRESS_DAT:
+            if self.compression and bufsize == 8:
+                (method, level) = struct.unpack('Ii', payload[0:8])
+            else:
+                (method, level) = (None, None)
+            if method in (COMPRESSION_NONE, COMPRESSION_SHUFFLE, COMPRESSION_DELTA) and (level == -1 or 0 <= level <= 9):
+                # the samples on this connection are compressed from now on
+                data.compression = method
+                data.level = level
+                response = struct.pack('HHI', VERSION, COMPRESS_OK, 0)
+            else:
+                response = struct.pack('HHI', VERSION, COMPRESS_ERR, 0)
+            self.respond(sock, data, response)
 
+        elif command == SELECT_STREAM:
+            try:
+                name = bytes(payload).decode('utf-8') or 'default'
+            except UnicodeDecodeError:
+                name = None
+            if name is None or not STREAM_NAME.match(name):
+                print('Invalid stream name')
+                response = struct.pack('HHI', VERSION, SELECT_ERR, 0)
+            elif name not in self.buffers and len(self.buffers) >= self.maxstreams:
+                print('Too many streams')
+                response = struct.pack('HHI', VERSION, SELECT_ERR, 0)
             else:
-                print(f'Closing connection to {data.addr}')
-                self.sel.unregister(sock)
-                sock.close()
+                if name not in self.buffers:
+                    self.buffers[name] = Buffer(name)
+                # the subsequent requests on this connection apply to the selected stream
+                data.buffer = self.buffers[name]
+                response = struct.pack('HHI', VERSION, SELECT_OK, 0)
+            self.respond(sock, data, response)
+
+        elif command == STREAM_DAT:
+            if bufsize == 0:
+                # an empty request ends the subscription
+                data.stream = None
+                self.streaming.pop(sock, None)
+                response = struct.pack('HHI', VERSION, STREAM_OK, 0)
+                self.respond(sock, data, response)
+            elif buf.H != None and bufsize == 12:
+                # this uses a zero-based start index, a negative one means the current end of the data
+                (begsample, blocksize, stepsize) = struct.unpack('iII', payload[0:12])
+                if begsample < 0:
+                    begsample = buf.H.nSamples
+                if stepsize == 0:
+                    stepsize = blocksize
+                data.stream = types.SimpleNamespace(buffer=buf, next=begsample, blocksize=blocksize, stepsize=stepsize)
+                self.streaming[sock] = data
+                response = struct.pack('HHI', VERSION, STREAM_OK, 4)
+                response += struct.pack('I', begsample)
+                self.respond(sock, data, response)
+                # push the samples that are already available
+                self.push_samples(sock, data)
+            else:
+                response = struct.pack('HHI', VERSION, STREAM_ERR, 0)
+                self.respond(sock, data, response)
+
+        else:
+            # unrecognized command
+            print('Command not implemented')
+            response = struct.pack('HHI', VERSION, 0, 0)
+            self.respond(sock, data, response)
+
+
+    def respond(self, sock, data, *response):
+        """
+        Send the response to a request, which can consist of multiple parts. Whatever
+        cannot be sent immediately is copied into a queue and sent once the socket
+        becomes writable.
+        """
+        if data.closed:
+            return
+        response = [memoryview(part).cast('B') for part in response]
+        data.bytesout += sum([len(part) for part in response])
+        if data.outb:
+            # preserve the order of the responses
+            for part in response:
+                data.outb += part
+            return
+        try:
+            if len(response) > 1 and hasattr(sock, 'sendmsg'):
+                nbytes = sock.sendmsg(response)
+            else:
+                nbytes = sock.send(b''.join(response))
+        except BlockingIOError:
+            nbytes = 0
+        except OSError:
+            if self.keepalive:
+                print('Cannot send response.')
+                self.close_connection(sock, data)
+                return
+            else:
+                raise IOError('Cannot send response.')
+        for part in response:
+            if nbytes >= len(part):
+                nbytes -= len(part)
+            else:
+                data.outb += part[nbytes:]
+                nbytes = 0
+        if data.outb:
+            data.maxqueued = max(data.maxqueued, len(data.outb))
+            self.sel.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, data=data)
+
+
+    def queued(self, data):
+        """Return the number of bytes that are queued to be sent on a connection."""
+        return len(data.outb)
+
+
+    def send_queued(self, sock, data):
+        """Send the queued responses when the socket is writable."""
+        try:
+            nbytes = sock.send(data.outb)
+        except BlockingIOError:
+            nbytes = 0
+        except OSError:
+            if self.keepalive:
+                print('Cannot send response.')
+                self.close_connection(sock, data)
+                return
+            else:
+                raise IOError('Cannot send response.')
+        del data.outb[0:nbytes]
+        if not data.outb:
+            self.sel.modify(sock, selectors.EVENT_READ, data=data)
+            if data.stream is not None:
+                # continue with the samples that were held back
+                self.push_samples(sock, data)
+
+
+    def push_samples(self, sock, data):
+        """
+        Send the available samples to a subscriber as STREAM_DAT messages, which
+        consist of the first sample followed by the data definition and the samples.
+        Nothing is pushed while the responses to a slow subscriber are piling up, if
+        it falls behind the ring buffer it skips ahead to the oldest available sample.
+        """
+        stream = data.stream
+        buf = stream.buffer
+        if buf.D == None:
+            return
+        (begavailable, endavailable) = buf.D.available()
+        while self.queued(data) < self.maxqueue and not data.closed:
+            if stream.next < begavailable:
+                stream.next = begavailable
+            if stream.blocksize == 0:
+                endsample = endavailable
+                if endsample <= stream.next:
+                    break
+            else:
+                endsample = stream.next + stream.blocksize
+                if endsample > endavailable:
+                    break
+            dat = buf.D.read(stream.next, endsample)
+            nsamples = dat.shape[0]
+            if data.compression:
+                dat = compress(dat, data.compression, data.level)
+            nbytes = len(memoryview(dat).cast('B'))
+            response = struct.pack('HHI', VERSION, STREAM_DAT, nbytes+20)
+            response += struct.pack('IIIII', stream.next, buf.H.nChannels, nsamples, buf.H.dataType, nbytes)
+            self.respond(sock, data, response, dat)
+            if stream.blocksize == 0:
+                stream.next = endsample
+            else:
+                stream.next += stream.stepsize
+
+
+    def stop_streaming(self, buf):
+        """End all subscriptions to a stream, this is needed when its header or data is flushed."""
+        for sock, data in list(self.streaming.items()):
+            if data.stream.buffer is buf:
+                data.stream = None
+                del self.streaming[sock]
+                response = struct.pack('HHI', VERSION, STREAM_ERR, 0)
+                self.respond(sock, data, response)
+
+
+    def wait_response(self, buf, extended=False):
+        """Return the response to WAIT_DAT, optionally including the version of the header."""
+        if extended:
+            response = struct.pack('HHI', VERSION, WAIT_OK, 12)
+            response += struct.pack('III', buf.H.nSamples, buf.H.nEvents, buf.version)
+        else:
+            response = struct.pack('HHI', VERSION, WAIT_OK, 8)
+            response += struct.pack('II', buf.H.nSamples, buf.H.nEvents)
+        return response
+
+
+    def release_waiting(self):
+        """
+        Answer the pending WAIT_DAT requests for which the threshold has been exceeded
+        or the timeout has passed. Requests that were received on the same connection
+        in the mean time are handled afterwards.
+        """
+        now = time.time()
+        for sock, data in list(self.waiting.items()):
+            (nsamples, nevents, deadline, extended) = data.wait
+            buf = data.buffer
+            if buf.H == None:
+                # the header has been flushed while waiting
+                response = struct.pack('HHI', VERSION, WAIT_ERR, 0)
+            elif buf.H.nSamples > nsamples or buf.H.nEvents > nevents or now >= deadline:
+                response = self.wait_response(buf, extended)
+            else:
+                continue
+            data.wait = None
+            del self.waiting[sock]
+            # send the response to WAIT_DAT
+            self.respond(sock, data, response)
+            if data.inb or data.body is not None:
+                self.resumed[sock] = data
+
+
+    def deadline(self):
+        """Return the time at which the first pending WAIT_DAT request times out, or None."""
+        if self.waiting:
+            return min([data.wait[2] for data in self.waiting.values()])
+        return None
+
+
+    def dispatch(self, key, mask):
+        """Handle an event on one of the sockets of this server."""
+        if key.data is self:
+            self.accept_wrapper(key.fileobj)
+        else:
+            self.service_request(key, mask)
+
+
+    def finish(self):
+        """Deal with the timed-out and resumed requests after the sockets have been serviced."""
+        # answer the pending WAIT_DAT requests that have timed out
+        if self.waiting:
+            self.release_waiting()
+
+        # continue with the requests that were received during a WAIT_DAT
+        while self.resumed:
+            sock, data = self.resumed.popitem()
+            self.process_requests(sock, data)
 
 
     def loop(self):
@@ -796,10 +2527,358 @@ class Server():
             else:
                 raise RuntimeError('Not connected.')
 
-        # the timeout is used to return control to the main loop once in a while
-        events = self.sel.select(timeout = self.timeout)
-        for key, mask in events:
-            if key.data is None:
-                self.accept_wrapper(key.fileobj)
+        loop([self], self.timeout)
+
+
+def loop(servers, timeout=1):
+    """
+    loop(servers [, timeout]) -- serve one or multiple servers that share a selector.
+    This blocks until any of their sockets is ready, until a pending WAIT_DAT request
+    times out, or until the timeout in seconds has passed. A timeout of None blocks
+    until there is something to do.
+    """
+    servers = [server for server in servers if server.isConnected]
+    if not servers:
+        return
+
+    # the timeout is used to return control to the main loop once in a while
+    # it is shortened when a pending WAIT_DAT request is about to time out
+    deadlines = [server.deadline() for server in servers if server.waiting]
+    if deadlines:
+        remaining = max(0, min(deadlines) - time.time())
+        if timeout is None or remaining < timeout:
+            timeout = remaining
+
+    sel = set([server.sel for server in servers])
+    if len(sel) > 1:
+        raise RuntimeError('The servers do not share the same selector.')
+
+    events = sel.pop().select(timeout = timeout)
+    for key, mask in events:
+        if isinstance(key.data, Server):
+            key.data.dispatch(key, mask)
+        else:
+            key.data.server.dispatch(key, mask)
+
+    for server in servers:
+        server.finish()
+
+
+##########################################################################################
+# Classes for asyncio
+##########################################################################################
+
+
+class AsyncClient:
+    """
+    Class for managing a client connection to a FieldTrip buffer server with asyncio.
+    The requests on a single connection are handled one after the other, use
+    multiple clients to have multiple requests outstanding at the same time.
+    """
+
+    def __init__(self):
+        self.isConnected = False
+        self.reader = None
+        self.writer = None
+        self.lock = None
+
+    async def connect(self, hostname, port=1972):
+        """connect(hostname [, port]) -- make a connection, default port is 1972."""
+
+        self.reader, self.writer = await asyncio.open_connection(hostname, port)
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock = asyncio.Lock()
+        self.isConnected = True
+
+    async def disconnect(self):
+        """disconnect() -- close a connection."""
+
+        if self.isConnected:
+            self.isConnected = False
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+
+    async def select(self, name):
+        """select(name) -- select the named stream that the subsequent requests apply to."""
+
+        payload = name.encode('utf-8')
+        (status, bufsize, resp_buf) = await self.request(struct.pack('HHI', VERSION, SELECT_STREAM, len(payload)), payload)
+        if status != SELECT_OK:
+            raise IOError('Stream could not be selected')
+
+    async def request(self, *parts, response=True):
+        """
+        Send a request that can consist of multiple parts and return the response
+        as (status,bufsize,payload).
+        """
+
+        if not(self.isConnected):
+            raise IOError('Not connected to FieldTrip buffer')
+
+        async with self.lock:
+            for part in parts:
+                self.writer.write(part)
+            await self.writer.drain()
+            if not response:
+                return (None, 0, None)
+            try:
+                (version, command, bufsize) = struct.unpack('HHI', await self.reader.readexactly(8))
+                if version != VERSION:
+                    await self.disconnect()
+                    raise IOError('Bad response from buffer server - disconnecting')
+                payload = await self.reader.readexactly(bufsize)
+            except asyncio.IncompleteReadError:
+                await self.disconnect()
+                raise IOError('Connection closed by buffer server')
+        return (command, bufsize, payload)
+
+    async def get_header(self):
+        """get_header() -- grabs header information from the buffer an returns it as a Header object."""
+
+        (status, bufsize, payload) = await self.request(struct.pack('HHI', VERSION, GET_HDR, 0))
+
+        if status == GET_ERR:
+            return None
+        if status != GET_OK or bufsize < 24:
+            raise IOError('Invalid HEADER packet received')
+        return deserializeHeader(payload)
+
+    async def put_header(self, nChannels, fSample, dataType, labels=None, chunks=None, response=True):
+        payload = serializeHeader(nChannels, fSample, dataType, labels, chunks)
+        command = PUT_HDR if response else PUT_HDR_NORESPONSE
+        (status, bufsize, payload) = await self.request(struct.pack('HHI', VERSION, command, len(payload)), payload, response=response)
+        if response and status != PUT_OK:
+            raise IOError('Header could not be written')
+
+    async def get_data(self, index=None, dtype=None, channels=None, step=1, decimation=DECIMATE_STRIDE):
+        """
+        get_data([indices]) -- retrieve data samples and return them as a Numpy array,
+        samples in rows(!). The optional arguments are the same as for Client.getData().
+        """
+
+        (status, bufsize, payload) = await self.request(dataRequest(index, channels, step, decimation))
+
+        if status == GET_ERR:
+            return None
+        if status != GET_OK or bufsize < 16:
+            raise IOError('Invalid DATA packet received')
+
+        (nchans, nsamp, datype, bfsiz) = struct.unpack('IIII', payload[0:16])
+        if bfsiz > bufsize - 16 or datype >= len(numpyType) or bfsiz != nchans * nsamp * wordSize[datype]:
+            raise IOError('Invalid DATA packet received')
+
+        D = numpy.frombuffer(payload, dtype=numpyType[datype], count=nchans*nsamp, offset=16).reshape(nsamp, nchans)
+        if index is not None and (channels is not None or step > 1):
+            (expectedsamp, expectedchans) = dataShape(index, channels, step, decimation)
+            if nsamp != expectedsamp or (expectedchans is not None and nchans != expectedchans):
+                # the server ignored the extended request and returned all channels and samples
+                if channels:
+                    D = D[:, channels]
+                D = decimate(D, step, decimation)
+        # this returns a writeable copy
+        return numpy.array(D, dtype=dtype)
+
+    async def put_data(self, D, response=True):
+        """
+        put_data(D) -- writes samples that must be given as a NUMPY array,
+        samples x channels.
+        """
+
+        if not(isinstance(D, numpy.ndarray)) or len(D.shape) != 2:
+            raise ValueError('Data must be given as a NUMPY array (samples x channels)')
+
+        datatype = dataType.get(D.dtype, DATATYPE_UNKNOWN)
+        if datatype == DATATYPE_UNKNOWN:
+            raise ValueError('Data type %s is not supported' % D.dtype)
+
+        nSamp = D.shape[0]
+        nChan = D.shape[1]
+        D = numpy.ascontiguousarray(D)
+        command = PUT_DAT if response else PUT_DAT_NORESPONSE
+
+        request = struct.pack('HHIIIII', VERSION, command, 16 + D.nbytes, nChan, nSamp, datatype, D.nbytes)
+        if not response:
+            # the array could be changed by the caller before it has been sent
+            D = D.tobytes()
+        (status, bufsize, payload) = await self.request(request, memoryview(D).cast('B'), response=response)
+        if response and status != PUT_OK:
+            raise IOError('Samples could not be written.')
+
+    async def get_events(self, index=None, samples=None):
+        """
+        get_events([indices]) -- retrieve events and return them as a list of Event objects.
+        The optional arguments are the same as for Client.getEvents().
+        """
+
+        if samples is not None:
+            request = struct.pack('HHIIII', VERSION, GET_EVT, 12, int(samples[0]), int(samples[1]), EVENTS_BY_SAMPLE)
+        elif index is None:
+            request = struct.pack('HHI', VERSION, GET_EVT, 0)
+        else:
+            request = struct.pack('HHIII', VERSION, GET_EVT, 8, int(index[0]), int(index[1]))
+        (status, bufsize, payload) = await self.request(request)
+        if status == GET_ERR and samples is not None:
+            # the server may not support the extended request, select the events here
+            return [e for e in await self.get_events() if e.sample >= samples[0] and e.sample <= samples[1]]
+        if status == GET_ERR or bufsize == 0:
+            return []
+        if status != GET_OK:
+            raise IOError('Bad response from buffer server')
+        return deserializeEvents(payload)
+
+    async def put_events(self, E, response=True):
+        """put_events(E) -- writes a single event, or a list of events."""
+
+        buf = serializeEvents(E)
+        command = PUT_EVT if response else PUT_EVT_NORESPONSE
+        (status, bufsize, payload) = await self.request(struct.pack('HHI', VERSION, command, len(buf)), buf, response=response)
+        if response and status != PUT_OK:
+            raise IOError('Events could not be written.')
+
+    async def poll(self):
+        return await self.wait(0, 0, 0)
+
+    async def wait(self, nsamples, nevents, timeout):
+        """
+        wait(nsamples, nevents, timeout) -- wait until the number of samples or events exceeds
+        the threshold, or until the timeout in milliseconds has passed. This returns the current
+        number of samples and events.
+        """
+
+        request = struct.pack('HHIIII', VERSION, WAIT_DAT, 12, int(nsamples), int(nevents), int(timeout))
+        (status, bufsize, payload) = await self.request(request)
+        if status != WAIT_OK or bufsize < 8:
+            raise IOError('Wait request failed.')
+        return struct.unpack('II', payload[0:8])
+
+
+class AsyncConnection(asyncio.Protocol):
+    """Protocol that passes the requests on a connection to the AsyncServer."""
+
+    def __init__(self, server):
+        self.server = server
+        self.data = None
+
+    def connection_made(self, transport):
+        self.data = self.server.accept_connection(self, transport)
+
+    def data_received(self, message):
+        self.server.receive(self, self.data, message)
+
+    def connection_lost(self, exc):
+        self.server.close_connection(self, self.data)
+
+    def resume_writing(self):
+        if self.data.stream is not None:
+            # continue with the samples that were held back
+            self.server.push_samples(self, self.data)
+
+
+class AsyncServer(Server):
+    """
+    Class for a FieldTrip buffer server that runs in an asyncio event loop. It handles
+    the requests in the same way as the Server class.
+    """
+
+    def __init__(self):
+        Server.__init__(self)
+        self.aserver = None
+        self.timer = None       # this fires when the first pending WAIT_DAT request times out
+
+    async def connect(self, hostname='localhost', port=1972):
+        if self.isConnected:
+            if self.keepalive:
+                print('Already connected.')
+                return
             else:
-                self.service_request(key, mask)
+                raise RuntimeError('Already connected.')
+
+        loop = asyncio.get_running_loop()
+        self.aserver = await loop.create_server(lambda: AsyncConnection(self), hostname, port, reuse_address=True)
+        print(f'Listening on {(hostname, port)}')
+        self.isConnected = True
+
+    async def serve_forever(self):
+        await self.aserver.serve_forever()
+
+    async def disconnect(self):
+        if not self.isConnected:
+            if self.keepalive:
+                print('Not connected.')
+                return
+            else:
+                raise RuntimeError('Not connected.')
+
+        self.aserver.close()
+        for sock, data in list(self.open.items()):
+            self.close_connection(sock, data)
+        await self.aserver.wait_closed()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        # make sure that the memory-mapped files are complete
+        self.flush_files()
+        self.aserver = None
+        self.isConnected = False
+
+    def accept_connection(self, sock, transport):
+        addr = transport.get_extra_info('peername')
+        print(f'Accepted connection from {addr}')
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.new_connection(sock, addr, transport=transport)
+
+    def receive(self, sock, data, message):
+        """Handle the bytes that were received on a connection."""
+        data.bytesin += len(message)
+        if data.body is not None:
+            # the remainder of a large payload is copied into its final buffer
+            nbytes = min(len(message), len(data.body) - data.nread)
+            data.body[data.nread:data.nread+nbytes] = message[0:nbytes]
+            data.nread += nbytes
+            data.inb += message[nbytes:]
+        else:
+            data.inb += message
+        self.process_requests(sock, data)
+        self.finish()
+        self.schedule()
+
+    def schedule(self):
+        """Make sure that the first pending WAIT_DAT request is answered when it times out."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        deadline = self.deadline()
+        if deadline is not None:
+            self.timer = asyncio.get_running_loop().call_later(max(0, deadline - time.time()), self.expire)
+
+    def expire(self):
+        self.timer = None
+        self.finish()
+        self.schedule()
+
+    def close_connection(self, sock, data):
+        if data.closed:
+            return
+        print(f'Closing connection to {data.addr}')
+        data.closed = True
+        self.open.pop(sock, None)
+        self.waiting.pop(sock, None)
+        self.resumed.pop(sock, None)
+        self.streaming.pop(sock, None)
+        data.transport.close()
+
+    def respond(self, sock, data, *response):
+        """Send the response to a request, the transport takes care of what cannot be sent immediately."""
+        if data.closed:
+            return
+        # the samples are copied, as the ring buffer could be overwritten before they are sent
+        response = b''.join([memoryview(part).cast('B') for part in response])
+        data.bytesout += len(response)
+        data.transport.write(response)
+        data.maxqueued = max(data.maxqueued, data.transport.get_write_buffer_size())
+
+    def queued(self, data):
+        return data.transport.get_write_buffer_size()
@@ -0,0 +1,73 @@
+import FieldTrip
+import numpy as np
+import threading
+import time
+
+# This compares the throughput and the CPU cost of writing and reading data with and
+# without compression over the loopback interface. Since loopback is fast, the time
+# mainly reflects the cost of compressing; the ratio shows how much a slow network
+# link would gain. The signals resemble audio, EEG and white noise.
+
+nchans = 16
+fsample = 44100
+blocksize = 4410
+nblocks = 100
+
+server = FieldTrip.Server()
+port = 1972
+while not server.isConnected and port<2000:
+    try:
+        server.connect(port=port)
+    except:
+        port += 1
+
+
+server.timeout = 0.1
+running = True
+
+def serve():
+    while running:
+        server.loop()
+
+thread = threading.Thread(target=serve)
+thread.start()
+
+t = np.arange(blocksize * nblocks) / fsample
+signals = {
+    'audio int16': (FieldTrip.DATATYPE_INT16, (10000 * np.sin(2 * np.pi * 440 * t)[:, None] + 100 * np.random.randn(len(t), nchans)).astype(np.int16)),
+    'eeg float32': (FieldTrip.DATATYPE_FLOAT32, np.cumsum(np.random.randn(len(t), nchans), axis=0).astype(np.float32)),
+    'noise float32': (FieldTrip.DATATYPE_FLOAT32, np.random.randn(len(t), nchans).astype(np.float32)),
+}
+methods = {
+    'none': FieldTrip.COMPRESSION_NONE,
+    'shuffle': FieldTrip.COMPRESSION_SHUFFLE,
+    'delta': FieldTrip.COMPRESSION_DELTA,
+}
+
+print('-'*78)
+print('%14s %8s %8s %12s %12s %12s' % ('signal', 'method', 'ratio', 'MB/s', 'cpu (ms)', 'wall (ms)'))
+
+for signal, (datatype, dat) in signals.items():
+    for method, compression in methods.items():
+        client = FieldTrip.Client()
+        client.connect('localhost', port, compression=compression)
+        client.putHeader(nchans, fsample, datatype)
+
+        ratio = dat[0:blocksize].nbytes / len(memoryview(FieldTrip.compress(dat[0:blocksize], compression)).cast('B'))
+
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        for block in range(nblocks):
+            client.putData(dat[block*blocksize:(block+1)*blocksize])
+            client.getData([block*blocksize, (block+1)*blocksize-1])
+        cpu = (time.process_time() - cpu) / nblocks
+        wall = (time.perf_counter() - wall) / nblocks
+
+        # the samples are written and read once, the server runs in the same process
+        print('%14s %8s %8.2f %12.1f %12.3f %12.3f' % (signal, method, ratio, 2 * dat.nbytes / nblocks / wall / 1e6, 1000*cpu, 1000*wall))
+        client.disconnect()
+
+print('-'*78)
+running = False
+thread.join()
+server.disconnect()
@@ -0,0 +1,90 @@
+import FieldTrip
+import numpy as np
+import struct
+import threading
+import time
+
+# This compares the old and the new way of reading data from a FieldTrip buffer.
+# The old way receives the payload by repeated concatenation of bytes and converts
+# the read-only array with astype(), the new way receives the samples directly into
+# a preallocated array.
+
+nchans = 64
+fsample = 2000
+repetitions = 50
+windows = [10, 100, 500, 2000, 10000]
+
+server = FieldTrip.Server()
+port = 1972
+while not server.isConnected and port<2000:
+    try:
+        server.connect(port=port)
+    except:
+        port += 1
+
+
+server.timeout = 0.1
+running = True
+
+def serve():
+    while running:
+        server.loop()
+
+thread = threading.Thread(target=serve)
+thread.start()
+
+
+def old_getData(client, index):
+    request = struct.pack('HHIII', FieldTrip.VERSION, FieldTrip.GET_DAT, 8, int(index[0]), int(index[1]))
+    client.sendRaw(request)
+    resp_hdr = client.sock.recv(8)
+    while len(resp_hdr) < 8:
+        resp_hdr += client.sock.recv(8 - len(resp_hdr))
+    (version, command, bufsize) = struct.unpack('HHI', resp_hdr)
+    payload = client.sock.recv(bufsize)
+    while len(payload) < bufsize:
+        payload += client.sock.recv(bufsize - len(payload))
+    (nchans, nsamp, datype, bfsiz) = struct.unpack('IIII', payload[0:16])
+    raw = payload[16:bfsiz + 16]
+    return np.ndarray((nsamp, nchans), dtype=FieldTrip.numpyType[datype], buffer=raw)
+
+
+client = FieldTrip.Client()
+client.connect('localhost', port)
+client.putHeader(nchans, fsample, FieldTrip.DATATYPE_FLOAT32)
+nsamples = 0
+while nsamples < max(windows):
+    client.putData(np.random.rand(1000, nchans).astype(np.float32))
+    nsamples += 1000
+
+print('-'*78)
+print('%8s %12s %12s %12s %8s' % ('window', 'old (ms)', 'new (ms)', 'new+out (ms)', 'speedup'))
+
+for window in windows:
+    index = (nsamples - window, nsamples - 1)
+    buf = np.empty((window, nchans), dtype=np.double)
+
+    start = time.perf_counter()
+    for i in range(repetitions):
+        dat = old_getData(client, index).astype(np.double)
+    elapsed_old = (time.perf_counter() - start) / repetitions
+
+    start = time.perf_counter()
+    for i in range(repetitions):
+        dat = client.getData(index, dtype=np.double)
+    elapsed_new = (time.perf_counter() - start) / repetitions
+
+    start = time.perf_counter()
+    for i in range(repetitions):
+        dat = client.getData(index, out=buf)
+    elapsed_out = (time.perf_counter() - start) / repetitions
+
+    assert np.array_equal(buf, old_getData(client, index).astype(np.double))
+
+    print('%8d %12.3f %12.3f %12.3f %8.2f' % (window, 1000*elapsed_old, 1000*elapsed_new, 1000*elapsed_out, elapsed_old/elapsed_out))
+
+print('-'*78)
+client.disconnect()
+running = False
+thread.join()
+server.disconnect()
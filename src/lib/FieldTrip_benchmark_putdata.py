@@ -0,0 +1,77 @@
+import FieldTrip
+import numpy as np
+import struct
+import threading
+import time
+
+# This compares the old and the new way of writing data to a FieldTrip buffer.
+# The old way concatenates the request header, the data definition and a copy of
+# the samples, the new way sends the header and the buffer of the array in a single
+# system call. The pipelined way furthermore does not wait for the response.
+
+nchans = 64
+fsample = 2000
+repetitions = 200
+blocksizes = [1, 10, 100, 1000]
+
+server = FieldTrip.Server()
+port = 1972
+while not server.isConnected and port<2000:
+    try:
+        server.connect(port=port)
+    except:
+        port += 1
+
+
+server.timeout = 0.1
+running = True
+
+def serve():
+    while running:
+        server.loop()
+
+thread = threading.Thread(target=serve)
+thread.start()
+
+
+def old_putData(client, D):
+    dataBuf = D.tobytes()
+    request = struct.pack('HHI', FieldTrip.VERSION, FieldTrip.PUT_DAT, 16 + len(dataBuf))
+    dataDef = struct.pack('IIII', D.shape[1], D.shape[0], FieldTrip.DATATYPE_FLOAT32, len(dataBuf))
+    client.sendRaw(request + dataDef + dataBuf)
+    (status, bufsize, resp_buf) = client.receiveResponse()
+
+
+client = FieldTrip.Client()
+client.connect('localhost', port)
+client.putHeader(nchans, fsample, FieldTrip.DATATYPE_FLOAT32)
+
+print('-'*78)
+print('%8s %12s %12s %14s %8s' % ('block', 'old (ms)', 'new (ms)', 'pipelined (ms)', 'speedup'))
+
+for blocksize in blocksizes:
+    dat = np.random.rand(blocksize, nchans).astype(np.float32)
+
+    start = time.perf_counter()
+    for i in range(repetitions):
+        old_putData(client, dat)
+    elapsed_old = (time.perf_counter() - start) / repetitions
+
+    start = time.perf_counter()
+    for i in range(repetitions):
+        client.putData(dat)
+    elapsed_new = (time.perf_counter() - start) / repetitions
+
+    start = time.perf_counter()
+    for i in range(repetitions):
+        client.putData(dat, response=False)
+    client.poll() # this returns once all blocks have been handled
+    elapsed_pipe = (time.perf_counter() - start) / repetitions
+
+    print('%8d %12.3f %12.3f %14.3f %8.2f' % (blocksize, 1000*elapsed_old, 1000*elapsed_new, 1000*elapsed_pipe, elapsed_old/elapsed_new))
+
+print('-'*78)
+client.disconnect()
+running = False
+thread.join()
+server.disconnect()
@@ -0,0 +1,77 @@
+import FieldTrip
+import numpy as np
+import threading
+import time
+
+# This measures the latency between writing a block of data and a waiting client
+# being released. Multiple readers wait on the same buffer at the same time, while
+# a single writer writes blocks at a regular interval.
+
+nreaders = 8
+nchans = 32
+fsample = 1000
+blocksize = 20
+nblocks = 200
+
+server = FieldTrip.Server()
+port = 1972
+while not server.isConnected and port<2000:
+    try:
+        server.connect(port=port)
+    except:
+        port += 1
+
+
+server.timeout = 0.1
+running = True
+
+def serve():
+    while running:
+        server.loop()
+
+thread = threading.Thread(target=serve)
+thread.start()
+
+writer = FieldTrip.Client()
+writer.connect('localhost', port)
+writer.putHeader(nchans, fsample, FieldTrip.DATATYPE_FLOAT32)
+written = {}    # the time at which the number of samples was reached
+
+
+def read(latency):
+    reader = FieldTrip.Client()
+    reader.connect('localhost', port)
+    nsamples, nevents = reader.poll()
+    while nsamples < blocksize*nblocks:
+        nsamples, nevents = reader.wait(nsamples, nevents, 1000)
+        now = time.perf_counter()
+        if nsamples in written:
+            latency.append(now - written[nsamples])
+    reader.disconnect()
+
+latency = [[] for i in range(nreaders)]
+readers = [threading.Thread(target=read, args=(latency[i],)) for i in range(nreaders)]
+for r in readers:
+    r.start()
+time.sleep(0.5)
+
+for block in range(nblocks):
+    dat = np.random.rand(blocksize, nchans).astype(np.float32)
+    written[(block+1)*blocksize] = time.perf_counter()
+    writer.putData(dat)
+    time.sleep(blocksize/fsample)
+
+for r in readers:
+    r.join()
+writer.disconnect()
+
+print('-'*78)
+print('%8s %8s %12s %12s %12s' % ('reader', 'blocks', 'median (ms)', 'p95 (ms)', 'max (ms)'))
+for i in range(nreaders):
+    l = 1000*np.array(latency[i])
+    print('%8d %8d %12.3f %12.3f %12.3f' % (i, len(l), np.median(l), np.percentile(l, 95), np.max(l)))
+print('-'*78)
+
+running = False
+thread.join()
+server.disconnect()
@@ -1,61 +1,143 @@
+import os
+import numpy
+
+# A memory-mapped file starts with a header that describes the samples and that contains
+# the number of samples that have been written, followed by the samples themselves.
+HEADER = numpy.dtype([('magic', 'S8'), ('dtype', 'S8'), ('length', '<u8'), ('nchannels', '<u8'), ('count', '<u8')])
+HEADER_SIZE = 64
+MAGIC = b'RINGBUF1'
+
+
 class RingBuffer:
     """
     Class that implements a ring or cyclic buffer that automatically wraps around.
-    It works with bytes and has the methods append() and read().
+    It stores samples x channels in a numpy array with a fixed data type and has
+    the methods append() and read(), which are indexed in samples.
+
+    If a filename is given, the samples are stored in a memory-mapped file. The
+    operating system then keeps the recently used part in memory and pages the
+    rest in from disk on demand, which allows for a much longer buffer. The file
+    also contains the number of samples that have been written. An existing file
+    is opened without truncating it, so that the samples that it contains can be
+    read again, e.g. after a restart or to archive them.
     """
 
-    def __init__(self, length):
-        self.buffer = bytearray(length)
+    def __init__(self, length, nchannels, dtype, filename=None):
+        self.filename = filename
         self.length = length
+        self.nchannels = nchannels
         self.count = 0
+        if filename is None:
+            self.header = None
+            self.buffer = numpy.zeros((length, nchannels), dtype=dtype)
+        elif os.path.exists(filename):
+            self.header = numpy.memmap(filename, dtype=HEADER, mode='r+', shape=(1,))
+            if self.header['magic'][0] != MAGIC or self.header['dtype'][0] != numpy.dtype(dtype).str.encode() or self.header['length'][0] != length or self.header['nchannels'][0] != nchannels:
+                raise ValueError('The file %s does not match the ring buffer' % filename)
+            self.buffer = numpy.memmap(filename, dtype=dtype, mode='r+', offset=HEADER_SIZE, shape=(length, nchannels))
+            self.count = int(self.header['count'][0])
+        else:
+            self.header = numpy.memmap(filename, dtype=HEADER, mode='w+', shape=(1,))
+            self.header[0] = (MAGIC, numpy.dtype(dtype).str.encode(), length, nchannels, 0)
+            self.buffer = numpy.memmap(filename, dtype=dtype, mode='r+', offset=HEADER_SIZE, shape=(length, nchannels))
+        self.dtype = self.buffer.dtype
 
     def append(self, data):
         """
-        append(bytes) - add bytes to the end of the buffer.
+        append(data) - add samples to the end of the buffer. The data can be a numpy
+        array with samples x channels, or bytes with the samples in C-order.
         """
-        if len(data)>self.length:
+        if not isinstance(data, numpy.ndarray):
+            data = numpy.frombuffer(data, dtype=self.dtype).reshape(-1, self.nchannels)
+        nsamples = data.shape[0]
+
+        if nsamples>self.length:
             # remove the part of the data that does not fit anyway
-            self.count += int(len(data)/self.length)*self.length
+            self.count += nsamples - self.length
             data = data[-self.length:]
+            nsamples = self.length
 
-        begbyte = self.count % self.length
-        endbyte = (self.count + len(data) - 1) % self.length + 1
+        begsample = self.count % self.length
+        endsample = begsample + nsamples
 
-        if endbyte<begbyte:
+        if endsample>self.length:
             # insert the first section towards the end
-            numbytes = self.length - begbyte + 1
-            self.buffer[begbyte:self.length] = data[0:numbytes]
+            numsamples = self.length - begsample
+            self.buffer[begsample:] = data[0:numsamples]
             # insert the second section at the start
-            self.buffer[0:endbyte] = data[numbytes:]
-        elif endbyte>begbyte:
-            # simply insert the data
-            self.buffer[begbyte:endbyte] = data
+            self.buffer[0:nsamples-numsamples] = data[numsamples:]
         else:
-            # there is nothing to insert
-            pass
-        self.count += len(data)
+            # simply insert the data
+            self.buffer[begsample:endsample] = data
+        self.count += nsamples
+        if self.header is not None:
+            # the samples in the file only count once they have been written
+            self.header['count'] = self.count
 
-    def read(self, begbyte, endbyte):
+    def available(self):
         """
-        read(begbyte, endbyte) - read bytes from a specific location in the buffer.
+        available() - return the first and last sample that can be read, using exclusive,
+        zero-based start/end indices.
         """
-        if self.count>self.length:
-            begavailable = self.count - self.length
-        else:
-            begavailable = 0
-        endavailable = self.count
-        
-        if begbyte<begavailable:
+        return (max(0, self.count - self.length), self.count)
+
+    def read(self, begsample, endsample, out=None, channels=None):
+        """
+        read(begsample, endsample) - read samples from a specific location in the buffer,
+        using exclusive, zero-based start/end indices.
+
+        This returns a view on the buffer if the samples are contiguous and all channels
+        are selected. Otherwise the samples are copied into the array 'out', which is
+        allocated if not specified. The optional 'channels' is a list with zero-based
+        channel indices.
+        """
+        (begavailable, endavailable) = self.available()
+
+        if begsample<begavailable:
             raise RuntimeError('Cannot read before the start of the available data.')
-        elif endbyte>endavailable or begbyte>endavailable-1:
+        elif endsample>endavailable:
             raise RuntimeError('Cannot read past the end of the available data.')
-        elif endbyte<begbyte:
+        elif endsample<begsample:
             raise RuntimeError('Invalid selection.')
-        begbyte = begbyte % self.length
-        endbyte = (endbyte - 1) % self.length + 1
-    
-        if endbyte<=begbyte:
-            data = self.buffer[begbyte:] + self.buffer[0:endbyte]
+
+        nsamples = endsample - begsample
+        begsample = begsample % self.length
+        endsample = begsample + nsamples
+
+        if channels is None:
+            nchannels = self.nchannels
+        else:
+            nchannels = len(channels)
+
+        if endsample<=self.length and channels is None and out is None:
+            # the samples are contiguous, return a view
+            return self.buffer[begsample:endsample]
+
+        if out is None:
+            out = numpy.empty((nsamples, nchannels), dtype=self.dtype)
+        elif out.shape != (nsamples, nchannels):
+            raise ValueError('Output array has shape %s, expected %s' % (out.shape, (nsamples, nchannels)))
+
+        if endsample<=self.length:
+            sections = [(begsample, endsample, 0)]
         else:
-            data = self.buffer[begbyte:endbyte]
-        return data
+            # the samples wrap around the end of the buffer
+            numsamples = self.length - begsample
+            sections = [(begsample, self.length, 0), (0, nsamples-numsamples, numsamples)]
+
+        for (beg, end, offset) in sections:
+            if channels is None:
+                out[offset:offset+end-beg] = self.buffer[beg:end]
+            elif out.dtype == self.dtype:
+                numpy.take(self.buffer[beg:end], channels, axis=1, out=out[offset:offset+end-beg])
+            else:
+                out[offset:offset+end-beg] = self.buffer[beg:end, channels]
+        return out
+
+    def flush(self):
+        """
+        flush() - write the samples in a memory-mapped buffer to disk.
+        """
+        if self.filename is not None:
+            self.buffer.flush()
+            self.header.flush()
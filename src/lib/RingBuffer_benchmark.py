@@ -0,0 +1,103 @@
+import RingBuffer
+import numpy as np
+import time
+
+# This compares the typed, sample-indexed ring buffer with the byte-oriented ring
+# buffer that was used before. Both are filled with the same data, after which
+# windows of increasing length are read from them. For the byte-oriented buffer,
+# the conversion from samples to bytes and back is included, as the server did.
+
+nchans = 64
+fsample = 2000
+length = 10 * fsample
+blocksize = 100
+repetitions = 200
+windows = [10, 100, 1000, 5000]
+
+
+class ByteRingBuffer:
+    """The previous implementation, which works with bytes."""
+
+    def __init__(self, length):
+        self.buffer = bytearray(length)
+        self.length = length
+        self.count = 0
+
+    def append(self, data):
+        if len(data)>self.length:
+            self.count += int(len(data)/self.length)*self.length
+            data = data[-self.length:]
+        begbyte = self.count % self.length
+        endbyte = (self.count + len(data) - 1) % self.length + 1
+        if endbyte<begbyte:
+            numbytes = self.length - begbyte
+            self.buffer[begbyte:self.length] = data[0:numbytes]
+            self.buffer[0:endbyte] = data[numbytes:]
+        elif endbyte>begbyte:
+            self.buffer[begbyte:endbyte] = data
+        self.count += len(data)
+
+    def read(self, begbyte, endbyte):
+        begbyte = begbyte % self.length
+        endbyte = (endbyte - 1) % self.length + 1
+        if endbyte<=begbyte:
+            data = self.buffer[begbyte:] + self.buffer[0:endbyte]
+        else:
+            data = self.buffer[begbyte:endbyte]
+        return data
+
+
+wordsize = np.dtype(np.float32).itemsize
+old = ByteRingBuffer(length * nchans * wordsize)
+new = RingBuffer.RingBuffer(length, nchans, np.float32)
+
+# fill the buffers such that the write pointer is halfway
+nsamples = 0
+start = time.perf_counter()
+while nsamples < 1.5 * length:
+    dat = np.random.rand(blocksize, nchans).astype(np.float32)
+    old.append(dat.tobytes())
+    nsamples += blocksize
+elapsed_old = time.perf_counter() - start
+
+nsamples = 0
+start = time.perf_counter()
+while nsamples < 1.5 * length:
+    dat = np.random.rand(blocksize, nchans).astype(np.float32)
+    new.append(dat)
+    nsamples += blocksize
+elapsed_new = time.perf_counter() - start
+
+print('-'*78)
+print('appending %d blocks of %d samples: old %.3f ms, new %.3f ms' % (nsamples/blocksize, blocksize, 1000*elapsed_old, 1000*elapsed_new))
+print('-'*78)
+print('%8s %8s %12s %12s %12s %8s' % ('window', 'wraps', 'old (ms)', 'new (ms)', 'subset (ms)', 'speedup'))
+
+for window in windows:
+    for wraps in [False, True]:
+        if wraps:
+            # a window that straddles the end of the underlying buffer
+            endsample = length + window//2
+        else:
+            endsample = nsamples
+        begsample = endsample - window
+
+        start = time.perf_counter()
+        for i in range(repetitions):
+            raw = old.read(begsample * nchans * wordsize, endsample * nchans * wordsize)
+            dat = np.frombuffer(raw, dtype=np.float32).reshape(window, nchans)
+        elapsed_old = (time.perf_counter() - start) / repetitions
+
+        start = time.perf_counter()
+        for i in range(repetitions):
+            dat = new.read(begsample, endsample)
+        elapsed_new = (time.perf_counter() - start) / repetitions
+
+        start = time.perf_counter()
+        for i in range(repetitions):
+            sel = new.read(begsample, endsample, channels=[0, 31])
+        elapsed_sel = (time.perf_counter() - start) / repetitions
+
+        print('%8d %8s %12.4f %12.4f %12.4f %8.1f' % (window, wraps, 1000*elapsed_old, 1000*elapsed_new, 1000*elapsed_sel, elapsed_old/elapsed_new))
+
+print('-'*78)
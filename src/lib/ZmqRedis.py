@@ -17,15 +17,132 @@
 
 import zmq
 import threading
+import struct
+import re
+import time
+import collections
+
+###################################################################################################
+# Each request consists of one or more commands that are sent together in a single frame. Each
+# command starts with its number of fields, i.e. the name of the command, the keys and the values,
+# and each field starts with its length. The reply contains the fields of each command in the same
+# way. Sending everything in a single frame is faster than sending each field in its own frame.
+# The frame starts with a sequence number, which the server returns with the reply.
+#
+# The values are encoded as a single byte that specifies the type, followed by the value.
+# Floating point values are sent as 64-bit binary numbers, so that they do not lose precision.
+
+FLOAT   = b'd'
+INTEGER = b'q'
+STRING  = b's'
+
+def encode(val):
+    if isinstance(val, bool):
+        val = int(val)
+    if isinstance(val, float):
+        return FLOAT + struct.pack('<d', val)
+    elif isinstance(val, int) and -2**63 <= val < 2**63:
+        return INTEGER + struct.pack('<q', val)
+    else:
+        return STRING + str(val).encode('utf-8')
+
+def decode(buf):
+    # the values are returned as strings, like a redis client that decodes the responses
+    if len(buf)==0:
+        return None
+    elif buf[0:1]==FLOAT:
+        return repr(struct.unpack('<d', buf[1:])[0])
+    elif buf[0:1]==INTEGER:
+        return str(struct.unpack('<q', buf[1:])[0])
+    else:
+        return buf[1:].decode('utf-8')
+
+def glob(pattern):
+    # convert a glob-style pattern into a regular expression, with the same rules as redis
+    # * matches any string, ? matches a single character, [abc], [^a] and [a-z] match a set
+    # of characters, and a backslash escapes the special meaning of the next character
+    regex = ''
+    i = 0
+    while i<len(pattern):
+        c = pattern[i]
+        if c=='\\' and i+1<len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        elif c=='*':
+            regex += '.*'
+        elif c=='?':
+            regex += '.'
+        elif c=='[' and pattern.find(']', i+1)>0:
+            i += 1
+            negate = pattern[i]=='^'
+            if negate:
+                i += 1
+            chars = ''
+            while pattern[i]!=']':
+                if pattern[i]=='\\' and pattern[i+1]!=']':
+                    i += 1
+                    chars += re.escape(pattern[i])
+                elif pattern[i]=='-':
+                    chars += '-'
+                else:
+                    chars += re.escape(pattern[i])
+                i += 1
+            if len(chars)==0:
+                # an empty set matches nothing, or anything if it is negated
+                regex += '.' if negate else '(?!)'
+            else:
+                regex += '[' + ('^' if negate else '') + chars + ']'
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex + r'\Z', re.DOTALL)
+
+def prefix(pattern):
+    # return the literal part of the pattern up to the first special character
+    return re.split(r'[*?[\\]', pattern)[0]
+
+LENGTH = struct.Struct('<I')
+
+def pack(commands):
+    # combine a list of commands, each being a list of fields, into a single frame
+    parts = []
+    for command in commands:
+        parts.append(LENGTH.pack(len(command)))
+        for field in command:
+            parts.append(LENGTH.pack(len(field)))
+            parts.append(field)
+    return b''.join(parts)
+
+def unpack(buf):
+    # split a frame into the list of commands, each being a list of fields
+    commands = []
+    offset = 0
+    while offset < len(buf):
+        (nfields,) = LENGTH.unpack_from(buf, offset)
+        offset += 4
+        command = []
+        for i in range(nfields):
+            (length,) = LENGTH.unpack_from(buf, offset)
+            offset += 4
+            if offset + length > len(buf):
+                raise ValueError('Truncated frame')
+            command.append(buf[offset:offset+length])
+            offset += length
+        commands.append(command)
+    return commands
+
 
 ###################################################################################################
 class server():
+    """Class that emulates a subset of the redis server. It serves many clients at the same
+    time, the requests are handled in the order in which they arrive."""
+
     def __init__(self, port=5555):
         context = zmq.Context()
-        command = context.socket(zmq.REP)
-        command.bind("tcp://*:%d" % (port+0))  # this is the socket for most commands
+        command = context.socket(zmq.ROUTER)
+        command.bind("tcp://*:%d" % (port+0))  # this is the socket for most commands
         publish = context.socket(zmq.PUB)
-        publish.bind("tcp://*:%d" % (port+1))  # this is the socket for publishing
+        publish.bind("tcp://*:%d" % (port+1))  # this is the socket for publishing
         self.command = command
         self.publish = publish
         self.store = {}
@@ -33,164 +150,283 @@ class server():
 
     def start(self):
         while True:
-            message = self.command.recv_string()
-            if message.startswith('SET'):
-                if self.debug>1:
-                    print(message)
-                cmd, key, val = message.split(' ', 2)
+            message = self.command.recv_multipart()
+            # the message starts with the identity of the client
+            envelope, request = message[0:-1], message[-1]
+            try:
+                reply = [self.handle(command) for command in unpack(request[4:])]
+            except Exception as e:
+                # a malformed request is answered with an error, the other clients are not affected
+                print('Invalid request: %s' % e)
+                reply = [[b'ERR']]
+            self.command.send_multipart(envelope + [request[0:4] + pack(reply)])
+
+    def handle(self, command):
+        # execute a single command and return the reply as a list of frames
+        if self.debug>0:
+            level = {b'GET': 3, b'MGET': 3, b'CONNECT': 1}.get(command[0], 2)
+            if self.debug>=level:
+                # the values are not printed, only the command and the keys
+                print(' '.join([frame.decode('utf-8', errors='replace') for frame in command[0:2]]))
+
+        if command[0]==b'SET':
+            self.store[command[1]] = command[2]
+            return [b'OK']
+
+        elif command[0]==b'MSET':
+            for key, val in zip(command[1::2], command[2::2]):
                 self.store[key] = val
-                self.command.send_string('OK')
-
-            elif message.startswith('GET'):
-                if self.debug>2:
-                    print(message)
-                cmd, key = message.split(' ', 1)
-                if key in self.store:
-                    self.command.send_string(self.store[key])
-                else:
-                    self.command.send_string('')
-
-            elif message.startswith('PUBLISH'):
-                if self.debug>1:
-                    print(message)
-                cmd, key, val = message.split(' ', 2)
-                self.command.send_string('OK')
-                self.publish.send_string('%s %s' % (key, val))
-
-            elif message.startswith('KEYS'):
-                if self.debug>1:
-                    print(message)
-                cmd, pattern = message.split(' ', 1)
-                keys = list(self.store.keys())
-                if pattern == '*':
-                    # return all keys
-                    self.command.send_string(' '.join(keys))
-                elif pattern.startswith('*'):
-                    # return all keys that start with anything and end with the pattern
-                    sel = [i.endswith(pattern[1:]) for i in keys]
-                    keys = [i for i,b in zip(keys, sel) if b]
-                    self.command.send_string(' '.join(keys))
-                elif pattern.endswith('*'):
-                    # return all keys that start with the pattern and end with anything
-                    sel = [i.startswith(pattern[:-1]) for i in keys]
-                    keys = [i for i,b in zip(keys, sel) if b]
-                    self.command.send_string(' '.join(keys))
-                else:
-                    # return no keys
-                    self.command.send_string('')
-
-            elif message.startswith('EXISTS'):
-                if self.debug>1:
-                    print(message)
-                cmd, key = message.split(' ', 1)
-                if key in self.store.keys():
-                    self.command.send_string('1')
-                else:
-                    self.command.send_string('0')
+            return [b'OK']
+
+        elif command[0]==b'GET':
+            # an empty frame means that the key does not exist
+            return [self.store.get(command[1], b'')]
+
+        elif command[0]==b'MGET':
+            return [self.store.get(key, b'') for key in command[1:]]
+
+        elif command[0]==b'PUBLISH':
+            self.publish.send(command[1] + b' ' + command[2])
+            return [b'OK']
+
+        elif command[0]==b'KEYS':
+            # the pattern is glob-style, like in redis
+            pattern = glob(command[1].decode('utf-8'))
+            return [key for key in self.store.keys() if pattern.match(key.decode('utf-8'))]
+
+        elif command[0]==b'EXISTS':
+            if command[1] in self.store:
+                return [b'1']
+            else:
+                return [b'0']
 
-            elif message.startswith('CONNECT'):
-                if self.debug>0:
-                    print(message)
-                self.command.send_string('1')
+        elif command[0]==b'CONNECT':
+            return [b'1']
+
+        else:
+            return [b'ERR']
 
 
 ###################################################################################################
 class client():
     def __init__(self, host='localhost', port=5555, timeout=5000):
         context = zmq.Context()
-        socket = context.socket(zmq.REQ)
+        socket = context.socket(zmq.DEALER)
         socket.RCVTIMEO = timeout # in milliseconds
         socket.connect("tcp://%s:%d" % (host, port))
         self.socket = socket
+        self.host = host
+        self.port = port
         self.debug = 0
         self.timeout = timeout
         self.lock = threading.Lock()
+        self.sequence = 0
 
     def pubsub(self):
-        return pubsub()
+        # the messages are published on the next port of the same server
+        return pubsub(self.host, self.port+1)
 
-    def set(self, key, val):
+    def pipeline(self, transaction=False):
+        return pipeline(self)
+
+    def request(self, commands):
+        # send one or more commands and return the list of frames that each of them replied
         if self.debug>0:
-            if isinstance(val, str):
-                print("SET %s %s" % (key, val))
-            else:
-                print("SET %s %f" % (key, val))
+            for command in commands:
+                print(' '.join([frame.decode('utf-8', errors='replace') for frame in command[0:2]]))
         with self.lock:
-            if isinstance(val, str):
-                self.socket.send_string("SET %s %s" % (key, val))
-            else:
-                self.socket.send_string("SET %s %f" % (key, val))
-            status = self.socket.recv_string()
+            self.sequence = (self.sequence + 1) % 2**32
+            sequence = LENGTH.pack(self.sequence)
+            self.socket.send(sequence + pack(commands))
+            reply = self.socket.recv()
+            while reply[0:4] != sequence:
+                # skip the reply to an earlier request that timed out
+                reply = self.socket.recv()
+        return unpack(reply[4:])
+
+    def set(self, key, val):
+        self.request([[b'SET', key.encode('utf-8'), encode(val)]])
+        return
+
+    def mset(self, mapping):
+        command = [b'MSET']
+        for key, val in mapping.items():
+            command += [key.encode('utf-8'), encode(val)]
+        self.request([command])
         return
 
     def get(self, key):
-        if self.debug>0:
-            print("GET %s" % key)
-        with self.lock:
-            self.socket.send_string("GET %s" % key)
-            val = self.socket.recv_string()
-        if len(val)==0:
-            return None
-        else:
-            return val
+        reply = self.request([[b'GET', key.encode('utf-8')]])
+        return decode(reply[0][0])
+
+    def mget(self, keys):
+        reply = self.request([[b'MGET'] + [key.encode('utf-8') for key in keys]])
+        return [decode(val) for val in reply[0]]
 
     def publish(self, key, val):
-        if self.debug>0:
-            if isinstance(val, str):
-                print("PUBLISH %s %s" % (key, val))
-            else:
-                print("PUBLISH %s %f" % (key, val))
-        with self.lock:
-            if isinstance(val, str):
-                self.socket.send_string("PUBLISH %s %s" % (key, val))
-            else:
-                self.socket.send_string("PUBLISH %s %f" % (key, val))
-            status = self.socket.recv_string()
-        return status
+        reply = self.request([[b'PUBLISH', key.encode('utf-8'), encode(val)]])
+        return reply[0][0].decode('utf-8')
 
     def exists(self, key):
-        with self.lock:
-            self.socket.send_string("EXISTS %s" % key)
-            val = bool(float(self.socket.recv_string()))
-        return val
+        reply = self.request([[b'EXISTS', key.encode('utf-8')]])
+        return reply[0][0]==b'1'
 
     def keys(self, pattern):
-        with self.lock:
-            self.socket.send_string("KEYS %s" % pattern)
-            val = self.socket.recv_string()
-            val = val.split(' ')
-        return val
+        reply = self.request([[b'KEYS', pattern.encode('utf-8')]])
+        return [key.decode('utf-8') for key in reply[0]]
 
     def connect(self):
         # test whether this client is connected to the server
-        with self.lock:
-            try:
-                self.socket.send_string("CONNECT")
-                val = bool(float(self.socket.recv_string()))
-            except:
-                val = False
+        try:
+            reply = self.request([[b'CONNECT']])
+            val = reply[0][0]==b'1'
+        except:
+            val = False
+        return val
+
+
+###################################################################################################
+class pipeline():
+    """Class that collects commands and sends them all at once in a single message,
+    like the pipeline of a redis client."""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+        self.convert = []           # this converts the reply of each command
+
+    def set(self, key, val):
+        self.commands.append([b'SET', key.encode('utf-8'), encode(val)])
+        self.convert.append(lambda reply: True)
+        return self
+
+    def mset(self, mapping):
+        command = [b'MSET']
+        for key, val in mapping.items():
+            command += [key.encode('utf-8'), encode(val)]
+        self.commands.append(command)
+        self.convert.append(lambda reply: True)
+        return self
+
+    def get(self, key):
+        self.commands.append([b'GET', key.encode('utf-8')])
+        self.convert.append(lambda reply: decode(reply[0]))
+        return self
+
+    def mget(self, keys):
+        self.commands.append([b'MGET'] + [key.encode('utf-8') for key in keys])
+        self.convert.append(lambda reply: [decode(val) for val in reply])
+        return self
+
+    def publish(self, key, val):
+        self.commands.append([b'PUBLISH', key.encode('utf-8'), encode(val)])
+        self.convert.append(lambda reply: reply[0].decode('utf-8'))
+        return self
+
+    def execute(self):
+        if len(self.commands)==0:
+            return []
+        reply = self.client.request(self.commands)
+        val = [convert(frames) for convert, frames in zip(self.convert, reply)]
+        self.commands = []
+        self.convert = []
         return val
 
 
 ###################################################################################################
 class pubsub():
-    def __init__(self):
+    """Class that receives the published messages, like the pubsub object of a redis client.
+    The channels and patterns have the same semantics as in redis. The server sends all
+    messages that start with the literal part of a subscription, the exact channel or the
+    pattern is subsequently matched here."""
+
+    def __init__(self, host='localhost', port=5556):
         context = zmq.Context()
         socket = context.socket(zmq.SUB)
-        socket.connect("tcp://localhost:5556")
+        socket.connect("tcp://%s:%d" % (host, port))
         self.socket = socket
+        self.channels = set()
+        self.patterns = {}          # this maps each pattern to a regular expression
+        self.pending = collections.deque()
+        self.batch = 1000           # this is the maximum number of messages that is received at once
 
-    def subscribe(self, channel):
-        self.socket.setsockopt_string(zmq.SUBSCRIBE, channel)
+    def subscribe(self, *channels):
+        for channel in channels:
+            if not channel in self.channels:
+                self.channels.add(channel)
+                self.socket.setsockopt_string(zmq.SUBSCRIBE, channel)
+
+    def unsubscribe(self, *channels):
+        if len(channels)==0:
+            channels = list(self.channels)
+        for channel in channels:
+            if channel in self.channels:
+                self.channels.remove(channel)
+                self.socket.setsockopt_string(zmq.UNSUBSCRIBE, channel)
+
+    def psubscribe(self, *patterns):
+        for pattern in patterns:
+            if not pattern in self.patterns:
+                self.patterns[pattern] = glob(pattern)
+                self.socket.setsockopt_string(zmq.SUBSCRIBE, prefix(pattern))
+
+    def punsubscribe(self, *patterns):
+        if len(patterns)==0:
+            patterns = list(self.patterns.keys())
+        for pattern in patterns:
+            if pattern in self.patterns:
+                del self.patterns[pattern]
+                self.socket.setsockopt_string(zmq.UNSUBSCRIBE, prefix(pattern))
+
+    def close(self):
+        self.unsubscribe()
+        self.punsubscribe()
+        self.socket.close(linger=0)
+
+    def receive(self, flags=0):
+        # receive a single message and queue it once for the channel and once for each matching pattern
+        key, val = self.socket.recv(flags).split(b' ', 1)
+        channel = key.decode('utf-8')
+        data = None
+        if channel in self.channels:
+            data = decode(val)
+            self.pending.append({'type': 'message', 'pattern': None, 'channel': channel, 'data': data})
+        for pattern, regex in self.patterns.items():
+            if regex.match(channel):
+                if data is None:
+                    data = decode(val)
+                self.pending.append({'type': 'pmessage', 'pattern': pattern, 'channel': channel, 'data': data})
+
+    def drain(self):
+        # receive the messages that have already arrived, without waiting
+        for i in range(self.batch):
+            try:
+                self.receive(zmq.NOBLOCK)
+            except zmq.Again:
+                break
 
     def listen(self):
-        message = self.socket.recv_string()
-        key, val = message.split(' ', 1)
-        item = {}
-        item['type'] = 'message'
-        item['channel'] = key
-        item['data'] = val
-        return [item]
+        # wait for the first message and return it together with all messages that arrived in the meantime
+        while len(self.pending)==0:
+            self.receive()
+            self.drain()
+        items = list(self.pending)
+        self.pending.clear()
+        return items
+
+    def get_message(self, timeout=0.0):
+        # return the next message, or None if there is none within the timeout (in seconds)
+        if timeout is not None:
+            stop = time.time() + timeout
+        while len(self.pending)==0:
+            if timeout is None:
+                wait = None
+            else:
+                wait = max(0, 1000 * (stop - time.time()))
+            if self.socket.poll(wait) == 0:
+                return None
+            self.drain()
+        return self.pending.popleft()
 
 
 ###################################################################################################
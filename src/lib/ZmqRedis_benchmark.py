@@ -0,0 +1,168 @@
+import ZmqRedis
+import multiprocessing
+import numpy as np
+import redis
+import time
+import zmq
+
+# This compares the throughput and the latency of the ZeroMQ broker that was used before,
+# the current ZeroMQ broker and a real Redis server, if one is running. A number of clients
+# run in parallel, each of them simulates a module that reads and writes control values in
+# its loop: it reads the values of a number of keys and writes a number of results. This is
+# done with one request per key, and with a single request for all keys.
+
+nclients = 30
+nget = 16
+nset = 4
+duration = 3
+
+
+class OldServer():
+    """The previous implementation, which handles one request after the other."""
+
+    def __init__(self, port):
+        context = zmq.Context()
+        self.command = context.socket(zmq.REP)
+        self.command.bind("tcp://*:%d" % port)
+        self.publish = context.socket(zmq.PUB)
+        self.publish.bind("tcp://*:%d" % (port+1))
+        self.store = {}
+
+    def start(self):
+        while True:
+            message = self.command.recv_string()
+            if message.startswith('SET'):
+                cmd, key, val = message.split(' ', 2)
+                self.store[key] = val
+                self.command.send_string('OK')
+            elif message.startswith('GET'):
+                cmd, key = message.split(' ', 1)
+                self.command.send_string(self.store.get(key, ''))
+            elif message.startswith('PUBLISH'):
+                cmd, key, val = message.split(' ', 2)
+                self.command.send_string('OK')
+                self.publish.send_string('%s %s' % (key, val))
+            else:
+                self.command.send_string('1')
+
+
+class OldClient():
+    def __init__(self, port):
+        context = zmq.Context()
+        self.socket = context.socket(zmq.REQ)
+        self.socket.connect("tcp://localhost:%d" % port)
+
+    def set(self, key, val):
+        self.socket.send_string("SET %s %f" % (key, val))
+        self.socket.recv_string()
+
+    def get(self, key):
+        self.socket.send_string("GET %s" % key)
+        val = self.socket.recv_string()
+        return val if len(val) else None
+
+    def publish(self, key, val):
+        self.socket.send_string("PUBLISH %s %f" % (key, val))
+        self.socket.recv_string()
+
+
+def serve(kind, port):
+    if kind == 'old':
+        OldServer(port).start()
+    else:
+        ZmqRedis.server(port).start()
+
+
+def connect(kind, port):
+    if kind == 'old':
+        return OldClient(port)
+    elif kind == 'new':
+        return ZmqRedis.client(port=port)
+    else:
+        return redis.StrictRedis(port=port, decode_responses=True)
+
+
+def simulate(kind, port, batched, client, result):
+    r = connect(kind, port)
+    getkeys = ['input.%d.%d' % (client, i) for i in range(nget)]
+    setkeys = ['output.%d.%d' % (client, i) for i in range(nset)]
+    latency = []
+    stop = time.time() + duration
+    while time.time() < stop:
+        start = time.perf_counter()
+        if batched:
+            r.mget(getkeys)
+            pipe = r.pipeline(transaction=False)
+            for key in setkeys:
+                pipe.set(key, np.pi)
+                pipe.publish(key, np.pi)
+            pipe.execute()
+        else:
+            for key in getkeys:
+                r.get(key)
+            for key in setkeys:
+                r.set(key, np.pi)
+                r.publish(key, np.pi)
+        latency.append(time.perf_counter() - start)
+    result.put(latency)
+
+
+def benchmark(kind, port, batched):
+    result = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=simulate, args=(kind, port, batched, i, result)) for i in range(nclients)]
+    for c in clients:
+        c.start()
+    latency = []
+    for c in clients:
+        latency += result.get()
+    for c in clients:
+        c.join()
+    latency = 1000 * np.array(latency)
+    # each iteration of a module does nget+2*nset operations
+    print('%8s %8s %12.0f %12.0f %12.3f %12.3f %12.3f' % (kind, batched, len(latency) / duration, len(latency) * (nget + 2*nset) / duration, np.median(latency), np.percentile(latency, 99), np.max(latency)))
+
+
+def malformed(port):
+    # the broker should answer malformed requests with an error and continue serving the other clients
+    context = zmq.Context()
+    socket = context.socket(zmq.DEALER)
+    socket.RCVTIMEO = 1000
+    socket.connect('tcp://localhost:%d' % port)
+    for request in [b'\x01\x00\x00\x00\xff\xff', b'\x01\x00\x00\x00\x02\x00\x00\x00\x03\x00\x00\x00GET', b'GET input.0.0']:
+        socket.send(request)
+        socket.recv()
+    # an old client sends its request as text through a REQ socket
+    req = context.socket(zmq.REQ)
+    req.RCVTIMEO = 1000
+    req.connect('tcp://localhost:%d' % port)
+    req.send_string('GET input.0.0')
+    req.recv()
+    r = ZmqRedis.client(port=port, timeout=1000)
+    r.set('malformed', 1)
+    return r.get('malformed') == '1'
+
+
+if __name__ == '__main__':
+    servers = [multiprocessing.Process(target=serve, args=('old', 5580), daemon=True), multiprocessing.Process(target=serve, args=('new', 5590), daemon=True)]
+    for s in servers:
+        s.start()
+    time.sleep(0.5)
+
+    print('-'*78)
+    print('%d clients, each reading %d and writing %d values per iteration' % (nclients, nget, nset))
+    print('%8s %8s %12s %12s %12s %12s %12s' % ('broker', 'batched', 'iter/s', 'ops/s', 'median (ms)', 'p99 (ms)', 'max (ms)'))
+    benchmark('old', 5580, False)
+    benchmark('new', 5590, False)
+    benchmark('new', 5590, True)
+    try:
+        redis.StrictRedis(port=6379).ping()
+        benchmark('redis', 6379, False)
+        benchmark('redis', 6379, True)
+    except redis.ConnectionError:
+        print('%8s %s' % ('redis', 'is not running'))
+    print('-'*78)
+    print('malformed requests handled: %s' % malformed(5590))
+    print('-'*78)
+
+    for s in servers:
+        s.terminate()
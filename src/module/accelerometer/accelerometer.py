@@ -128,7 +128,7 @@ def _loop_once():
     # get the most recent data segment
     begsample = hdr_input.nSamples - window
     endsample = hdr_input.nSamples - 1
-    dat = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat = ft_input.getData([begsample, endsample], dtype=np.double)
 
     for channame, chanindx in zip(channel_name, channel_indx):
         # compute the mean over the time window
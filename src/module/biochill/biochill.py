@@ -167,7 +167,7 @@ class BreathingBiofeedback:
             time.sleep(.1)
             return    # there are not yet enough samples in the buffer
 
-        data = self.ft_input.getData([self.begsample, self.endsample]).astype(np.double)
+        data = self.ft_input.getData([self.begsample, self.endsample], dtype=np.double)
         data = data[:, self.channel]
 
         self.monitor.info("Processing sample {0} to {1}".format(self.begsample, self.endsample))
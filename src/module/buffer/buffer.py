@@ -23,6 +23,7 @@ import os
 import sys
 import time
 import threading
+import selectors
 
 if hasattr(sys, 'frozen'):
     path = os.path.split(sys.executable)[0]
@@ -65,18 +66,30 @@ def _start():
     This uses the global variables from setup and adds a set of global variables
     '''
     global patch, name, path, monitor
-    global delay, port, server
+    global port, length, directory, compression, interval, prefix, published, selector, server
 
     # get the options from the configuration file
-    delay = patch.getfloat('general', 'delay', default=0.010)
     port = patch.getint('fieldtrip', 'port', multiple=True)
+    length = patch.getfloat('fieldtrip', 'length', default=600)
+    directory = patch.getstring('fieldtrip', 'directory', default=None)
+    compression = patch.getint('fieldtrip', 'compression', default=1)
+    interval = patch.getfloat('statistics', 'interval', default=0)
+    prefix = patch.getstring('output', 'prefix', default='buffer')
+    published = time.time()
+
+    # all servers share the same selector, so that they can be served together without polling
+    selector = selectors.DefaultSelector()
 
     server = []
     for p in port:
         monitor.info("starting server on %d" % p)
-        s = FieldTrip.Server()
+        s = FieldTrip.Server(selector=selector)
+        s.length = length
+        s.compression = bool(compression)
+        if directory:
+            # the samples are stored in a memory-mapped file rather than in memory
+            s.filename = os.path.join(directory, 'buffer_%d.dat' % p)
         s.connect(hostname='localhost', port=p)
-        s.timeout = 0 # the server main loop should not wait, as it would block the other instances
         server.append(s);
     del p, s
 
@@ -84,27 +97,47 @@ def _start():
 def _loop_once():
     '''Run the main loop once
     '''
-    global server
-    for s in server:
-        s.loop() # deal with new connections and incoming requests
+    global patch, port, interval, prefix, published, server
+    # deal with new connections and incoming requests on any of the servers
+    # this blocks until a socket is ready, but returns at least once per second
+    FieldTrip.loop(server, timeout=1)
+
+    if interval > 0 and time.time() - published >= interval:
+        # send the statistics of each server as control values: prefix.port.item=val
+        values = {}
+        for p, s in zip(port, server):
+            flatten("%s.%d" % (prefix, p), s.statistics(), values)
+        # these are sent to the broker all at once
+        patch.setvalues(values)
+        published = time.time()
+
+
+def flatten(key, stats, values):
+    '''Collect the numbers in the nested dictionary with statistics as control values
+    '''
+    for item, val in stats.items():
+        if isinstance(val, dict):
+            flatten("%s.%s" % (key, item), val, values)
+        elif isinstance(val, (int, float)):
+            values["%s.%s" % (key, item)] = val
 
 
 def _loop_forever():
     '''Run the main loop forever
     '''
-    global delay
+    global monitor
     while True:
         monitor.loop()
         _loop_once()
-        time.sleep(delay)
 
 
 def _stop():
-    '''Stop and clean up on SystemExit, KeyboardInterrupt, RuntimeError
+    '''Stop and clean up on SystemExit, KeyboardInterrupt
     '''
-    global monitor, server
+    global monitor, selector, server
     for s in server:
         s.disconnect()
+    selector.close()
 
 
 if __name__ == '__main__':
@@ -112,6 +145,6 @@ if __name__ == '__main__':
     _start()
     try:
         _loop_forever()
-    except (SystemExit, KeyboardInterrupt, RuntimeError):
+    except (SystemExit, KeyboardInterrupt):
         _stop()
     sys.exit()
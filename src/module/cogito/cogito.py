@@ -211,7 +211,7 @@ def _loop_once():
             raise RuntimeError("timeout while waiting for data")
 
     # get the input data
-    dat_input = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat_input = ft_input.getData([begsample, endsample], dtype=np.double)
 
     if inputscaling==0:
         tmp = dat_input - dat_input.mean(axis=0)
@@ -140,7 +140,7 @@ def _loop_once():
     '''
     global patch, name, path, monitor
     global ft_host, ft_port, ft_input, timeout, hdr_input, start, channel_items, channame, chanindx, item, shannon, sampen, multiscale, spectral, svd, correlation, higushi, petrosian, fisher, hurst, dfa, lyap_r, lyap_e, window, taper, begsample, endsample
-    global dat, meandat, chan, sample, metrics, timeseries, metric_names, metric, shortmetric, key, val
+    global dat, meandat, chan, sample, metrics, timeseries, metric_names, metric, shortmetric, key, val, keyval
 
     hdr_input = ft_input.getHeader()
     if (hdr_input.nSamples - 1) < endsample:
@@ -153,8 +153,7 @@ def _loop_once():
     # get the most recent data segment
     begsample = hdr_input.nSamples - window
     endsample = hdr_input.nSamples - 1
-    dat = ft_input.getData([begsample, endsample]).astype(np.double)
-    dat = dat[:, chanindx]
+    dat = ft_input.getData([begsample, endsample], dtype=np.double, channels=chanindx)
 
     # subtract the channel mean and apply the taper to each sample
     meandat = dat.mean(0)
@@ -185,6 +184,8 @@ def _loop_once():
 
     metric_names = list(metrics[0].keys())
 
+    # the values are all sent at once
+    keyval = {}
     for chan in chanindx:
         for metric in metric_names:
             shortmetric = metric.lower()
@@ -195,8 +196,9 @@ def _loop_once():
                 shortmetric = shortmetric[len('fractal_dimension_'):]
             key = "{}.{}".format(channame[chan], shortmetric)
             val = metrics[chan][metric]
-            patch.setvalue(key, val)
+            keyval[key] = val
             monitor.update(key, val)
+    patch.setvalues(keyval)
 
 
 def _loop_forever():
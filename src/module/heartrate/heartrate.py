@@ -140,8 +140,8 @@ def _loop_once():
     # process the last window
     begsample = hdr_input.nSamples - int(window)
     endsample = hdr_input.nSamples - 1
-    dat       = ft_input.getData([begsample,endsample]).astype(np.double)
-    dat       = dat[:,channel]
+    dat       = ft_input.getData([begsample,endsample], dtype=np.double, channels=[channel])
+    dat       = dat[:,0]
 
     if np.isnan(curvemin):
         curvemin  = np.min(dat)
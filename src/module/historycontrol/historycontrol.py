@@ -119,7 +119,7 @@ def _loop_once():
     '''
     global patch, name, path, monitor
     global inputlist, enable, stepsize, window, metrics_iqr, metrics_mad, metrics_max, metrics_max_att, metrics_mean, metrics_median, metrics_min, metrics_min_att, metrics_p03, metrics_p16, metrics_p84, metrics_p97, metrics_range, metrics_std, numchannel, numhistory, historic_data, historic_stat
-    global channel, historic_att, operation, key, val
+    global channel, historic_att, operation, key, val, keyval
 
     # determine whether the historic_data should be updated or not
     enable = patch.getint('history', 'enable', default=1)
@@ -183,12 +183,15 @@ def _loop_once():
         historic_stat['min_att'] = np.nanmin(historic_att, axis=1)
         historic_stat['max_att'] = np.nanmax(historic_att, axis=1)
 
+    # the values are all sent at once
+    keyval = {}
     for operation in list(historic_stat.keys()):
         for channel in range(numchannel):
             key = inputlist[channel] + "." + operation
             val = historic_stat[operation][channel]
-            patch.setvalue(key, val)
+            keyval[key] = val
             monitor.debug('%s = %g' % (key, val))
+    patch.setvalues(keyval)
 
     # there should not be any local variables in this function, they should all be global
     if len(locals()):
@@ -46,6 +46,7 @@ else:
 sys.path.append(os.path.join(path, '../../lib'))
 import EEGsynth
 import FieldTrip
+import RingBuffer
 
 
 # see https://en.wikipedia.org/wiki/Median_absolute_deviation
@@ -118,7 +119,7 @@ def _start():
     numchannel  = len(inputlist)
 
     # this will contain the full list of historic values
-    history = np.empty((numhistory, numchannel)) * np.nan
+    history = RingBuffer.RingBuffer(numhistory, numchannel, np.double)
 
     # this will contain the statistics of the historic values
     historic = {}
@@ -142,7 +143,7 @@ def _loop_once():
     '''
     global patch, name, path, monitor
     global ft_host, ft_port, ft_input, timeout, hdr_input, start, inputlist, prefix, enable, stepsize, window, numhistory, numchannel, history, historic, begsample, endsample
-    global prev_enable, dat_input, chanindx, operation, key, val
+    global prev_enable, dat_input, dat_history, chanindx, operation, key, val
 
     # determine the start of the actual processing
     start = time.time()
@@ -180,30 +181,32 @@ def _loop_once():
     monitor.debug("reading samples " + str(begsample) + " to " + str(endsample))
 
     # get the input data, sample vector and time vector
-    dat_input = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat_input = ft_input.getData([begsample, endsample], dtype=np.double)
 
-    # shift the history and insert the most recent data
-    history = np.roll(history, stepsize, axis=0)
+    # insert the most recent data in the history
     chanindx = np.asarray(inputlist,np.int32)-1
-    history[-stepsize:,] = dat_input[:,chanindx]
+    history.append(dat_input[:,chanindx])
+
+    # only use the part of the history that has been filled
+    dat_history = history.read(*history.available())
 
     # compute some statistics
-    historic['mean']    = np.nanmean(history.flatten(), axis=0)
-    historic['std']     = np.nanstd(history.flatten(), axis=0)
-    historic['min']     = np.nanmin(history.flatten(), axis=0)
-    historic['max']     = np.nanmax(history.flatten(), axis=0)
+    historic['mean']    = np.nanmean(dat_history.flatten(), axis=0)
+    historic['std']     = np.nanstd(dat_history.flatten(), axis=0)
+    historic['min']     = np.nanmin(dat_history.flatten(), axis=0)
+    historic['max']     = np.nanmax(dat_history.flatten(), axis=0)
     historic['range']   = historic['max'] - historic['min']
 
     if False:
         # use some robust estimators
-        historic['median']  = np.nanmedian(history.flatten(), axis=0)
+        historic['median']  = np.nanmedian(dat_history.flatten(), axis=0)
         # see https://en.wikipedia.org/wiki/Median_absolute_deviation
-        historic['mad']     = mad(history.flatten(), axis=0)
+        historic['mad']     = mad(dat_history.flatten(), axis=0)
         # for a normal distribution the 16th and 84th percentile correspond to the mean plus-minus one standard deviation
-        historic['p03']     = np.percentile(history.flatten(),  3, axis=0) # mean minus 2x standard deviation
-        historic['p16']     = np.percentile(history.flatten(), 16, axis=0) # mean minus 1x standard deviation
-        historic['p84']     = np.percentile(history.flatten(), 84, axis=0) # mean plus 1x standard deviation
-        historic['p97']     = np.percentile(history.flatten(), 97, axis=0) # mean plus 2x standard deviation
+        historic['p03']     = np.percentile(dat_history.flatten(),  3, axis=0) # mean minus 2x standard deviation
+        historic['p16']     = np.percentile(dat_history.flatten(), 16, axis=0) # mean minus 1x standard deviation
+        historic['p84']     = np.percentile(dat_history.flatten(), 84, axis=0) # mean plus 1x standard deviation
+        historic['p97']     = np.percentile(dat_history.flatten(), 97, axis=0) # mean plus 2x standard deviation
         # see https://en.wikipedia.org/wiki/Interquartile_range
         historic['iqr']     = historic['p84'] - historic['p16']
 
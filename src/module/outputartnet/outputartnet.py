@@ -109,23 +109,28 @@ def _loop_once():
     '''
     global patch, name, path, monitor
     global address, artnet, dmxsize, dmxframe, prevtime
-    global update, chanindx, chanstr, chanval, scale, offset
+    global update, chanindx, chanstr, chanval, scale, offset, chanstrs, inputvals, scales, offsets
 
     update = False
 
-    # loop over the control values, these are 1-offset in the ini file
+    # get all control values at once, these are 1-offset in the ini file
+    chanstrs = ["channel%03d" % (chanindx + 1) for chanindx in range(0, dmxsize)]
+    # this returns None when the channel is not present
+    inputvals = patch.getfloat_many('input', chanstrs)
+    # the scale and offset options are channel specific
+    scales = patch.getfloat_many('scale', chanstrs, default=255)
+    offsets = patch.getfloat_many('offset', chanstrs, default=0)
+
+    # loop over the control values
     for chanindx in range(0, dmxsize):
-        chanstr = "channel%03d" % (chanindx + 1)
-        # this returns None when the channel is not present
-        chanval = patch.getfloat('input', chanstr)
+        chanval = inputvals[chanindx]
 
         if chanval == None:
             # the value is not present in Redis, skip it
             continue
 
-        # the scale and offset options are channel specific
-        scale = patch.getfloat('scale', chanstr, default=255)
-        offset = patch.getfloat('offset', chanstr, default=0)
+        scale = scales[chanindx]
+        offset = offsets[chanindx]
         # apply the scale and offset
         chanval = EEGsynth.rescale(chanval, slope=scale, offset=offset)
         # ensure that it is within limits
@@ -255,7 +255,7 @@ def _loop_once():
             raise RuntimeError("timeout while waiting for data")
 
     # the output audio is float32, hence this should be as well
-    dat = ft_input.getData([begsample, endsample]).astype(np.single)
+    dat = ft_input.getData([begsample, endsample], dtype=np.single)
 
     # multiply the data with the scaling factor
     scaling = patch.getfloat('audio', 'scaling', default=1)
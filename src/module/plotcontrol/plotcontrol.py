@@ -48,6 +48,7 @@ else:
 # the lib directory contains shared code
 sys.path.append(os.path.join(path, '../../lib'))
 import EEGsynth
+import RingBuffer
 
 def _setup():
     '''Initialize the module
@@ -108,7 +109,8 @@ def _start():
     pg.setConfigOptions(antialias=True)
 
     # Initialize variables
-    inputhistory = np.ones((counter, historysize))
+    inputhistory = RingBuffer.RingBuffer(historysize, counter, np.double)
+    inputhistory.append(np.ones((historysize, counter)))
     inputplot    = []
     inputcurve   = []
 
@@ -147,6 +149,7 @@ def _loop_once():
     '''
     global patch, name, path, monitor
     global delay, historysize, window, winx, winy, winwidth, winheight, input_name, input_variable, ylim_name, ylim_value, counter, app, win, inputhistory, inputplot, inputcurve, iplot, name, ylim, variable, linecolor, icurve, timer, timeaxis
+    global inputvalues, values, value, dat_history
 
     monitor.loop()
 
@@ -154,8 +157,8 @@ def _loop_once():
         # do not read data and do not plot anything
         return
 
-    # shift all historic data with one sample
-    inputhistory = np.roll(inputhistory, -1, axis=1)
+    # the current values are collected and appended to the history all at once
+    inputvalues = np.empty((1, inputhistory.nchannels))
 
     counter = 0
     for iplot, name in enumerate(input_name):
@@ -172,10 +175,16 @@ def _loop_once():
         # update the current data
         values = patch.getfloat('input', name, multiple=True, default=np.nan)
         for value in values:
-            inputhistory[counter, historysize-1] = value
-            inputcurve[counter].setData(timeaxis, inputhistory[counter, :])
+            inputvalues[0, counter] = value
             counter += 1
 
+    # shift all historic data with one sample
+    inputhistory.append(inputvalues)
+    dat_history = inputhistory.read(inputhistory.count-historysize, inputhistory.count)
+
+    for counter in range(inputhistory.nchannels):
+        inputcurve[counter].setData(timeaxis, dat_history[:, counter])
+
 
 def _loop_forever():
     '''Run the main loop forever
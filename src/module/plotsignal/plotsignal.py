@@ -209,7 +209,7 @@ def _loop_once():
 
     monitor.info("reading from sample %d to %d" % (begsample, endsample))
 
-    dat = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat = ft_input.getData([begsample, endsample], dtype=np.double)
 
     # demean the data before filtering to reduce edge artefacts and to center timecourse
     if patch.getint('arguments', 'demean', default=1):
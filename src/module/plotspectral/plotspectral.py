@@ -313,7 +313,7 @@ def _loop_once():
 
     monitor.info("reading from sample %d to %d" % (begsample, endsample))
 
-    dat = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat = ft_input.getData([begsample, endsample], dtype=np.double)
 
     # demean the data to prevent spectral leakage
     if patch.getint('arguments', 'demean', default=1):
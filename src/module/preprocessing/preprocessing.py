@@ -68,7 +68,7 @@ def _start():
     This uses the global variables from setup and adds a set of global variables
     '''
     global patch, name, path, monitor
-    global ft_host, ft_port, ft_input, ft_output, timeout, hdr_input, start, window, downsample, differentiate, integrate, rectify, smoothing, reference, default_scale, scale_lowpass, scale_highpass, scale_notchfilter, offset_lowpass, offset_highpass, offset_notchfilter, scale_filterorder, scale_notchquality, offset_filterorder, offset_notchquality, previous, differentiate_zi, integrate_zi, begsample, endsample
+    global ft_host, ft_port, ft_input, ft_output, timeout, hdr_input, start, window, downsample, differentiate, integrate, rectify, smoothing, reference, default_scale, scale_lowpass, scale_highpass, scale_notchfilter, offset_lowpass, offset_highpass, offset_notchfilter, scale_filterorder, scale_notchquality, offset_filterorder, offset_notchquality, previous, differentiate_zi, integrate_zi, begsample, endsample, reader
     global montage_in, montage_out
 
     try:
@@ -166,13 +166,8 @@ def _start():
     differentiate_zi = np.zeros((1, hdr_input.nChannels))
     integrate_zi     = np.zeros((1, hdr_input.nChannels))
 
-    # jump to the end of the input stream
-    if hdr_input.nSamples<window:
-        begsample = 0
-        endsample = window-1
-    else:
-        begsample = hdr_input.nSamples-window
-        endsample = hdr_input.nSamples-1
+    # start at the end of the input stream, the next window is read in the background while processing the current one
+    reader = FieldTrip.BlockReader(ft_input, window, timeout=timeout, dtype=np.float32)
 
 
 def _loop_once():
@@ -180,30 +175,20 @@ def _loop_once():
     This uses the global variables from setup and start, and adds a set of global variables
     '''
     global patch, name, path, monitor
-    global ft_host, ft_port, ft_input, ft_output, timeout, hdr_input, start, window, downsample, differentiate, integrate, rectify, smoothing, reference, default_scale, scale_lowpass, scale_highpass, scale_notchfilter, offset_lowpass, offset_highpass, offset_notchfilter, scale_filterorder, scale_notchquality, offset_filterorder, offset_notchquality, previous, differentiate_zi, integrate_zi, begsample, endsample
+    global ft_host, ft_port, ft_input, ft_output, timeout, hdr_input, start, window, downsample, differentiate, integrate, rectify, smoothing, reference, default_scale, scale_lowpass, scale_highpass, scale_notchfilter, offset_lowpass, offset_highpass, offset_notchfilter, scale_filterorder, scale_notchquality, offset_filterorder, offset_notchquality, previous, differentiate_zi, integrate_zi, begsample, endsample, reader
     global dat_input, dat_output, highpassfilter, lowpassfilter, filterorder, change, b, a, zi, notchfilter, notchquality, nb, na, nzi, window_new, t
     global montage_in, montage_out
 
     monitor.loop()
 
-    # determine when we start polling for available data
-    start = time.time()
-
-    while endsample>hdr_input.nSamples-1:
-        # wait until there is enough data
-        time.sleep(patch.getfloat('general', 'delay'))
-        hdr_input = ft_input.getHeader()
-        if (hdr_input.nSamples-1)<(endsample-window):
-            raise RuntimeError("buffer reset detected")
-        if (time.time()-start)>timeout:
-            raise RuntimeError("timeout while waiting for data")
+    # this waits until there is enough data, a reset or timeout is raised as RuntimeError
+    begsample, dat_input = reader.read()
+    endsample = begsample + window - 1
+    dat_output = dat_input
 
     # determine the start of the actual processing
     start = time.time()
 
-    dat_input  = ft_input.getData([begsample, endsample]).astype(np.float32)
-    dat_output = dat_input
-
     monitor.trace("------------------------------------------------------------")
     monitor.trace("read        " + str(window) + " samples in " + str((time.time()-start)*1000) + " ms")
 
@@ -301,10 +286,6 @@ def _loop_once():
     monitor.info("preprocessed " + str(window_new) + " samples in " + str((time.time()-start)*1000) + " ms")
     monitor.trace("wrote       " + str(window_new) + " samples in " + str((time.time()-start)*1000) + " ms")
 
-    # increment the counters for the next loop
-    begsample += window
-    endsample += window
-
 
 def _loop_forever():
     '''Run the main loop forever
@@ -316,7 +297,8 @@ def _loop_forever():
 def _stop():
     '''Stop and clean up on SystemExit, KeyboardInterrupt, RuntimeError
     '''
-    global monitor, ft_input, ft_output
+    global monitor, ft_input, ft_output, reader
+    reader.close()
     ft_input.disconnect()
     monitor.success('Disconnected from input FieldTrip buffer')
     ft_output.disconnect()
@@ -25,7 +25,6 @@ import numpy as np
 import os
 import sys
 import time
-import threading
 
 if hasattr(sys, 'frozen'):
     path = os.path.split(sys.executable)[0]
@@ -76,71 +75,59 @@ def sanitize(equation):
     return equation
 
 
-class TriggerThread(threading.Thread):
+class TriggerCallback():
     def __init__(self, redischannel, trigger):
-        threading.Thread.__init__(self)
         self.redischannel = redischannel
         self.trigger = trigger
-        self.running = True
-
-    def stop(self):
-        self.running = False
-
-    def run(self):
-        global r, monitor, patch
-        pubsub = patch.pubsub()
-        pubsub.subscribe('PROCESSTRIGGER_UNBLOCK')  # this message unblocks the Redis listen command
-        pubsub.subscribe(self.redischannel)        # this message triggers the event
-        while self.running:
-            for item in pubsub.listen():
-                if not self.running or not item['type'] == 'message':
-                    break
-                if item['channel'] == self.redischannel:
-                    with lock:
-                        monitor.debug('----- %s ----- ' % (self.redischannel))
-                        input_value = []
-                        for name in input_name:
-                            # get the values of the input variables
-                            val = patch.getfloat('input', name)
-                            monitor.update(name, val)
-                            input_value.append(val)
-
-                        if patch.getint('conditional', self.trigger, default=1) == 0:
-                            continue
-
-                        for key, equation in zip(output_name[self.trigger], output_equation[self.trigger]):
-
-                            # replace the variable names in the equation by the values
-                            for name, value in zip(input_name, input_value):
-                                if value is None and equation.count(name) > 0:
-                                    monitor.error('Undefined value: %s' % (name))
-                                else:
-                                    equation = equation.replace(name, str(value))
-
-                            # also replace the variable name for the trigger by its value
-                            name = self.trigger
-                            value = float(item['data'])
-                            if value is None and equation.count(name) > 0:
-                                monitor.error('Undefined value: %s' % (name))
-                            else:
-                                equation = equation.replace(name, str(value))
-
-                            # try to evaluate each equation
-                            try:
-                                val = eval(equation)
-                                val = float(val)  # deal with True/False
-                                monitor.debug('%s = %s = %g' % (key, equation, val))
-                                patch.setvalue(key, val)
-                            except ZeroDivisionError:
-                                # division by zero is not a serious error
-                                patch.setvalue(equation[0], np.nan)
-                            except:
-                                monitor.error('Error in evaluation: %s = %s' % (key, equation))
-
-                        # send a copy of the original trigger with the given prefix
-                        key = '%s.%s' % (prefix, item['channel'])
-                        val = float(item['data'])
-                        patch.setvalue(key, val)
+
+    def __call__(self, item):
+        # this is called by the dispatcher of the patch for each message on the channel
+        global monitor, patch
+        if item['channel'] == self.redischannel:
+            monitor.debug('----- %s ----- ' % (self.redischannel))
+            input_value = []
+            for name in input_name:
+                # get the values of the input variables
+                val = patch.getfloat('input', name)
+                monitor.update(name, val)
+                input_value.append(val)
+
+            if patch.getint('conditional', self.trigger, default=1) == 0:
+                return
+
+            for key, equation in zip(output_name[self.trigger], output_equation[self.trigger]):
+
+                # replace the variable names in the equation by the values
+                for name, value in zip(input_name, input_value):
+                    if value is None and equation.count(name) > 0:
+                        monitor.error('Undefined value: %s' % (name))
+                    else:
+                        equation = equation.replace(name, str(value))
+
+                # also replace the variable name for the trigger by its value
+                name = self.trigger
+                value = float(item['data'])
+                if value is None and equation.count(name) > 0:
+                    monitor.error('Undefined value: %s' % (name))
+                else:
+                    equation = equation.replace(name, str(value))
+
+                # try to evaluate each equation
+                try:
+                    val = eval(equation)
+                    val = float(val)  # deal with True/False
+                    monitor.debug('%s = %s = %g' % (key, equation, val))
+                    patch.setvalue(key, val)
+                except ZeroDivisionError:
+                    # division by zero is not a serious error
+                    patch.setvalue(equation[0], np.nan)
+                except:
+                    monitor.error('Error in evaluation: %s = %s' % (key, equation))
+
+            # send a copy of the original trigger with the given prefix
+            key = '%s.%s' % (prefix, item['channel'])
+            val = float(item['data'])
+            patch.setvalue(key, val)
 
 
 def _setup():
@@ -165,7 +152,7 @@ def _start():
     This uses the global variables from setup and adds a set of global variables
     '''
     global patch, name, path, monitor
-    global prefix, item, val, input_name, input_variable, output_name, output_equation, variable, equation, lock, trigger, thread
+    global prefix, item, val, input_name, input_variable, output_name, output_equation, variable, equation
 
     # get the options from the configuration file
     prefix = patch.getstring('output', 'prefix')
@@ -200,20 +187,12 @@ def _start():
             monitor.info(name + ' = ' + equation)
     monitor.info('============================')
 
-    # this is to prevent two triggers from being processed at the same time
-    lock = threading.Lock()
-
-    # create the background threads that deal with the triggers
-    trigger = []
-    monitor.debug("Setting up threads for each trigger")
+    # the triggers are handled one after the other by the dispatcher of the patch
+    monitor.debug("Subscribing to each trigger")
     for item in patch.config.items('trigger'):
-        trigger.append(TriggerThread(item[1], item[0]))
+        patch.subscribe(item[1], TriggerCallback(item[1], item[0]))
         monitor.debug(item[0] + " " + item[1] + " OK")
 
-    # start the thread for each of the triggers
-    for thread in trigger:
-        thread.start()
-
     # there should not be any local variables in this function, they should all be global
     if len(locals()):
         print('LOCALS: ' + ', '.join(locals().keys()))
@@ -236,13 +215,9 @@ def _loop_forever():
 def _stop(*args):
     '''Stop and clean up on SystemExit, KeyboardInterrupt, RuntimeError
     '''
-    global monitor, trigger, r
-    monitor.success('Closing threads')
-    for thread in trigger:
-        thread.stop()
-    patch.publish('PROCESSTRIGGER_UNBLOCK', 1)
-    for thread in trigger:
-        thread.join()
+    global monitor, patch
+    monitor.success('Closing subscriptions')
+    patch.stop()
 
 
 if __name__ == '__main__':
@@ -233,7 +233,7 @@ def _loop_once():
         if ((endsample - startsample + 1) % synchronize) == 0:
             key = "{}.synchronize".format(patch.getstring('prefix', 'synchronize'))
             patch.setvalue(key, endsample - startsample + 1)
-        dat = ft_input.getData([begsample, endsample]).astype(np.float64)
+        dat = ft_input.getData([begsample, endsample], dtype=np.float64)
         monitor.info("Writing sample " + str(begsample) + " to " + str(endsample) + " as " + str(np.shape(dat)))
         if fileformat == 'edf':
             # the scaling is done in the EDF writer
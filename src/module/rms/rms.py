@@ -137,8 +137,7 @@ def _loop_once():
     # get the most recent data segment
     begsample = hdr_input.nSamples - window
     endsample = hdr_input.nSamples - 1
-    dat = ft_input.getData([begsample, endsample]).astype(np.double)
-    dat = dat[:, chanindx]
+    dat = ft_input.getData([begsample, endsample], dtype=np.double, channels=chanindx)
 
     rms = [0.] * len(chanindx)
     for i, chanvec in enumerate(dat.transpose()):
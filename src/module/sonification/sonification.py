@@ -243,7 +243,7 @@ def _loop_once():
             raise RuntimeError("timeout while waiting for data")
 
     # get the input data
-    dat_input = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat_input = ft_input.getData([begsample, endsample], dtype=np.double)
     dat_output = np.zeros((nOutput,hdr_output.nChannels))
 
     # construct a time vector for input and output
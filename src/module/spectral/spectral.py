@@ -117,7 +117,7 @@ def _loop_once():
     '''
     global patch, name, path, monitor
     global ft_host, ft_port, ft_input, timeout, hdr_input, start, channel_items, channame, chanindx, item, prefix, output, begsample, endsample
-    global scale_window, offset_window, window, taper, frequency, band_items, bandname, bandlo, bandhi, lohi, dat, power, chan, band, meandat, sample, F, i, lo, hi, count, key
+    global scale_window, offset_window, window, taper, frequency, band_items, bandname, bandlo, bandhi, lohi, dat, power, chan, band, meandat, sample, F, i, lo, hi, count, key, keyval
 
     scale_window = patch.getfloat('scale', 'window', default=1.)
     offset_window = patch.getfloat('offset', 'window', default=0.)
@@ -154,8 +154,7 @@ def _loop_once():
     # get the most recent data segment
     begsample = hdr_input.nSamples - window
     endsample = hdr_input.nSamples - 1
-    dat = ft_input.getData([begsample, endsample]).astype(np.double)
-    dat = dat[:, chanindx]
+    dat = ft_input.getData([begsample, endsample], dtype=np.double, channels=chanindx)
 
     # demean the data to prevent spectral leakage
     dat = detrend(dat, axis=0, type='constant')
@@ -184,12 +183,15 @@ def _loop_once():
     
     monitor.debug(np.around(value))
 
+    # the values are all sent at once
+    keyval = {}
     i = 0
     for band in bandname:
         for chan in channame:
             key = "%s.%s.%s" % (prefix, chan, band)
-            patch.setvalue(key, value[i])
+            keyval[key] = value[i]
             i+=1
+    patch.setvalues(keyval)
 
 
 def _loop_forever():
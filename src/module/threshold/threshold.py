@@ -148,7 +148,7 @@ def _loop_once():
             raise RuntimeError("timeout while waiting for data")
 
     # get the input data
-    dat_input = ft_input.getData([begsample, endsample]).astype(np.double)
+    dat_input = ft_input.getData([begsample, endsample], dtype=np.double)
 
     monitor.debug("read from sample %d to %d" % (begsample, endsample))
 